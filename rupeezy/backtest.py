@@ -0,0 +1,205 @@
+# Vectorized backtester for the default-buy + additional-quantity ladder strategy.
+# Replays daily or intraday bars for the whole instrument universe through the same decisions the
+# live jobs make each day:
+#   1. eligibility (beest_eligibility_and_price_check.py): an ineligible stock loses its BaseValue and
+#      FirstDayProcessed, an eligible one is marked FirstDayProcessed;
+#   2. default buy (main.py): every eligible stock with DefaultQuantity > 0 buys it at the first check
+#      of the day, and the fill sets BaseValue when none is set;
+#   3. price drop (price_drop.py): at every check, an eligible stock with a BaseValue buys
+#      AdditionalQuantity times the number of ladder levels crossed (so gap-downs buy every missed
+#      level) if the funds allow it, and the fill becomes the new BaseValue.
+# State is held as (scenarios x instruments) arrays, so one pass over time evaluates every instrument
+# and every ladder parameter set at once. Orders fill at the check price.
+#
+# Run `python rupeezy/backtest.py CANDLE_DIR` on a directory of <SYMBOL>.csv daily candles
+# (date, open, close). --levels and --step take comma-separated values to sweep.
+
+import os
+import logging
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from ladder import LADDER_LEVELS, LADDER_STEP_PERCENT, trigger_prices
+
+# Starting funds when none are given
+DEFAULT_CAPITAL = 1000000.0
+
+
+# Function to apply the funds check to a round of orders, in instrument order
+def allocate_funds(costs, funds):
+    """Return the (scenarios x instruments) mask of orders that fit the funds.
+
+    Like the order loop in price_drop.py, orders are taken in turn and one that does not fit is
+    skipped while cheaper ones after it may still go through. The cumulative sum decides everything
+    up to the first order that does not fit; only the rest is walked one by one.
+    """
+    wanted = costs > 0
+    cumulative = np.cumsum(costs, axis=1)
+    accepted = wanted & (cumulative <= funds[:, None])
+    for scenario in np.nonzero(cumulative[:, -1] > funds)[0] if costs.shape[1] else []:
+        first_miss = np.argmax(cumulative[scenario] > funds[scenario])
+        remaining = funds[scenario] - (cumulative[scenario, first_miss - 1] if first_miss else 0.0)
+        for index in np.nonzero(wanted[scenario, first_miss:])[0] + first_miss:
+            if costs[scenario, index] <= remaining:
+                accepted[scenario, index] = True
+                remaining -= costs[scenario, index]
+    return accepted
+
+
+# Function to run the strategy over a price history
+def run_backtest(prices, eligible, default_quantity, additional_quantity, capital=DEFAULT_CAPITAL,
+                 levels=LADDER_LEVELS, step=LADDER_STEP_PERCENT, record_fills=False):
+    """Backtest one or many ladder parameter sets.
+
+    prices: (days x checks x instruments) or (days x instruments) array of check prices, NaN when
+    there is no price. eligible: (days x instruments) booleans known before the day's first check.
+    levels and step may be scalars or equal-length sequences, one entry per scenario.
+
+    Returns a dict of per-scenario arrays: shares, cost, default_fills, additional_fills (scenarios x
+    instruments), funds_left and capital_used (scenarios), plus the fills list when record_fills is set
+    as (day, check, scenario, instrument, kind, quantity, price) tuples.
+    """
+    prices = np.asarray(prices, dtype=float)
+    if prices.ndim == 2:
+        prices = prices[:, None, :]
+    eligible = np.asarray(eligible, dtype=bool)
+    default_quantity = np.asarray(default_quantity, dtype=float)
+    additional_quantity = np.asarray(additional_quantity, dtype=float)
+    levels, step = np.broadcast_arrays(np.atleast_1d(levels).astype(int), np.atleast_1d(step).astype(float))
+    scenarios, instruments = len(levels), prices.shape[2]
+    max_levels = int(levels.max())
+
+    base = np.full((scenarios, instruments), np.nan)
+    shares = np.zeros((scenarios, instruments))
+    cost = np.zeros((scenarios, instruments))
+    default_fills = np.zeros((scenarios, instruments), dtype=np.int64)
+    additional_fills = np.zeros((scenarios, instruments), dtype=np.int64)
+    funds = np.full(scenarios, float(capital))
+    fills = []
+
+    def fill(day, check, kind, accepted, quantity, price):
+        order_cost = np.where(accepted, quantity * price, 0.0)
+        shares[...] += np.where(accepted, quantity, 0.0)
+        cost[...] += order_cost
+        funds[...] -= order_cost.sum(axis=1)
+        if record_fills:
+            for scenario, index in zip(*np.nonzero(accepted)):
+                fills.append((day, check, int(scenario), int(index), kind,
+                              float(np.broadcast_to(quantity, accepted.shape)[scenario, index]), float(price[index])))
+
+    for day in range(prices.shape[0]):
+        # Eligibility update: ineligible stocks lose their BaseValue (FirstDayProcessed follows eligibility)
+        is_eligible = eligible[day]
+        base[:, ~is_eligible] = np.nan
+
+        # Default buy at the first check of the day
+        price = prices[day, 0]
+        wants_default = is_eligible & (default_quantity > 0) & ~np.isnan(price)
+        accepted = allocate_funds(np.broadcast_to(np.where(wants_default, price * default_quantity, 0.0),
+                                                  (scenarios, instruments)), funds)
+        fill(day, 0, 'default', accepted, default_quantity, price)
+        default_fills += accepted
+        base = np.where(accepted & ~(base > 0), price, base)
+
+        # Price-drop checks: buy AdditionalQuantity for every ladder level crossed since BaseValue
+        for check in range(prices.shape[1]):
+            price = prices[day, check]
+            ready = is_eligible & (additional_quantity > 0) & ~np.isnan(price) & (base > 0)
+            if not ready.any():
+                continue
+            crossed = np.zeros((scenarios, instruments), dtype=np.int64)
+            with np.errstate(invalid='ignore'):
+                for level in range(1, max_levels + 1):
+                    reached = trigger_prices(base, level, step[:, None]) >= price
+                    crossed += reached & (level <= levels)[:, None]
+            multiplier = np.where(ready, crossed, 0)
+            quantity = multiplier * additional_quantity
+            accepted = allocate_funds(np.where(multiplier > 0, quantity * price, 0.0), funds)
+            fill(day, check, 'additional', accepted, quantity, price)
+            additional_fills += accepted
+            base = np.where(accepted, price, base)
+
+    return {
+        'levels': levels,
+        'step': step,
+        'shares': shares,
+        'cost': cost,
+        'default_fills': default_fills,
+        'additional_fills': additional_fills,
+        'funds_left': funds,
+        'capital_used': float(capital) - funds,
+        'fills': fills
+    }
+
+
+# Function to run the backtest over every combination of ladder parameters
+def sweep(prices, eligible, default_quantity, additional_quantity, levels_grid, step_grid, capital=DEFAULT_CAPITAL):
+    combinations = list(itertools.product(levels_grid, step_grid))
+    return run_backtest(prices, eligible, default_quantity, additional_quantity, capital,
+                        levels=[combination[0] for combination in combinations],
+                        step=[combination[1] for combination in combinations])
+
+
+# Function to summarise a backtest result per scenario
+def summarize(result):
+    """Return one row per scenario with fill counts, capital used and the average cost per share."""
+    rows = []
+    for scenario in range(len(result['levels'])):
+        shares = result['shares'][scenario].sum()
+        rows.append({
+            'levels': int(result['levels'][scenario]),
+            'step': float(result['step'][scenario]),
+            'default_fills': int(result['default_fills'][scenario].sum()),
+            'additional_fills': int(result['additional_fills'][scenario].sum()),
+            'shares': float(shares),
+            'capital_used': round(float(result['capital_used'][scenario]), 2),
+            'average_cost': round(float(result['cost'][scenario].sum() / shares), 2) if shares else None
+        })
+    return pd.DataFrame(rows)
+
+
+# Function to load the check prices and closes from a directory of <SYMBOL>.csv daily candles
+def load_price_checks(candle_dir, columns=('open', 'close')):
+    """Return (dates, symbols, prices, closes): prices is (days x len(columns) x instruments)."""
+    frames = {}
+    for file_name in sorted(os.listdir(candle_dir)):
+        symbol, extension = os.path.splitext(file_name)
+        if extension.lower() != '.csv':
+            continue
+        frame = pd.read_csv(os.path.join(candle_dir, file_name), parse_dates=['date'])
+        frames[symbol] = frame.set_index('date')
+    symbols = sorted(frames)
+    by_column = {column: pd.DataFrame({symbol: frames[symbol][column] for symbol in symbols if column in frames[symbol]})
+                 .reindex(columns=symbols).sort_index() for column in set(columns) | {'close'}}
+    dates = by_column['close'].index
+    prices = np.stack([by_column[column].reindex(dates).to_numpy() for column in columns], axis=1)
+    return dates, symbols, prices, by_column['close']
+
+
+# Backtest CLI
+if __name__ == "__main__":
+    from indicators import eligibility_history
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Backtest the default-buy and price-drop ladder strategy.")
+    parser.add_argument('candle_dir')
+    parser.add_argument('--capital', type=float, default=DEFAULT_CAPITAL)
+    parser.add_argument('--default-quantity', type=float, default=1)
+    parser.add_argument('--additional-quantity', type=float, default=1)
+    parser.add_argument('--levels', default=str(LADDER_LEVELS), help="Comma-separated ladder level counts")
+    parser.add_argument('--step', default=str(LADDER_STEP_PERCENT), help="Comma-separated ladder steps in percent")
+    parser.add_argument('--checks', default='open,close', help="Candle columns used as the day's price checks")
+    args = parser.parse_args()
+
+    dates, symbols, prices, closes = load_price_checks(args.candle_dir, args.checks.split(','))
+    # The eligibility job runs before the open, on the previous day's candles
+    eligible = eligibility_history(closes).shift(1, fill_value=False).to_numpy()
+    quantities = np.ones(len(symbols))
+
+    result = sweep(prices, eligible, quantities * args.default_quantity, quantities * args.additional_quantity,
+                   [int(value) for value in args.levels.split(',')], [float(value) for value in args.step.split(',')],
+                   capital=args.capital)
+    print(summarize(result).to_string(index=False))
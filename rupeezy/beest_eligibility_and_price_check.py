@@ -3,20 +3,22 @@
 # BaseValue: This script does not update the BaseValue unless the stock becomes ineligible, at which point the BaseValue is reset to null.
 # FirstDayProcessed: If a stock becomes eligible for the first time, the FirstDayProcessed flag is set to True. If the stock becomes ineligible, this flag is reset to False.
 # The script ensures that ineligible stocks have their BaseValue reset and FirstDayProcessed updated accordingly. However, it doesn’t set a new BaseValue for eligible stocks.
+# LastUpdated: Only rows whose eligibility actually changes are written (with their LastUpdated time); a single __LAST_RUN__ item records when the run last completed.
 
 # Standard library imports
 import os  # Library for interacting with the operating system (e.g., environment variables)
 import logging  # Module for logging events and debugging messages
 
 # Time and date-related imports
-from time import sleep  # Function from time module to pause the script for a specified duration
 from datetime import datetime  # Class from the datetime module to work with dates and times
+from concurrent.futures import ThreadPoolExecutor  # Thread pool used to write the change set concurrently
 
-# External libraries
-import boto3  # AWS SDK for Python to interact with AWS services (in this case, DynamoDB)
-import pytz  # Library to work with time zones in Python
-import requests  # Library to make HTTP requests (used for fetching data from Chartink API)
-from bs4 import BeautifulSoup  # Library for parsing HTML/XML (used to extract CSRF tokens from web pages)
+# Local modules
+from dynamo_scan import scan_items, DEFAULT_SCAN_SEGMENTS  # Paginated, parallel-segment table scan
+from clients import LazyClient, get_dynamodb_client, get_broker_client, get_stock_mirror  # Process-wide DynamoDB and broker clients
+from state_mirror import modified_at  # ModifiedAt stamp read by the mirror's incremental sync
+from instrumentation import run, span  # Phase timings and the JSON run summary
+from chartink import get_screener  # Pooled, cached Chartink screener client
 
 # Setup basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -25,134 +27,396 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 from dotenv import load_dotenv  # Used to load environment variables from a file
 load_dotenv()  # Loads the variables from the .env file into the script's environment
 
-# Initialize the DynamoDB client from boto3
-dynamodb = boto3.client('dynamodb', region_name='ap-south-1')
+# Shared DynamoDB client from boto3
+dynamodb = LazyClient(get_dynamodb_client)  # Built on first use
 
-# Constants for Chartink (URLs and API endpoints)
-Charting_Link = "https://chartink.com/screener/"  # URL to Chartink's website
-Charting_url = 'https://chartink.com/screener/process'  # API endpoint for Chartink data processing
 # The condition defines the criteria for fetching stock data from Chartink's screener
 condition = "( {166311} ( latest rsi(65) < latest ema(rsi(65),35) or weekly rsi(65) < weekly ema(rsi(65),35) ) )"
+# Daily-only and weekly-only variants of the condition, for comparing the two sides
+daily_condition = "( {166311} ( latest rsi(65) < latest ema(rsi(65),35) ) )"
+weekly_condition = "( {166311} ( weekly rsi(65) < weekly ema(rsi(65),35) ) )"
+# Screeners whose results are combined into the eligible set; each one is fetched concurrently,
+# e.g. {'daily': daily_condition, 'weekly': weekly_condition} or one entry per strategy
+SCREENER_CONDITIONS = {'eligibility': condition}
+
+# Where the eligible set comes from: 'chartink' (screener scrape), 'local' (indicator engine on daily candles)
+# or 'incremental' (per-instrument indicator state stored in the table, advanced by the new bars only)
+ELIGIBILITY_SOURCE = os.getenv('ELIGIBILITY_SOURCE', 'chartink')
+# Directory of <SYMBOL>.csv daily candles for the local engine; the broker history API is used when unset
+CANDLE_DIR = os.getenv('CANDLE_DIR')
+# Memory-mapped candle store (candle_store.py) for the local engines; takes precedence over CANDLE_DIR
+CANDLE_STORE_DIR = os.getenv('CANDLE_STORE_DIR')
+
+# Attributes of StockEligibility read by this script
+STOCK_ATTRIBUTES = ('InstrumentName', 'Eligibility', 'EligibilityStatus', 'FirstDayProcessed', 'BaseValue', 'Token')
+
+# Key of the single item that records when the eligibility run last completed
+LAST_RUN_MARKER_KEY = {'InstrumentName': {'S': '__LAST_RUN__'}, 'Eligibility': {'S': 'Meta'}}
+# Number of concurrent writers used to apply the change set
+WRITE_WORKERS = 8
 
 # Fetch data from Chartink based on the given condition
 def fetch_chartink_data(condition):
-    """Fetch data from Chartink based on the given condition."""
-    retries = 3  # Number of retry attempts if the request fails
-    for attempt in range(retries):  # Loop to retry fetching data
+    """Fetch data from Chartink based on the given condition (cached for CHARTINK_CACHE_TTL seconds)."""
+    return get_screener().fetch(condition)
+
+# Function to fetch every configured screener and combine their results
+def fetch_chartink_eligible_instruments(conditions=None):
+    """Return the union of the symbols returned by each screener, or None if any of them failed."""
+    results = get_screener().fetch_many(conditions or SCREENER_CONDITIONS)
+    eligible_instruments = set()
+    for name, chartink_data in results.items():
+        if not chartink_data:
+            # A partial result would mark the missing stocks ineligible
+            logging.error(f"No data fetched from Chartink for the {name} screener.")
+            return None
+        eligible_instruments |= {item['nsecode'] for item in chartink_data['data']}
+    return eligible_instruments
+
+# Function to evaluate the eligibility condition locally from daily candles
+def fetch_local_eligible_instruments(all_stocks):
+    """Evaluate the Chartink condition with the local indicator engine for every stock in the table.
+
+    Returns (eligible_instruments, loaded) where loaded holds the instruments that had candles, or None.
+    """
+    # Local RSI/EMA engine; imported here because pandas is only needed by the local sources
+    from indicators import (evaluate_eligibility, loaded_symbols, load_daily_closes_from_store,
+                            load_daily_closes_from_csv, load_daily_closes_from_broker)
+    tokens_by_symbol = {
+        stock['InstrumentName']['S'].strip(): stock['Token']['N']
+        for stock in all_stocks if 'N' in stock.get('Token', {})
+    }
+    try:
+        if CANDLE_STORE_DIR:
+            # Candles from the memory-mapped candle store
+            closes = load_daily_closes_from_store(CANDLE_STORE_DIR, symbols=set(tokens_by_symbol))
+        elif CANDLE_DIR:
+            # Candles stored locally as <SYMBOL>.csv files
+            closes = load_daily_closes_from_csv(CANDLE_DIR, symbols=set(tokens_by_symbol))
+        else:
+            # Candles from the broker's history API
+            closes = load_daily_closes_from_broker(get_broker_client(), tokens_by_symbol)
+    except Exception as e:
+        logging.error(f"Error loading candles for local eligibility: {e}")
+        return None
+
+    loaded = loaded_symbols(closes)
+    if not loaded:
+        logging.error("No candles could be loaded for local eligibility.")
+        return None
+    eligible_instruments = evaluate_eligibility(closes)
+    logging.info(f"Local indicator engine found {len(eligible_instruments)} eligible of {len(loaded)} instruments "
+                 f"({len(tokens_by_symbol) - len(loaded)} without candles left unchanged).")
+    return eligible_instruments, loaded
+
+# Function to advance every stock's stored indicator state with the bars since its last update
+def fetch_incremental_eligible_instruments(all_stocks):
+    """Update each stock's IndicatorState with its new daily bars and evaluate the condition on it.
+
+    Returns (eligible_instruments, states, failed) where states maps instrument name -> (stock, state)
+    for the states that took a new completed bar, and failed holds the instruments whose candles
+    could not be loaded.
+    """
+    from indicators import load_daily_series_from_store, load_daily_series_from_csv, load_daily_series_from_broker
+    from indicator_state import load_state, advance_state, rebuild_state, state_is_eligible, completed_closes
+    store = None
+    if CANDLE_STORE_DIR:
+        from candle_store import CandleStore
+        store = CandleStore(CANDLE_STORE_DIR)
+    client = None if CANDLE_STORE_DIR or CANDLE_DIR else get_broker_client()
+    eligible_instruments, states, failed = set(), {}, set()
+    for stock in all_stocks:
+        instrument_name = stock['InstrumentName']['S'].strip()
+        if instrument_name == LAST_RUN_MARKER_KEY['InstrumentName']['S']:
+            continue
+        state = load_state(stock.get('IndicatorState', {}).get('S'))
+        since = state['date'] if state else None
         try:
-            # Using a requests.Session to maintain a session across multiple requests
-            with requests.Session() as s:
-                # Setting the headers for the HTTP request
-                s.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-                
-                # First, make a GET request to get the CSRF token from Chartink
-                r = s.get(Charting_Link)
-                soup = BeautifulSoup(r.text, "html.parser")  # Parse the HTML page using BeautifulSoup
-                csrf_token = soup.select_one("[name='csrf-token']")['content']  # Extract the CSRF token
-                s.headers.update({'x-csrf-token': csrf_token})  # Update session headers with the CSRF token
-                
-                # POST request to the Chartink API with the stock condition
-                response = s.post(Charting_url, data={'scan_clause': condition})
-                if response.status_code == 200:  # Check if the request was successful
-                    return response.json()  # Return the response data in JSON format
+            if store is not None:
+                closes = load_daily_series_from_store(store, instrument_name, since=since)
+            elif CANDLE_DIR:
+                closes = load_daily_series_from_csv(CANDLE_DIR, instrument_name, since=since)
+            else:
+                closes = load_daily_series_from_broker(client, stock['Token']['N'], since=since)
+            closes = completed_closes(closes)  # Today's bar is still forming
+
+            if state is None:
+                # No usable state yet: full recompute from the whole history
+                state = rebuild_state(closes)
+            else:
+                # Constant work per new bar
+                for timestamp, close in closes.dropna().sort_index().items():
+                    advance_state(state, timestamp.date(), close)
         except Exception as e:
-            # Log any errors that occur during the request
-            logging.error("Exception during data fetch from Chartink: {}".format(str(e)))
-        # Sleep for 10 seconds before retrying the request
-        sleep(10)
-    logging.error("All retries to fetch data from Chartink failed")
-    return None  # Return None if the request fails after all retries
+            logging.error(f"Error updating indicator state for {instrument_name}: {e}")
+            failed.add(instrument_name)
+            continue
+
+        if state['date'] is not None and state['date'] != since:
+            states[instrument_name] = (stock, state)  # Only advanced states are written back
+        if state_is_eligible(state):
+            eligible_instruments.add(instrument_name)
+    return eligible_instruments, states, failed
+
+# Function to store an instrument's indicator state next to its StockEligibility row
+def write_indicator_state(stock, state):
+    from indicator_state import dump_state
+    instrument_name = stock['InstrumentName']['S'].strip()
+    try:
+        dynamodb.update_item(
+            TableName='StockEligibility',
+            Key={
+                'InstrumentName': {'S': instrument_name},
+                'Eligibility': {'S': stock['Eligibility']['S'].strip()}
+            },
+            UpdateExpression="SET IndicatorState = :st, ModifiedAt = :ma",
+            ExpressionAttributeValues={':st': {'S': dump_state(state)}, ':ma': {'N': str(modified_at())}}
+        )
+    except Exception as e:
+        logging.error(f"Error storing indicator state for {instrument_name}: {e}")
 
 # Function to fetch all stock records from the DynamoDB StockEligibility table
 def fetch_all_stocks_from_dynamodb():
-    """Fetch all stocks from DynamoDB StockEligibility table."""
+    """Stream all stocks from the DynamoDB StockEligibility table.
+
+    Errors are raised to the caller, also after some items were yielded: a partial universe must not be
+    diffed, or the missing stocks would look unchanged and the rest would be written against it.
+    """
+    mirror = get_stock_mirror()
+    if mirror is not None:
+        # Catch up with DynamoDB and read every row from the local mirror
+        mirror.sync()
+        yield from mirror.query()
+        return
+
+    # Scan every page of the table in parallel segments, reading only the attributes used below
+    yield from scan_items(
+        dynamodb,
+        TableName='StockEligibility',
+        attributes=STOCK_ATTRIBUTES + (('IndicatorState',) if ELIGIBILITY_SOURCE == 'incremental' else ()),
+        total_segments=DEFAULT_SCAN_SEGMENTS
+    )
+
+# Function to read the whole universe, or None if the table could not be read completely
+def load_all_stocks():
     try:
-        # Scan the entire StockEligibility table to retrieve all items (this can be optimized later)
-        response = dynamodb.scan(TableName='StockEligibility')
-        return response['Items']  # Return the list of items (stocks) from the response
+        return list(fetch_all_stocks_from_dynamodb())
     except Exception as e:
         # Log any errors that occur when interacting with DynamoDB
         logging.error(f"Error fetching items from DynamoDB: {e}")
-        return []  # Return an empty list if an error occurs
-
-# Function to update the eligibility status of stocks based on Chartink data
-def update_stock_eligibility():
-    """Update stock eligibility based on Chartink data and update DynamoDB records."""
-    # Get the current time in the Asia/Kolkata time zone
-    now = datetime.now(pytz.timezone('Asia/Kolkata'))
-    # Format the current time as a string to store in DynamoDB
-    current_time = now.strftime("%Y-%m-%dT%H:%M:%S")
+        return None
 
-    # Fetch data from Chartink
-    chartink_data = fetch_chartink_data(condition)
-    if not chartink_data:  # If no data was fetched, exit the function
-        logging.error("No data fetched from Chartink.")
-        return
-
-    # Create a set of eligible instruments based on the Chartink response
-    eligible_instruments = {item['nsecode'] for item in chartink_data['data']}
-    
-    # Fetch all stocks from the DynamoDB StockEligibility table
-    all_stocks = fetch_all_stocks_from_dynamodb()
-    
-    # Loop through each stock in the DynamoDB table
+# Function to compute which stocks need an eligibility write
+def compute_eligibility_changes(all_stocks, eligible_instruments):
+    """Compare the scanned state with the Chartink result and return only the rows that change."""
+    changes = []
     for stock in all_stocks:
         instrument_name = stock['InstrumentName']['S'].strip()  # Extract and clean the instrument name (stock ticker)
+        if instrument_name == LAST_RUN_MARKER_KEY['InstrumentName']['S']:
+            continue  # The run marker is not a stock
         is_eligible = instrument_name in eligible_instruments  # Check if the stock is in the eligible set
 
         # Set the eligibility status based on whether the stock is eligible or not
         eligibility_status = 'Eligible' if is_eligible else 'Ineligible'
 
-        # FirstDayProcessed flag logic
-        first_day_processed = stock.get('FirstDayProcessed', {'BOOL': False})['BOOL']
+        # Current state as scanned from DynamoDB
+        current_status = stock.get('EligibilityStatus', {}).get('S')
+        current_first_day = stock.get('FirstDayProcessed', {'BOOL': False}).get('BOOL', False)
+        has_base_value = 'N' in stock.get('BaseValue', {})
 
         # Handle eligible stocks, but don't set the BaseValue here
-        if is_eligible and not first_day_processed:
+        if is_eligible and not current_first_day:
             first_day_processed = True  # Mark the stock as processed on the first day of eligibility
         elif not is_eligible:
             # If the stock becomes ineligible, reset the BaseValue and FirstDayProcessed flag
-            base_value = None
             first_day_processed = False
         else:
-            # Check if BaseValue is not null, is a dictionary, and has the 'N' key; if not, skip this stock
-            base_value_attr = stock.get('BaseValue', {})
-            if isinstance(base_value_attr, dict) and 'N' in base_value_attr:
-                base_value = base_value_attr['N']  # Access BaseValue if it's valid
-            else:
+            # Skip eligible stocks whose BaseValue is null or invalid
+            if not has_base_value:
                 logging.info(f"Skipping {instrument_name} as BaseValue is invalid or missing 'N' key.")
-                continue  # Skip to the next stock if BaseValue is null or invalid
+                continue
+            first_day_processed = current_first_day
 
-        # Log the update for the stock
-        logging.info(f"Updating {instrument_name} as {eligibility_status} in DynamoDB.")
-        
-        # Update the stock's eligibility status, first day processed, and last updated time in DynamoDB
-        try:
-            update_expression = "SET EligibilityStatus = :elig, LastUpdated = :lu, FirstDayProcessed = :fd"
-            expression_attribute_values = {
-                ':elig': {'S': eligibility_status.strip()},  # Set eligibility status and ensure no extra spaces
-                ':lu': {'S': current_time},  # Set the last updated timestamp
-                ':fd': {'BOOL': first_day_processed}  # Update the FirstDayProcessed flag
-            }
+        reset_base_value = not is_eligible and has_base_value
+        if (eligibility_status == current_status and first_day_processed == current_first_day
+                and not reset_base_value):
+            continue  # Nothing changed for this stock
 
-            # Conditionally reset the BaseValue if the stock is ineligible
-            if not is_eligible:
-                update_expression += ", BaseValue = :bv"
-                expression_attribute_values[':bv'] = {'NULL': True}  # Clear the BaseValue if ineligible
-
-            dynamodb.update_item(
-                TableName='StockEligibility',  # Specify the DynamoDB table to update
-                Key={
-                    'InstrumentName': {'S': instrument_name},  # Primary key: instrument name
-                    'Eligibility': {'S': stock['Eligibility']['S'].strip()}  # Sort key: eligibility, cleaned
-                },
-                # Update expression to set the new eligibility status, BaseValue reset (if needed), and last updated timestamp
-                UpdateExpression=update_expression,
-                ExpressionAttributeValues=expression_attribute_values
-            )
-            logging.info(f"Successfully updated {instrument_name} to {eligibility_status}.")
-        except Exception as e:
-            # Log any errors that occur during the update
+        changes.append({
+            'instrument_name': instrument_name,
+            'sort_key': stock['Eligibility']['S'].strip(),
+            'eligibility_status': eligibility_status,
+            'first_day_processed': first_day_processed,
+            'reset_base_value': reset_base_value,
+            # Scanned attribute values (None if absent) that the write is conditioned on
+            'previous_status': stock.get('EligibilityStatus'),
+            'previous_first_day': stock.get('FirstDayProcessed')
+        })
+    return changes
+
+# Function to build the condition that an attribute still holds its scanned low-level value
+def unchanged_condition(attribute, previous, placeholder, expression_attribute_values):
+    if previous is None:
+        return f"attribute_not_exists({attribute})"
+    if previous.get('NULL'):
+        # A NULL value cannot be compared with '=', only its type can be checked
+        expression_attribute_values[placeholder] = {'S': 'NULL'}
+        return f"attribute_type({attribute}, {placeholder})"
+    expression_attribute_values[placeholder] = previous
+    return f"{attribute} = {placeholder}"
+
+# Function to write a single eligibility change, guarded against concurrent writers
+def write_eligibility_change(change, current_time):
+    """Apply one change set entry, only if the row still looks the way it did when it was scanned."""
+    from botocore.exceptions import ClientError  # Raised by boto3 for failed requests, including failed conditions
+    instrument_name = change['instrument_name']
+    update_expression = "SET EligibilityStatus = :elig, LastUpdated = :lu, FirstDayProcessed = :fd, ModifiedAt = :ma"
+    expression_attribute_values = {
+        ':elig': {'S': change['eligibility_status']},  # Set eligibility status
+        ':lu': {'S': current_time},  # Record when the status flipped
+        ':fd': {'BOOL': change['first_day_processed']},  # Update the FirstDayProcessed flag
+        ':ma': {'N': str(modified_at())}
+    }
+
+    # Conditionally reset the BaseValue if the stock is ineligible
+    if change['reset_base_value']:
+        update_expression += ", BaseValue = :bv"
+        expression_attribute_values[':bv'] = {'NULL': True}  # Clear the BaseValue if ineligible
+
+    # Guard against races with main.py: the row must still hold the scanned status and flag
+    conditions = [
+        unchanged_condition('EligibilityStatus', change['previous_status'], ':prev_elig', expression_attribute_values),
+        unchanged_condition('FirstDayProcessed', change['previous_first_day'], ':prev_fd', expression_attribute_values)
+    ]
+
+    try:
+        dynamodb.update_item(
+            TableName='StockEligibility',  # Specify the DynamoDB table to update
+            Key={
+                'InstrumentName': {'S': instrument_name},  # Primary key: instrument name
+                'Eligibility': {'S': change['sort_key']}  # Sort key: eligibility, cleaned
+            },
+            UpdateExpression=update_expression,
+            ConditionExpression=" AND ".join(conditions),
+            ExpressionAttributeValues=expression_attribute_values
+        )
+        logging.info(f"Successfully updated {instrument_name} to {change['eligibility_status']}.")
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            logging.warning(f"{instrument_name} changed since it was scanned; leaving it for the next run.")
+        else:
             logging.error(f"Error updating {instrument_name} in DynamoDB: {e}")
+    except Exception as e:
+        # Log any errors that occur during the update
+        logging.error(f"Error updating {instrument_name} in DynamoDB: {e}")
+    return False
+
+# Function to write the change set and indicator states through the local mirror in batches
+def write_changes_through_mirror(mirror, changes, states, current_time):
+    """Queue every write on the mirror and flush them in batches; returns the number of changes written."""
+    for change in changes:
+        values = {
+            'EligibilityStatus': {'S': change['eligibility_status']},
+            'LastUpdated': {'S': current_time},
+            'FirstDayProcessed': {'BOOL': change['first_day_processed']}
+        }
+        if change['reset_base_value']:
+            values['BaseValue'] = {'NULL': True}
+        # Same guard as write_eligibility_change: the row must still hold the scanned status and flag
+        expected = {'EligibilityStatus': change['previous_status'], 'FirstDayProcessed': change['previous_first_day']}
+        mirror.update(change['instrument_name'], change['sort_key'], values, expected)
+    # Persist the advanced indicator states (incremental mode only)
+    if states:
+        from indicator_state import dump_state
+        for stock, state in states.values():
+            mirror.update(stock['InstrumentName']['S'].strip(), stock['Eligibility']['S'].strip(),
+                          {'IndicatorState': {'S': dump_state(state)}})
+    failed = {instrument_name for instrument_name, _ in mirror.flush()}
+    return sum(change['instrument_name'] not in failed for change in changes)
+
+# Function to record when the eligibility run last completed
+def update_last_run_marker(current_time, changed_count):
+    """Store a single LastUpdated marker instead of touching every row on every run."""
+    try:
+        dynamodb.update_item(
+            TableName='StockEligibility',
+            Key=LAST_RUN_MARKER_KEY,
+            UpdateExpression="SET LastUpdated = :lu, ChangedCount = :cc, ModifiedAt = :ma",
+            ExpressionAttributeValues={
+                ':lu': {'S': current_time},
+                ':cc': {'N': str(changed_count)},
+                ':ma': {'N': str(modified_at())}
+            }
+        )
+    except Exception as e:
+        logging.error(f"Error updating the last run marker in DynamoDB: {e}")
+
+# Function to update the eligibility status of stocks based on Chartink data
+@run('eligibility')
+def update_stock_eligibility():
+    """Update stock eligibility from the configured source and write only the rows that changed."""
+    import pytz  # Library to work with time zones in Python
+    # Get the current time in the Asia/Kolkata time zone
+    now = datetime.now(pytz.timezone('Asia/Kolkata'))
+    # Format the current time as a string to store in DynamoDB
+    current_time = now.strftime("%Y-%m-%dT%H:%M:%S")
+
+    states = {}
+    if ELIGIBILITY_SOURCE == 'incremental':
+        # Advance the stored per-instrument indicator state by the new bars only
+        with span('scan'):
+            all_stocks = load_all_stocks()
+        if all_stocks is None:
+            return
+        with span('indicators'):
+            eligible_instruments, states, failed = fetch_incremental_eligible_instruments(all_stocks)
+        # Never mark a stock ineligible just because its candles could not be loaded
+        all_stocks = [stock for stock in all_stocks if stock['InstrumentName']['S'].strip() not in failed]
+    elif ELIGIBILITY_SOURCE == 'local':
+        # Evaluate the condition locally; the universe is needed first to know which candles to load
+        with span('scan'):
+            all_stocks = load_all_stocks()
+        if all_stocks is None:
+            return
+        with span('indicators'):
+            local_result = fetch_local_eligible_instruments(all_stocks)
+        if local_result is None:
+            return
+        eligible_instruments, loaded = local_result
+        # Never mark a stock ineligible just because its candles could not be loaded
+        all_stocks = [stock for stock in all_stocks if stock['InstrumentName']['S'].strip() in loaded]
+    else:
+        # Fetch every configured screener from Chartink concurrently
+        with span('screener'):
+            eligible_instruments = fetch_chartink_eligible_instruments()
+        if eligible_instruments is None:  # If no data was fetched, exit the function
+            return
+        with span('scan'):
+            all_stocks = load_all_stocks()
+        if all_stocks is None:
+            return
+
+    # Diff the scanned table against the eligible set
+    changes = compute_eligibility_changes(all_stocks, eligible_instruments)
+    logging.info(f"{len(changes)} stocks changed eligibility; writing them to DynamoDB.")
+
+    with span('db_write'):
+        mirror = get_stock_mirror()
+        if mirror is not None:
+            # Write the change set through the mirror in transaction batches
+            written = write_changes_through_mirror(mirror, changes, states, current_time)
+        else:
+            # Write the change set in concurrent batches
+            written = 0
+            with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as pool:
+                for ok in pool.map(lambda change: write_eligibility_change(change, current_time), changes):
+                    written += ok
+                # Persist the advanced indicator states (incremental mode only)
+                list(pool.map(lambda entry: write_indicator_state(*entry), states.values()))
+
+        update_last_run_marker(current_time, written)
+    logging.info(f"Updated {written} of {len(changes)} changed stocks.")
 
 # Main execution block: This runs when the script is executed directly
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+# Offline benchmark suite for the Beest jobs.
+# Drives update_stock_eligibility, main.py's default-buy run and process_additional_quantity against
+# the in-memory stand-ins from fakes.py at several universe sizes and records wall time, broker and
+# DynamoDB call counts and peak Python memory for each, so performance changes can be measured
+# without credentials or real orders.
+#
+# Run `python rupeezy/benchmark.py` (defaults: 10,100,1000 instruments). --latency, --error-rate and
+# --fill-delay shape the fakes; --rate-limit routes the broker calls through the production rate
+# limiter; --mirror serves reads from and batches writes through a fresh state_mirror.StockMirror;
+# --index creates the stock_index secondary indexes on the fake table so lookups are Queries;
+# --json FILE writes the results for comparison between runs. --startup instead measures the cold
+# start of a fresh interpreter importing each job module (no clients are built, nothing is run), and
+# --planning times order_plan.plan_additional_orders alone on synthetic candidates at each size.
+# The price_drop_resting job is the first sync of the resting ladder orders; price_drop_resting_steady
+# measures a sync after the ladders are in place and their immediate fills applied.
+
+import os
+import sys
+import json
+import statistics
+import subprocess
+import logging
+import argparse
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from fakes import FakeBroker, FakeStockTable, seed_universe
+from clients import install_clients, reset_clients
+from rate_limit import RateLimitedClient
+from state_mirror import StockMirror
+import stock_index
+from instrumentation import last_run_summary
+from instruments import get_master
+from order_plan import plan_additional_orders
+from ladder import LadderBook
+
+DEFAULT_SIZES = (10, 100, 1000)
+STARTUP_MODULES = ('main', 'price_drop', 'beest_eligibility_and_price_check', 'scheduler')
+# Seconds between the start of the default_buy_warm job and the release of its prepared orders
+WARM_RELEASE_DELAY = 0.5
+# Jobs measured after another job has run a number of times first, unmeasured: job -> (job, runs)
+PRIMED_JOBS = {'price_drop_resting_steady': ('price_drop_resting', 2)}
+
+
+# Function to import the job modules with the fakes installed
+def load_jobs(broker, table, mirror=None):
+    """Install the fakes, import the scripts and point their module-level clients at the fakes."""
+    reset_clients('mirror')
+    install_clients(broker=broker, dynamodb=table, table=table.resource(), mirror=mirror)
+
+    # The scripts look their clients up lazily, so the installed fakes are used even after import
+    import beest_eligibility_and_price_check, main, price_drop
+    beest_eligibility_and_price_check.ELIGIBILITY_SOURCE = 'local'
+    beest_eligibility_and_price_check.CANDLE_DIR = None
+    return {
+        'eligibility': beest_eligibility_and_price_check.update_stock_eligibility,
+        'default_buy': main.run_default_buy,
+        # Warm-up first, orders held until WARM_RELEASE_DELAY after the start (like the pre-open run)
+        'default_buy_warm': lambda: main.run_default_buy(
+            release_at=datetime.now(timezone.utc) + timedelta(seconds=WARM_RELEASE_DELAY)),
+        'price_drop': price_drop.process_additional_quantity,
+        'price_drop_resting': price_drop.sync_resting_ladders,
+        'price_drop_resting_steady': price_drop.sync_resting_ladders
+    }
+
+
+# Function to run one job at one universe size and measure it
+def measure(job_name, size, latency=0.0, error_rate=0.0, fill_delay=0.0, rate_limit=False, mirror=False, index=False,
+            seed=0):
+    broker = FakeBroker(latency=latency, error_rate=error_rate, fill_delay=fill_delay, seed=seed)
+    table = FakeStockTable(latency=latency, error_rate=error_rate, seed=seed)
+    seed_universe(table, broker, get_master(), size, seed=seed)
+    stock_index._missing_indexes.clear()  # Every measurement starts by probing the indexes
+    if index:
+        error_rate, table.error_rate = table.error_rate, 0.0  # The migration itself is not measured
+        stock_index.migrate(table)
+        table.error_rate = error_rate
+        table.reset_calls()
+    limited = RateLimitedClient(broker) if rate_limit else None
+    stock_mirror = StockMirror(':memory:', table) if mirror else None
+    jobs = load_jobs(limited or broker, table, stock_mirror)
+    job = jobs[job_name]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        cwd = os.getcwd()
+        os.chdir(work_dir)  # The jobs write their order journal to the working directory
+        if job_name in PRIMED_JOBS:
+            primer, runs = PRIMED_JOBS[job_name]
+            for _ in range(runs):
+                jobs[primer]()
+            broker.reset_calls()
+            table.reset_calls()
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            job()
+        finally:
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            os.chdir(cwd)
+
+    return {
+        'job': job_name,
+        'instruments': size,
+        'wall_seconds': round(elapsed, 3),
+        'peak_memory_mb': round(peak / 1024 / 1024, 2),
+        'broker_calls': dict(broker.calls),
+        'dynamodb_calls': dict(table.calls),
+        'orders_placed': len(broker.placed_orders()),
+        'limiter': limited.stats() if limited else None,
+        'phases': (last_run_summary() or {}).get('phases')
+    }
+
+
+# Function to measure the cold start of importing each job module in a fresh interpreter
+def measure_startup(modules=STARTUP_MODULES, runs=5):
+    """Return module -> {min_seconds, median_seconds} of `python -c "import <module>"`, interpreter start included."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in modules:
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, '-c', f"import {module}"], cwd=script_dir, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - started)
+        results[module] = {'min_seconds': round(min(timings), 3), 'median_seconds': round(statistics.median(timings), 3)}
+        logging.warning(f"import {module}: {results[module]['median_seconds']}s median of {runs}")
+    return results
+
+
+# Function to time the order planning stage alone
+def measure_planning(size, runs=50, funds_fraction=0.5, seed=0):
+    """Return the planning time for size candidates, about a third of them triggered, with funds for
+    funds_fraction of the triggered cost so the ranking and allocation both do work."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    base_values = np.round(rng.uniform(50, 2000, size), 2)
+    additional_quantities = rng.integers(1, 4, size)
+    prices = np.round(base_values * rng.uniform(0.95, 1.02, size), 2)
+    book = LadderBook(base_values)
+    full = plan_additional_orders(base_values, additional_quantities, prices, float('inf'), book)
+    funds = full.total_cost() * funds_fraction
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        plan = plan_additional_orders(base_values, additional_quantities, prices, funds, book)
+        timings.append(time.perf_counter() - started)
+    result = {'job': 'planning', 'instruments': size, 'triggered': len(full), 'funded': len(plan),
+              'median_ms': round(statistics.median(timings) * 1000, 3), 'max_ms': round(max(timings) * 1000, 3)}
+    logging.warning(f"planning @ {size}: {result['median_ms']} ms median, {result['funded']} of {result['triggered']} funded")
+    return result
+
+
+# Function to run every job at every size
+def run_suite(sizes=DEFAULT_SIZES, jobs=('eligibility', 'default_buy', 'price_drop'), **fake_options):
+    results = []
+    for job_name in jobs:
+        for size in sizes:
+            result = measure(job_name, size, **fake_options)
+            phases = result['phases'] or {}
+            first_order = (f", first/last order {phases['time_to_first_order']['max_seconds'] * 1000:.0f}/"
+                           f"{phases['time_to_last_order']['max_seconds'] * 1000:.0f} ms"
+                           if 'time_to_first_order' in phases else "")
+            logging.warning(f"{job_name} @ {size}: {result['wall_seconds']}s, {result['peak_memory_mb']} MB, "
+                            f"broker {sum(result['broker_calls'].values())} calls, "
+                            f"DynamoDB {sum(result['dynamodb_calls'].values())} calls{first_order}")
+            results.append(result)
+    return results
+
+
+# Benchmark CLI
+if __name__ == "__main__":
+    # Keep the jobs' per-instrument logging out of the measurements
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark the Beest jobs against in-memory fakes.")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument('--jobs', default='eligibility,default_buy,price_drop')
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every fake API call")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Probability that a fake API call fails")
+    parser.add_argument('--fill-delay', type=float, default=0.0, help="Seconds before a fake order fills")
+    parser.add_argument('--rate-limit', action='store_true', help="Send broker calls through the rate limiter")
+    parser.add_argument('--mirror', action='store_true', help="Read and write the table through the SQLite mirror")
+    parser.add_argument('--index', action='store_true', help="Create the secondary indexes on the fake table first")
+    parser.add_argument('--startup', action='store_true', help="Measure the import time of the job modules instead")
+    parser.add_argument('--planning', action='store_true', help="Time the order planning stage alone instead")
+    parser.add_argument('--json', help="Write the results to this file")
+    args = parser.parse_args()
+
+    if args.startup:
+        results = measure_startup()
+    elif args.planning:
+        results = [measure_planning(int(size)) for size in args.sizes.split(',')]
+    else:
+        results = run_suite(
+            sizes=[int(size) for size in args.sizes.split(',')],
+            jobs=args.jobs.split(','),
+            latency=args.latency,
+            error_rate=args.error_rate,
+            fill_delay=args.fill_delay,
+            rate_limit=args.rate_limit,
+            mirror=args.mirror,
+            index=args.index
+        )
+    if args.json:
+        with open(args.json, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
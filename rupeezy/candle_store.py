@@ -0,0 +1,430 @@
+# Memory-mapped columnar store of OHLCV candles for the instrument universe.
+# Local indicators, gap-down checks and backtests need bar history for the symbols of
+# rupeezy_instruments_list.txt. Downloading it again or parsing one CSV per symbol on every run costs
+# seconds to minutes. CandleStore keeps one fixed-dtype file per field and resolution on disk,
+# laid out bars x instruments on a time axis shared by all instruments:
+#   <root>/<resolution>/time.i8           epoch seconds of each bar row, ascending
+#   <root>/<resolution>/<field>-<cap>.f8  (rows x cap) values, NaN where an instrument has no bar
+#   <root>/<resolution>/last-<cap>.i8     time of each instrument's last stored bar
+#   <root>/<resolution>/meta.json         committed row count, symbol -> column, file capacity
+# Each file is opened with numpy.memmap, so a date range is a contiguous block of rows. load() hands
+# back that block for the whole universe and series() one instrument's column of it, both without
+# copying. Only the pages actually read become resident.
+#
+# Ingestion is append-only: new bars extend the time axis, and each instrument only accepts bars after
+# its own last one, so re-fetching an overlapping window is harmless. Only bars whose period has ended
+# are ingested from the broker: a bar still forming (today's daily bar before the close) would never be
+# corrected once stored. Data is flushed before meta.json is replaced, so readers in other processes
+# never see a half-written append.
+#
+# Times are stored as epoch seconds. Naive dates and datetimes, on the way in (to_epoch, CSV dates) and
+# on the way out (frame(), to_ist()), are IST wall times.
+#
+# Run `python candle_store.py ingest` to fetch the master's daily bars from the broker (--csv DIR
+# imports <SYMBOL>.csv files instead, --resolution 1/5/15... stores intraday bars) and
+# `python candle_store.py info` to show what is stored.
+
+import os
+import json
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytz
+
+# Root directory of the store; unset leaves the jobs on their CSV / broker candle sources
+CANDLE_STORE_DIR = os.getenv('CANDLE_STORE_DIR')
+
+# Stored fields and their on-disk dtype
+FIELDS = {'open': 'f8', 'high': 'f8', 'low': 'f8', 'close': 'f8', 'volume': 'f8'}
+# Keys of the fields in the broker's historical_candles response
+RESPONSE_KEYS = {'open': 'o', 'high': 'h', 'low': 'l', 'close': 'c', 'volume': 'v'}
+
+# Files grow by this many bar rows and this many instrument columns at a time
+ROW_BLOCK = 256
+COLUMN_BLOCK = 512
+# Time of an instrument that has no bars yet
+NO_BAR = np.iinfo(np.int64).min
+
+# Bump when the layout changes so old stores are refused instead of misread
+STORE_VERSION = 1
+
+IST = pytz.timezone('Asia/Kolkata')
+# IST has no daylight saving time, so naive IST wall times and epoch seconds differ by a fixed offset
+IST_OFFSET = 19800
+
+# Days of history fetched for an instrument the store has no bars of yet
+DEFAULT_HISTORY_DAYS = 365
+# Concurrent history requests while ingesting (the broker client rate-limits them)
+INGEST_WORKERS = 4
+
+
+# Function to convert a date, datetime, numpy datetime64 or epoch seconds to epoch seconds
+def to_epoch(value):
+    """Naive dates and datetimes are taken as IST wall times."""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return int(value.timestamp())
+    return int(np.datetime64(value, 's').astype(np.int64)) - IST_OFFSET
+
+
+# Function to convert epoch seconds to an aware IST datetime
+def to_ist(epoch):
+    return datetime.fromtimestamp(int(epoch), IST)
+
+
+# Function to turn stored epoch seconds into a naive IST DatetimeIndex (dates only for daily bars)
+def ist_index(times, resolution='1D'):
+    import pandas as pd
+    index = pd.to_datetime(np.asarray(times, dtype=np.int64) + IST_OFFSET, unit='s')
+    return index.normalize() if resolution.endswith('D') else index
+
+
+# Function to get the length of one bar of a resolution in the broker's notation (1D, 1W, 1M, 1, 5, ...)
+def bar_seconds(resolution):
+    if resolution.endswith('D'):
+        return 86400 * int(resolution[:-1] or 1)
+    if resolution.endswith('W'):
+        return 7 * 86400 * int(resolution[:-1] or 1)
+    if resolution.endswith('M'):
+        return 31 * 86400 * int(resolution[:-1] or 1)  # Long enough that the running month is never complete
+    return 60 * int(resolution)
+
+
+def _round_up(value, block):
+    return max(block, -(-value // block) * block)
+
+
+class CandleStore:
+    """Bars x instruments memory-mapped arrays per field for one bar resolution."""
+
+    def __init__(self, root=CANDLE_STORE_DIR, resolution='1D', readonly=True):
+        if not root:
+            raise ValueError("No candle store directory given (set CANDLE_STORE_DIR).")
+        self.path = os.path.join(root, resolution)
+        self.resolution = resolution
+        self.readonly = readonly
+        self._lock = threading.RLock()
+        self._maps = {}
+        if not readonly:
+            os.makedirs(self.path, exist_ok=True)
+        self.refresh()
+
+    def _file(self, name, capacity=None):
+        if name == 'time':
+            return os.path.join(self.path, 'time.i8')
+        dtype = 'i8' if name == 'last' else FIELDS[name]
+        return os.path.join(self.path, f"{name}-{capacity or self._meta['capacity']}.{dtype}")
+
+    # Function to re-read what has been committed, e.g. to see bars another process appended
+    def refresh(self):
+        try:
+            with open(os.path.join(self.path, 'meta.json')) as meta_file:
+                meta = json.load(meta_file)
+        except FileNotFoundError:
+            if self.readonly:
+                raise
+            meta = {'version': STORE_VERSION, 'resolution': self.resolution, 'rows': 0,
+                    'allocated_rows': 0, 'capacity': 0, 'symbols': [], 'tokens': []}
+        if meta.get('version') != STORE_VERSION:
+            raise ValueError(f"Candle store {self.path} has layout version {meta.get('version')}, expected {STORE_VERSION}.")
+        with self._lock:
+            self._maps.clear()
+            self._meta = meta
+            self._columns = {symbol: column for column, symbol in enumerate(meta['symbols'])}
+            if not self.readonly and meta['capacity']:
+                # Bars of an append that never committed are not stored
+                last = self._array('last')
+                np.minimum(last, self.times()[-1] if meta['rows'] else NO_BAR, out=last)
+
+    def _write_meta(self):
+        temp_path = os.path.join(self.path, 'meta.json.tmp')
+        with open(temp_path, 'w') as meta_file:
+            json.dump(self._meta, meta_file)
+        os.replace(temp_path, os.path.join(self.path, 'meta.json'))
+
+    # Function to get the memory map of one file, opened on first use
+    def _array(self, name):
+        array = self._maps.get(name)
+        if array is None:
+            rows, capacity = self._meta['allocated_rows'], self._meta['capacity']
+            shape = {'time': (rows,), 'last': (capacity,)}.get(name, (rows, capacity))
+            dtype = 'i8' if name in ('time', 'last') else FIELDS[name]
+            if 0 in shape:
+                return np.empty(shape, dtype=dtype)
+            mode = 'r' if self.readonly else 'r+'
+            array = self._maps[name] = np.memmap(self._file(name), dtype=dtype, mode=mode, shape=shape)
+        return array
+
+    @property
+    def symbols(self):
+        return list(self._meta['symbols'])
+
+    def __len__(self):
+        return self._meta['rows']
+
+    def times(self):
+        """Return the committed time axis (epoch seconds) as a view of the memory map."""
+        return self._array('time')[:self._meta['rows']]
+
+    def column(self, symbol):
+        """Return the column index of a symbol, or None if the store has no bars of it."""
+        return self._columns.get(symbol)
+
+    def last_time(self, symbol):
+        """Return the epoch seconds of the symbol's last stored bar, or None."""
+        column = self._columns.get(symbol)
+        if column is None:
+            return None
+        last = int(self._array('last')[column])
+        return None if last == NO_BAR else last
+
+    # Function to find the rows of a date range
+    def rows_between(self, start=None, end=None):
+        """Return (first, stop) row indexes of the bars with start <= time <= end."""
+        times = self.times()
+        first = 0 if start is None else int(np.searchsorted(times, to_epoch(start), 'left'))
+        stop = len(times) if end is None else int(np.searchsorted(times, to_epoch(end), 'right'))
+        return first, max(first, stop)
+
+    # Function to read one field for the whole universe
+    def load(self, field='close', start=None, end=None):
+        """Return (times, values) for start <= time <= end.
+
+        values is a (bars x len(symbols)) view of the memory map in symbols order: nothing is copied
+        or read from disk until it is used.
+        """
+        with self._lock:
+            first, stop = self.rows_between(start, end)
+            return self.times()[first:stop], self._array(field)[first:stop, :len(self._columns)]
+
+    # Function to read one field of one instrument
+    def series(self, symbol, field='close', start=None, end=None):
+        """Return (times, values) for one symbol as views of the memory map; None if it has no bars."""
+        with self._lock:
+            column = self._columns.get(symbol)
+            if column is None:
+                return None
+            first, stop = self.rows_between(start, end)
+            return self.times()[first:stop], self._array(field)[first:stop, column]
+
+    # Function to read one field as a DataFrame for pandas-based callers (indicators, backtests)
+    def frame(self, field='close', start=None, end=None, symbols=None):
+        """Return a (dates x symbols) DataFrame; without symbols it wraps the memory map without a copy."""
+        import pandas as pd
+        times, values = self.load(field, start, end)
+        frame = pd.DataFrame(values, index=ist_index(times, self.resolution), columns=self.symbols, copy=False)
+        if symbols is not None:
+            symbols = set(symbols)
+            frame = frame[[symbol for symbol in frame.columns if symbol in symbols]]
+        return frame
+
+    # Write path
+    def _check_writable(self):
+        if self.readonly:
+            raise ValueError(f"Candle store {self.path} was opened read-only.")
+
+    def _resize(self, name, size):
+        with open(self._file(name), 'ab') as data_file:
+            data_file.truncate(size)
+
+    # Function to make room for more bar rows (in place, so readers' maps stay valid)
+    def _ensure_rows(self, rows):
+        if rows <= self._meta['allocated_rows']:
+            return
+        allocated = _round_up(rows, ROW_BLOCK)
+        for name in ('time', *FIELDS):
+            width = 1 if name == 'time' else self._meta['capacity']
+            self._resize(name, allocated * width * 8)
+        self._maps.clear()
+        self._meta['allocated_rows'] = allocated
+
+    # Function to make room for more instruments by copying every field into wider files
+    def _ensure_columns(self, columns):
+        old_capacity = self._meta['capacity']
+        if columns <= old_capacity:
+            return
+        capacity = _round_up(columns, COLUMN_BLOCK)
+        rows = self._meta['allocated_rows']
+        for name in ('last', *FIELDS):
+            dtype = 'i8' if name == 'last' else FIELDS[name]
+            shape = (capacity,) if name == 'last' else (rows, capacity)
+            if 0 in shape:
+                open(self._file(name, capacity), 'wb').close()  # No rows yet; _ensure_rows sizes it
+                continue
+            wider = np.memmap(self._file(name, capacity), dtype=dtype, mode='w+', shape=shape)
+            wider[...] = NO_BAR if name == 'last' else np.nan
+            if old_capacity:
+                wider[..., :old_capacity] = self._array(name)
+            wider.flush()
+            del wider
+        self._maps.clear()
+        self._meta['capacity'] = capacity
+        # Readers open files by the capacity in meta.json, so the wider files take effect on commit
+        self._write_meta()
+        if old_capacity:
+            for name in ('last', *FIELDS):
+                try:
+                    os.remove(self._file(name, old_capacity))
+                except OSError:
+                    pass
+
+    # Function to append bars for one instrument
+    def append(self, symbol, times, token=None, **fields):
+        """Append one instrument's bars, e.g. append('SBIN', times, close=closes); returns bars stored."""
+        return self.append_batch([(symbol, token, times, fields)])
+
+    # Function to append bars for many instruments in one commit
+    def append_batch(self, bars):
+        """Append (symbol, token, times, {field: values}) entries and return the number of bars stored.
+
+        Times are epoch seconds. Bars at or before an instrument's last stored bar are skipped. Times
+        after the last row extend the shared axis; a time inside the stored range that is not on the
+        axis cannot be inserted and is dropped, so ingest each window for all instruments in one batch.
+        """
+        self._check_writable()
+        with self._lock:
+            entries = []
+            for symbol, token, times, fields in bars:
+                times = np.asarray(times, dtype=np.int64)
+                order = np.argsort(times, kind='stable')
+                entries.append((symbol, token, times[order],
+                                {name: np.asarray(values, dtype=FIELDS[name])[order]
+                                 for name, values in fields.items() if name in FIELDS}))
+                if symbol not in self._columns:
+                    self._columns[symbol] = len(self._meta['symbols'])
+                    self._meta['symbols'].append(symbol)
+                    self._meta['tokens'].append(None if token is None else int(token))
+            self._ensure_columns(len(self._meta['symbols']))
+
+            # Extend the time axis with every new time in the batch
+            rows = self._meta['rows']
+            last_row_time = int(self.times()[-1]) if rows else NO_BAR
+            new_times = np.unique(np.concatenate([times[times > last_row_time] for _, _, times, _ in entries]
+                                                 or [np.empty(0, np.int64)]))
+            total = rows + len(new_times)
+            self._ensure_rows(total)
+            if len(new_times):
+                self._array('time')[rows:total] = new_times
+                for name in FIELDS:
+                    self._array(name)[rows:total] = np.nan  # Rows of an uncommitted append may hold old values
+            axis = self._array('time')[:total]
+
+            last = self._array('last')
+            stored = dropped = 0
+            for symbol, _, times, fields in entries:
+                column = self._columns[symbol]
+                keep = times > last[column]
+                positions = np.searchsorted(axis, times[keep])
+                on_axis = axis[np.minimum(positions, total - 1)] == times[keep] if total else np.zeros(0, bool)
+                positions = positions[on_axis]
+                for name, values in fields.items():
+                    self._array(name)[positions, column] = values[keep][on_axis]
+                if len(positions):
+                    last[column] = axis[positions[-1]]
+                stored += len(positions)
+                dropped += int((~on_axis).sum())
+            if dropped:
+                logging.warning(f"Dropped {dropped} bars whose times fall inside the stored range but not on its axis.")
+
+            # Make the bars durable before publishing the new row count
+            for array in self._maps.values():
+                array.flush()
+            self._meta['rows'] = total
+            self._write_meta()
+            return stored
+
+    def close(self):
+        with self._lock:
+            for array in self._maps.values():
+                if isinstance(array, np.memmap) and not self.readonly:
+                    array.flush()
+            self._maps.clear()
+
+
+# Function to fetch the completed bars since each instrument's last stored one from the broker
+def ingest_from_broker(store, client, tokens_by_symbol, days=DEFAULT_HISTORY_DAYS, exchange=None,
+                       workers=INGEST_WORKERS):
+    """Fetch history for symbol -> token pairs and append it in one batch; returns the bars stored.
+
+    Bars whose period has not ended yet (e.g. today's daily bar) are left for a later ingest.
+    """
+    from vortex_api import Constants as Vc  # The SDK only accepts its own enums here
+    exchange = exchange or Vc.ExchangeTypes.NSE_EQUITY
+    resolution = Vc.Resolutions(store.resolution)
+    now = datetime.now(IST)
+    if store.resolution.endswith('D'):
+        completed_before = to_epoch(now.date())  # Daily bars are complete once their date has passed
+    else:
+        completed_before = int(now.timestamp()) - bar_seconds(store.resolution) + 1
+
+    def fetch(symbol):
+        last = store.last_time(symbol)
+        start = to_ist(last + 1) if last is not None else now - timedelta(days=days)
+        try:
+            response = client.historical_candles(exchange, int(tokens_by_symbol[symbol]), now, start, resolution)
+            if response.get('s') != 'ok':
+                raise ValueError(f"No candle data: {response}")
+        except Exception as e:
+            logging.error(f"Error fetching candles for {symbol}: {str(e)}")
+            return None
+        times = np.asarray(response['t'], dtype=np.int64)
+        complete = times < completed_before
+        fields = {name: np.asarray(response[key], dtype=FIELDS[name])[complete]
+                  for name, key in RESPONSE_KEYS.items() if key in response}
+        return symbol, tokens_by_symbol[symbol], times[complete], fields
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        bars = [entry for entry in pool.map(fetch, tokens_by_symbol) if entry is not None]
+    return store.append_batch(bars)
+
+
+# Function to import a directory of <SYMBOL>.csv daily candles (date, open, high, low, close, volume)
+def ingest_from_csv(store, candle_dir, symbols=None):
+    import pandas as pd
+    bars = []
+    for file_name in sorted(os.listdir(candle_dir)):
+        symbol, extension = os.path.splitext(file_name)
+        if extension.lower() != '.csv' or (symbols is not None and symbol not in symbols):
+            continue
+        frame = pd.read_csv(os.path.join(candle_dir, file_name), parse_dates=['date'])
+        times = frame['date'].to_numpy(dtype='datetime64[s]').astype(np.int64) - IST_OFFSET  # Dates are IST
+        bars.append((symbol, None, times, {name: frame[name].to_numpy() for name in FIELDS if name in frame}))
+    return store.append_batch(bars)
+
+
+# Candle store CLI
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Maintain the memory-mapped candle store.")
+    parser.add_argument('command', choices=('ingest', 'info'))
+    parser.add_argument('--root', default=CANDLE_STORE_DIR or 'candle_store', help="Store directory (CANDLE_STORE_DIR)")
+    parser.add_argument('--resolution', default='1D', help="Bar resolution in the broker's notation (1D, 1, 5, ...)")
+    parser.add_argument('--days', type=int, default=DEFAULT_HISTORY_DAYS, help="History fetched for new instruments")
+    parser.add_argument('--csv', help="Import <SYMBOL>.csv daily candles from this directory instead of the broker")
+    parser.add_argument('--symbols', help="Comma-separated symbols (default: the whole instrument master)")
+    args = parser.parse_args()
+
+    symbols = set(args.symbols.split(',')) if args.symbols else None
+    if args.command == 'ingest':
+        store = CandleStore(args.root, args.resolution, readonly=False)
+        if args.csv:
+            stored = ingest_from_csv(store, args.csv, symbols)
+        else:
+            from instruments import get_master
+            from clients import get_broker_client
+            master = get_master()
+            tokens_by_symbol = {symbol: token for token, _, symbol, _, _ in master.rows()
+                                if symbols is None or symbol in symbols}
+            stored = ingest_from_broker(store, get_broker_client(), tokens_by_symbol, days=args.days)
+        logging.info(f"Stored {stored} bars; the store now has {len(store)} rows for {len(store.symbols)} instruments.")
+        store.close()
+    else:
+        store = CandleStore(args.root, args.resolution)
+        times = store.times()
+        span_text = f"{to_ist(times[0]).isoformat()} to {to_ist(times[-1]).isoformat()}" if len(times) else "no bars"
+        print(f"{store.path}: {len(store)} rows ({span_text}), {len(store.symbols)} instruments")
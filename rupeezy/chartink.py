@@ -0,0 +1,160 @@
+# Chartink screener client.
+# fetch_chartink_data used to open a new session, GET the screener page and parse it with
+# BeautifulSoup for the CSRF token on every attempt, and could only run one condition at a time.
+# ScreenerClient keeps one pooled session and reuses the CSRF token until Chartink rejects it, caches
+# each result per condition hash for CHARTINK_CACHE_TTL seconds, and runs several scan clauses
+# concurrently with fetch_many, so every screener costs one round trip and repeated runs in the same
+# window cost none.
+#
+# CHARTINK_CACHE_DIR also keeps the results on disk, so separate processes (cron runs) share them.
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Chartink URLs
+SCREENER_URL = "https://chartink.com/screener/"
+PROCESS_URL = "https://chartink.com/screener/process"
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+              'Chrome/58.0.3029.110 Safari/537.3')
+
+# Seconds a screener result is served from the cache
+CHARTINK_CACHE_TTL = float(os.getenv('CHARTINK_CACHE_TTL', 300))
+# Optional directory for the on-disk copy of the cache
+CHARTINK_CACHE_DIR = os.getenv('CHARTINK_CACHE_DIR')
+
+# Status codes with which Chartink rejects a stale CSRF token or session
+CSRF_REJECTED = {401, 403, 419}
+# Retry schedule for failed fetches
+RETRIES = 3
+RETRY_DELAY = 10
+# Concurrent screener requests in fetch_many
+MAX_WORKERS = 4
+
+
+# Function to derive the cache key of a scan clause
+def condition_hash(condition):
+    return hashlib.sha1(' '.join(condition.split()).encode()).hexdigest()
+
+
+class ScreenerClient:
+    """Chartink client with a pooled session, a reused CSRF token and a TTL cache per condition."""
+
+    def __init__(self, ttl=CHARTINK_CACHE_TTL, cache_dir=CHARTINK_CACHE_DIR, retries=RETRIES, retry_delay=RETRY_DELAY):
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.retries = retries
+        self.retry_delay = retry_delay
+        import requests
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        self.csrf_token = None
+        self._cache = {}  # condition hash -> (fetched_at, result)
+        self._lock = threading.Lock()
+        self._key_locks = {}  # One in-flight request per condition
+
+    # Function to get the CSRF token, fetching the screener page only when there is none yet
+    def _csrf(self, refresh=False):
+        with self._lock:
+            if self.csrf_token is None or refresh:
+                page = self.session.get(SCREENER_URL)
+                page.raise_for_status()
+                from bs4 import BeautifulSoup
+                soup = BeautifulSoup(page.text, "html.parser")
+                self.csrf_token = soup.select_one("[name='csrf-token']")['content']
+            return self.csrf_token
+
+    def _post(self, condition):
+        response = None
+        for refresh in (False, True):
+            token = self._csrf(refresh)
+            response = self.session.post(PROCESS_URL, data={'scan_clause': condition},
+                                         headers={'x-csrf-token': token})
+            if response.status_code not in CSRF_REJECTED:
+                break
+            logging.info("Chartink rejected the CSRF token; fetching a new one.")
+        response.raise_for_status()
+        return response.json()
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json") if self.cache_dir else None
+
+    # Function to read a cached result that is still within the TTL
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None and self.cache_dir:
+            try:
+                with open(self._cache_path(key)) as cache_file:
+                    entry = tuple(json.load(cache_file))
+                self._cache[key] = entry
+            except (OSError, ValueError):
+                return None
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def _store(self, key, result):
+        entry = (time.time(), result)
+        self._cache[key] = entry
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                temp_path = f"{self._cache_path(key)}.tmp"
+                with open(temp_path, 'w') as cache_file:
+                    json.dump(entry, cache_file)
+                os.replace(temp_path, self._cache_path(key))
+            except OSError as e:
+                logging.warning(f"Could not write the Chartink cache: {e}")
+
+    # Function to fetch the screener result for one scan clause
+    def fetch(self, condition, force=False):
+        """Return the screener response for condition, from the cache when fresh; None if every retry fails."""
+        key = condition_hash(condition)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            result = None if force else self._cached(key)
+            if result is not None:
+                logging.info(f"Chartink result for {key[:8]} served from the cache.")
+                return result
+            for attempt in range(self.retries):
+                try:
+                    result = self._post(condition)
+                    self._store(key, result)
+                    return result
+                except Exception as e:
+                    logging.error(f"Exception during data fetch from Chartink: {e}")
+                    self.csrf_token = None  # Start the next attempt with a fresh token
+                if attempt < self.retries - 1:
+                    time.sleep(self.retry_delay)
+            logging.error("All retries to fetch data from Chartink failed")
+            return None
+
+    # Function to fetch several screeners concurrently
+    def fetch_many(self, conditions, max_workers=MAX_WORKERS, force=False):
+        """Return name -> screener response (None on failure) for a dict of name -> scan clause."""
+        names = list(conditions)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(names)))) as pool:
+            results = pool.map(lambda name: self.fetch(conditions[name], force), names)
+            return dict(zip(names, results))
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_screener = None
+_screener_lock = threading.Lock()
+
+
+# Function to get the process-wide screener client
+def get_screener():
+    global _screener
+    with _screener_lock:
+        if _screener is None:
+            _screener = ScreenerClient()
+        return _screener
@@ -0,0 +1,162 @@
+# Shared broker and DynamoDB clients.
+# Every script used to build its own AsthaTradeVortexAPI and boto3 client at import time. These
+# helpers build each client once per process and hand the same instance to every caller, so the
+# scheduler daemon can run all jobs on one set of connections. The broker client is wrapped in
+# rate_limit.RateLimitedClient, so every broker call is rate limited and retried in one place.
+# Nothing is built (and boto3 / vortex_api are not imported) until a client is first used; the
+# scripts hold LazyClient stand-ins, so importing them is cheap and has no side effects.
+#
+# The broker SDK sends every call with requests.request(), i.e. a new TLS connection per order.
+# get_broker_client points the SDK at one keep-alive session instead, and warm_broker_connections
+# opens those connections ahead of a time-critical batch (see main.run_default_buy).
+
+import os
+import sys
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limit import RateLimitedClient
+from login import get_access_token, refresh_access_token
+from state_mirror import StockMirror, STOCK_MIRROR_PATH
+from instrumentation import InstrumentedClient
+
+# AWS region and table used by all scripts
+AWS_REGION = 'ap-south-1'
+STOCK_TABLE_NAME = 'StockEligibility'
+# Keep-alive connections held open to the broker (at least the order engine's worker count)
+BROKER_HTTP_POOL_SIZE = 10
+
+_lock = threading.Lock()
+_clients = {}
+
+
+# Function to build a client once and return the cached instance afterwards
+def _shared(name, factory):
+    with _lock:
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+
+class LazyClient:
+    """Stand-in for a shared client that looks it up through factory on every use, so the client is
+    only built when first needed and clients installed later (install_clients) are picked up."""
+
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+
+    def __getattr__(self, name):
+        return getattr(self._factory(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._factory(), name, value)
+
+
+class _PooledRequests:
+    """Stand-in for the requests module inside the broker SDK whose request() uses one keep-alive Session."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def __getattr__(self, name):
+        import requests
+        return getattr(requests, name)
+
+
+# Function to send the broker SDK's HTTP calls over a pooled keep-alive session
+def _pool_broker_http(client):
+    import requests
+    module = sys.modules.get(type(client).__module__)
+    if module is None or getattr(module, 'requests', None) is not requests:
+        return  # Not an SDK module that calls requests directly (or already pooled)
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=BROKER_HTTP_POOL_SIZE))
+    module.requests = _PooledRequests(session)
+
+
+# Function to get the shared broker API client
+def get_broker_client():
+    """Return the process-wide broker client, authenticated with the cached access token (see login.py)."""
+    def build():
+        missing = [name for name in ('RUPEEZY_API_KEY', 'RUPEEZY_APPLICATION_ID') if not os.getenv(name)]
+        if missing:
+            raise RuntimeError(f"API credentials are missing: {', '.join(missing)}")
+        from vortex_api import AsthaTradeVortexAPI
+        client = AsthaTradeVortexAPI(os.getenv('RUPEEZY_API_KEY'), os.getenv('RUPEEZY_APPLICATION_ID'))
+        client.access_token = get_access_token()
+        _pool_broker_http(client)
+        return RateLimitedClient(client, on_auth_failure=refresh_access_token)
+    return _shared('broker', build)
+
+
+# Function to get the shared low-level DynamoDB client
+def get_dynamodb_client():
+    def build():
+        import boto3
+        return InstrumentedClient(boto3.client('dynamodb', region_name=AWS_REGION), 'dynamodb')
+    return _shared('dynamodb', build)
+
+
+# Function to get the shared StockEligibility table resource
+def get_stock_table():
+    def build():
+        import boto3
+        return InstrumentedClient(boto3.resource('dynamodb', region_name=AWS_REGION).Table(STOCK_TABLE_NAME), 'dynamodb')
+    return _shared('table', build)
+
+
+# Function to get the shared SQLite mirror of StockEligibility, or None when it is not enabled
+def get_stock_mirror():
+    """Return the process-wide StockMirror (see state_mirror.py) if STOCK_MIRROR_PATH is set or one was installed."""
+    with _lock:
+        if 'mirror' in _clients:
+            return _clients['mirror']
+    if not STOCK_MIRROR_PATH:
+        return None
+    return _shared('mirror', lambda: StockMirror(STOCK_MIRROR_PATH, get_dynamodb_client()))
+
+
+# Function to replace the shared clients, e.g. with the stand-ins from fakes.py
+def install_clients(broker=None, dynamodb=None, table=None, mirror=None):
+    """Make get_*_client() return the given objects from now on, also for scripts already imported."""
+    with _lock:
+        for name, client in (('broker', broker), ('dynamodb', dynamodb), ('table', table), ('mirror', mirror)):
+            if client is not None:
+                _clients[name] = client
+
+
+# Function to drop shared clients so the next get_*() call builds them again
+def reset_clients(*names):
+    with _lock:
+        for name in names or list(_clients):
+            _clients.pop(name, None)
+
+
+# Function to install a new access token on the shared broker client
+def set_access_token(access_token):
+    """Store a freshly issued token in the environment and on the shared client."""
+    os.environ['RUPEEZY_ACCESS_TOKEN'] = access_token
+    with _lock:
+        client = _clients.get('broker')
+    if client is not None:
+        client.access_token = access_token
+
+
+# Function to get the broker ready before a time-critical batch of orders
+def warm_broker_connections(connections=BROKER_HTTP_POOL_SIZE):
+    """Validate the access token with one authenticated call (a rejected token is refreshed by the client),
+    then open `connections` keep-alive connections with concurrent calls. Returns False if the broker
+    could not be reached."""
+    client = get_broker_client()
+    try:
+        client.funds()
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            list(pool.map(lambda _: client.funds(), range(connections - 1)))
+        return True
+    except Exception as e:
+        logging.error(f"Error warming up the broker connection: {str(e)}")
+        return False
@@ -0,0 +1,128 @@
+# Shared DynamoDB scan helper for the StockEligibility table.
+# A single scan call returns at most 1 MB, so every caller has to follow LastEvaluatedKey or it
+# silently loses items. scan_items streams items page by page as a generator and can split the
+# table into parallel Segment/TotalSegments workers, keeping memory flat while latency scales
+# with the number of workers rather than the size of the table. query_items does the same for Query
+# calls, e.g. on the secondary indexes in stock_index.py.
+
+import logging
+import queue
+import threading
+
+# Default number of parallel scan segments
+DEFAULT_SCAN_SEGMENTS = 4
+
+# Number of pages the parallel workers may buffer ahead of the consumer
+_PREFETCH_PAGES = 8
+
+# Marker a segment worker puts on the queue when it has finished
+_DONE = object()
+
+
+# Function to build ProjectionExpression arguments for a list of attribute names
+def projection(*attribute_names):
+    """Return scan keyword arguments projecting only the given attributes.
+
+    Placeholders are used for every name so reserved words (e.g. Token) are safe.
+    """
+    names = {f"#p{i}": name for i, name in enumerate(attribute_names)}
+    return {
+        'ProjectionExpression': ", ".join(names),
+        'ExpressionAttributeNames': names
+    }
+
+
+# Function to merge projection arguments into existing scan arguments
+def _merge_scan_kwargs(scan_kwargs, attributes):
+    kwargs = dict(scan_kwargs)
+    if attributes:
+        projected = projection(*attributes)
+        kwargs['ProjectionExpression'] = projected['ProjectionExpression']
+        kwargs['ExpressionAttributeNames'] = {**kwargs.get('ExpressionAttributeNames', {}),
+                                              **projected['ExpressionAttributeNames']}
+    return kwargs
+
+
+# Function to yield the pages of one scan segment, following LastEvaluatedKey
+def _scan_pages(table, scan_kwargs):
+    kwargs = dict(scan_kwargs)
+    while True:
+        response = table.scan(**kwargs)
+        yield response.get('Items', [])
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        kwargs['ExclusiveStartKey'] = last_key
+
+
+# Function to stream every item of a query across all pages
+def query_items(table, attributes=None, **query_kwargs):
+    """Yield all items matching the query (pass KeyConditionExpression, and IndexName for an index).
+
+    Like scan_items, table can be a boto3 client (pass TableName=...) or a Table resource.
+    """
+    kwargs = _merge_scan_kwargs(query_kwargs, attributes)
+    while True:
+        response = table.query(**kwargs)
+        yield from response.get('Items', [])
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        kwargs['ExclusiveStartKey'] = last_key
+
+
+# Function to run one segment in a worker thread and hand its pages to the consumer
+def _segment_worker(table, scan_kwargs, pages, stop):
+    try:
+        for items in _scan_pages(table, scan_kwargs):
+            if stop.is_set():
+                return
+            pages.put(items)
+    except Exception as e:
+        pages.put(e)
+    finally:
+        pages.put(_DONE)
+
+
+# Function to stream every item of a scan across all pages and segments
+def scan_items(table, attributes=None, total_segments=1, **scan_kwargs):
+    """Yield all items matching the scan, page by page.
+
+    table can be a boto3 DynamoDB client (pass TableName=...) or a boto3 Table resource; items
+    come back in whichever format that object uses. attributes limits the scan to a projection.
+    With total_segments > 1 the table is scanned by that many parallel workers. Errors from any
+    segment are re-raised in the consumer.
+    """
+    kwargs = _merge_scan_kwargs(scan_kwargs, attributes)
+
+    if total_segments <= 1:
+        for items in _scan_pages(table, kwargs):
+            yield from items
+        return
+
+    pages = queue.Queue(maxsize=_PREFETCH_PAGES)
+    stop = threading.Event()
+    workers = []
+    for segment in range(total_segments):
+        segment_kwargs = dict(kwargs, Segment=segment, TotalSegments=total_segments)
+        worker = threading.Thread(target=_segment_worker, args=(table, segment_kwargs, pages, stop), daemon=True)
+        worker.start()
+        workers.append(worker)
+
+    remaining = total_segments
+    try:
+        while remaining:
+            page = pages.get()
+            if page is _DONE:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield from page
+    finally:
+        # Unblock workers if the consumer stopped early or a segment failed
+        stop.set()
+        while remaining:
+            if pages.get() is _DONE:
+                remaining -= 1
+        logging.debug("Scan finished across %d segments.", total_segments)
@@ -0,0 +1,514 @@
+# Local stand-ins for the broker API and the StockEligibility table.
+# FakeBroker implements the AsthaTradeVortexAPI calls the scripts make and FakeStockTable the
+# DynamoDB client / Table resource calls, both in memory with configurable latency and error rate,
+# so the jobs can be measured and exercised without credentials, network or real orders. Install
+# them with clients.install_clients before the scripts are imported (see benchmark.py).
+
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+import numpy as np
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+# Broker limit on instruments per quotes request
+MAX_QUOTE_INSTRUMENTS = 1000
+# Variety of the orders that rest until the price reaches their limit (all others are market orders)
+LIMIT_VARIETY = 'RL'
+
+
+class FakeBrokerError(Exception):
+    """Injected broker failure, treated as transient by rate_limit.RateLimitedClient."""
+    retriable = True
+
+
+class FakeOrderError(Exception):
+    """Broker rejection of an order request, e.g. modifying an order that already filled."""
+
+
+class _Faults:
+    """Shared latency / error injection and call counting."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._faults_lock = threading.Lock()
+
+    def _call(self, name, error=None):
+        with self._faults_lock:
+            self.calls[name] += 1
+            failed = self._random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise (error or FakeBrokerError)(f"Injected failure in {name}")
+
+    def reset_calls(self):
+        with self._faults_lock:
+            self.calls.clear()
+
+
+class FakeBroker(_Faults):
+    """In-memory broker: quotes, market orders that fill after fill_delay, resting limit orders that fill
+    once the LTP reaches them (and can be modified or cancelled until then), funds, positions and history."""
+
+    def __init__(self, prices=None, funds=10000000.0, latency=0.0, error_rate=0.0, fill_delay=0.0,
+                 master_rows=None, seed=None):
+        super().__init__(latency, error_rate, seed)
+        self.prices = dict(prices or {})   # token -> LTP
+        self.available_funds = float(funds)
+        self.fill_delay = fill_delay
+        self.master_rows = master_rows or []
+        self.access_token = None
+        self._orders = []
+        self._lock = threading.Lock()
+
+    def quotes(self, instruments, mode=None):
+        self._call('quotes')
+        if len(instruments) > MAX_QUOTE_INSTRUMENTS:
+            raise FakeBrokerError(f"At most {MAX_QUOTE_INSTRUMENTS} instruments per quotes request")
+        data = {}
+        for key in instruments:
+            token = int(str(key).rsplit('-', 1)[-1])
+            if token in self.prices:
+                data[key] = {'last_trade_price': self.prices[token]}
+        return {'status': 'success', 'data': data}
+
+    def place_order(self, **order):
+        self._call('place_order')
+        token = int(order['token'])
+        limit = order.get('variety') == LIMIT_VARIETY
+        with self._lock:
+            order_id = f"FAKE{len(self._orders) + 1:08d}"
+            self._orders.append({
+                'order_id': order_id,
+                'token': token,
+                'quantity': order['quantity'],
+                'transaction_type': order.get('transaction_type'),
+                'variety': order.get('variety'),
+                'product': order.get('product'),
+                'limit': float(order['price']) if limit else None,
+                'status': 'OPEN' if limit else None,
+                'traded': 0,
+                'price': None if limit else self.prices.get(token, 0.0),  # Fill price
+                'placed_at': time.monotonic()
+            })
+        return {'status': 'success', 'data': {'orderId': order_id}}
+
+    # Function to fill a resting limit order once the LTP is at or below its limit (at the LTP)
+    def _match(self, order):
+        if order['status'] == 'OPEN':
+            price = self.prices.get(order['token'])
+            if price is not None and price <= order['limit']:
+                self._trade(order, order['quantity'] - order['traded'], price)
+
+    # Function to record a trade on a limit order, at the average price of everything traded so far
+    @staticmethod
+    def _trade(order, quantity, price):
+        traded = order['traded'] + quantity
+        order['price'] = ((order['price'] or 0.0) * order['traded'] + price * quantity) / traded
+        order['traded'] = traded
+        if traded >= order['quantity']:
+            order['status'] = 'EXECUTED'
+
+    def _order_view(self, order, now):
+        if order['limit'] is None:
+            filled = now - order['placed_at'] >= self.fill_delay
+            status = 'EXECUTED' if filled else 'PENDING'
+        else:
+            self._match(order)
+            status = order['status']
+        filled = status == 'EXECUTED'
+        traded = order['quantity'] if filled and order['limit'] is None else order['traded']
+        return {
+            'order_id': order['order_id'],
+            'token': order['token'],
+            'quantity': order['quantity'],
+            'transaction_type': order['transaction_type'],
+            'variety': order['variety'],
+            'product': order['product'],
+            'price': order['limit'] or 0.0,
+            'traded_quantity': traded,
+            'status': status,
+            'average_price': order['price'] if traded else 0
+        }
+
+    def orders(self, limit=20, offset=1):
+        self._call('orders')
+        now = time.monotonic()
+        with self._lock:
+            page = [self._order_view(order, now) for order in self._orders[offset - 1:offset - 1 + limit]]
+        return {'status': 'success', 'orders': page}
+
+    # Function to find an order that can still be changed
+    def _open_order(self, order_id):
+        index = int(order_id[4:]) - 1 if order_id.startswith('FAKE') else -1
+        order = self._orders[index] if 0 <= index < len(self._orders) else None
+        if order is not None:
+            self._match(order)
+        if order is None or order['status'] != 'OPEN':
+            raise FakeOrderError(f"Order {order_id} is not an open limit order")
+        return order
+
+    def modify_order(self, order_id, variety=None, quantity=None, traded_quantity=0, price=None, trigger_price=0.0,
+                     disclosed_quantity=0, validity=None):
+        self._call('modify_order')
+        with self._lock:
+            order = self._open_order(order_id)
+            order['quantity'] = quantity
+            order['limit'] = float(price)
+            self._match(order)
+        return {'status': 'success', 'data': {'orderId': order_id}}
+
+    # Function to trade part of a resting limit order at a price, e.g. to leave a part fill behind
+    def fill(self, order_id, quantity, price):
+        with self._lock:
+            order = self._open_order(order_id)
+            self._trade(order, min(quantity, order['quantity'] - order['traded']), float(price))
+
+    def cancel_order(self, order_id):
+        self._call('cancel_order')
+        with self._lock:
+            self._open_order(order_id)['status'] = 'CANCELLED'
+        return {'status': 'success', 'data': {'orderId': order_id}}
+
+    def order_history(self, order_id):
+        self._call('order_history')
+        now = time.monotonic()
+        with self._lock:
+            matches = [self._order_view(order, now) for order in self._orders if order['order_id'] == order_id]
+        return {'status': 'success', 'data': matches}
+
+    def funds(self):
+        self._call('funds')
+        return {'nse': {'net_available': self.available_funds}}
+
+    def positions(self):
+        self._call('positions')
+        return {'status': 'success', 'data': {'net': []}}
+
+    def historical_candles(self, exchange, token, to, start, resolution):
+        """Deterministic daily random walk per token, on weekdays between start and to, ending at the LTP."""
+        self._call('historical_candles')
+        days = np.arange(np.datetime64(start.date()), np.datetime64(to.date()) + 1)
+        days = days[np.is_busday(days)]
+        steps = np.cumsum(np.random.default_rng(int(token)).normal(0, 0.02, len(days)))
+        closes = self.prices.get(int(token), 100.0) * np.exp(steps - steps[-1]) if len(days) else steps
+        times = days.astype('datetime64[s]').astype(np.int64) - 19800  # Daily bars are stamped at IST midnight
+        return {'s': 'ok', 't': times.tolist(), 'c': np.round(closes, 2).tolist()}
+
+    def download_master(self):
+        self._call('download_master')
+        return self.master_rows
+
+    def placed_orders(self):
+        with self._lock:
+            return list(self._orders)
+
+
+# Function to read a low-level attribute value in a comparable form
+def _plain(value):
+    if value is None or 'NULL' in value:
+        return None
+    if 'N' in value:
+        return Decimal(value['N'])
+    if 'S' in value:
+        return value['S']
+    if 'BOOL' in value:
+        return value['BOOL']
+    return value
+
+
+class FakeStockTable(_Faults):
+    """In-memory StockEligibility table answering both the low-level client and the Table resource API.
+
+    Items are stored in the low-level {'S': ...} format. Scans and queries are paged page_size items
+    at a time, scans split by Segment/TotalSegments; update expressions support SET and REMOVE,
+    condition expressions support =, <>, <, <=, >, >=, attribute_exists, attribute_not_exists and
+    attribute_type joined with AND. Global secondary indexes are added with update_table and hold only the items
+    that have both index key attributes.
+    """
+
+    key_names = ('InstrumentName', 'Eligibility')
+
+    def __init__(self, latency=0.0, error_rate=0.0, page_size=100, seed=None):
+        super().__init__(latency, error_rate, seed)
+        self.page_size = page_size
+        self._items = {}
+        self.indexes = {}  # Index name -> (hash key, range key)
+        self._lock = threading.Lock()
+
+    def _key(self, key):
+        return tuple(key[name]['S'] for name in self.key_names)
+
+    def put(self, item):
+        """Insert or replace an item given in low-level format."""
+        with self._lock:
+            self._items[self._key(item)] = dict(item)
+
+    def items(self):
+        with self._lock:
+            return [dict(item) for item in self._items.values()]
+
+    def get(self, instrument_name, sort_key='Eligible'):
+        with self._lock:
+            item = self._items.get((instrument_name, sort_key))
+            return dict(item) if item else None
+
+    # Expression helpers
+    @staticmethod
+    def _name(token, names):
+        return names.get(token, token) if token.startswith('#') else token
+
+    def _condition(self, item, expression, names, values):
+        for clause in expression.split(' AND '):
+            clause = clause.strip().strip('()').strip()
+            if clause.startswith('attribute_not_exists(') or clause.startswith('attribute_exists('):
+                function, argument = clause.rstrip(')').split('(')
+                present = self._name(argument.strip(), names) in item
+                if present != (function == 'attribute_exists'):
+                    return False
+                continue
+            if clause.startswith('attribute_type('):
+                argument, type_value = clause[len('attribute_type('):].rstrip(')').split(',')
+                value = item.get(self._name(argument.strip(), names))
+                if value is None or values[type_value.strip()]['S'] not in value:
+                    return False
+                continue
+            left, operator, right = clause.split(None, 2)
+            actual = _plain(item.get(self._name(left, names)))
+            expected = _plain(values[right])
+            if operator == '=':
+                matched = actual == expected
+            elif operator == '<>':
+                matched = actual != expected
+            elif actual is None or expected is None:
+                matched = False
+            else:
+                matched = {'<': actual < expected, '<=': actual <= expected,
+                           '>': actual > expected, '>=': actual >= expected}[operator]
+            if not matched:
+                return False
+        return True
+
+    def _project(self, item, projection, names):
+        if not projection:
+            return dict(item)
+        wanted = [self._name(token.strip(), names) for token in projection.split(',')]
+        return {name: item[name] for name in wanted if name in item}
+
+    # Low-level client API
+    def scan(self, TableName=None, ProjectionExpression=None, FilterExpression=None,
+             ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+             ExclusiveStartKey=None, Segment=0, TotalSegments=1, Limit=None, **_):
+        self._call('scan', self._client_error('ProvisionedThroughputExceededException', 'Scan'))
+        names = ExpressionAttributeNames or {}
+        with self._lock:
+            keys = sorted(key for key in self._items if hash(key) % TotalSegments == Segment)
+            if ExclusiveStartKey is not None:
+                start = self._key(ExclusiveStartKey)
+                keys = [key for key in keys if key > start]
+            page = keys[:Limit or self.page_size]
+            evaluated = [self._items[key] for key in page]
+        items = [self._project(item, ProjectionExpression, names) for item in evaluated
+                 if not FilterExpression or self._condition(item, FilterExpression, names, ExpressionAttributeValues or {})]
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': len(page)}
+        if len(keys) > len(page):
+            response['LastEvaluatedKey'] = {name: {'S': value} for name, value in zip(self.key_names, page[-1])}
+        return response
+
+    def query(self, KeyConditionExpression, TableName=None, IndexName=None, ProjectionExpression=None,
+              FilterExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+              ExclusiveStartKey=None, Limit=None, **_):
+        self._call('query', self._client_error('ProvisionedThroughputExceededException', 'Query'))
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        if IndexName is not None and IndexName not in self.indexes:
+            raise self._client_error('ValidationException', 'Query')(
+                f"The table does not have the specified index: {IndexName}")
+        index_keys = self.indexes[IndexName] if IndexName is not None else self.key_names
+        with self._lock:
+            # Index order: range key, then the table key to break ties
+            keys = sorted((_plain(item[index_keys[1]]), key) for key, item in self._items.items()
+                          if all(name in item for name in index_keys)
+                          and self._condition(item, KeyConditionExpression, names, values))
+            if ExclusiveStartKey is not None:
+                start = (_plain(ExclusiveStartKey[index_keys[1]]), self._key(ExclusiveStartKey))
+                keys = [key for key in keys if key > start]
+            page = keys[:Limit or self.page_size]
+            evaluated = [self._items[key] for _, key in page]
+        items = [self._project(item, ProjectionExpression, names) for item in evaluated
+                 if not FilterExpression or self._condition(item, FilterExpression, names, values)]
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': len(page)}
+        if len(keys) > len(page):
+            last = evaluated[-1]
+            response['LastEvaluatedKey'] = {name: last[name] for name in set(self.key_names) | set(index_keys)}
+        return response
+
+    # Function to apply a SET / REMOVE update expression to a copy of an item
+    def _updated(self, item, expression, names, values):
+        set_part, _, remove_part = expression.strip().partition(' REMOVE ')
+        if set_part.upper().startswith('REMOVE '):
+            set_part, remove_part = '', set_part[7:]
+        elif not set_part.upper().startswith('SET '):
+            raise ValueError(f"Unsupported update expression: {expression}")
+        item = dict(item)
+        for assignment in (set_part[4:].split(',') if set_part else []):
+            name, value = (part.strip() for part in assignment.split('='))
+            item[self._name(name, names)] = values[value]
+        for name in (remove_part.split(',') if remove_part else []):
+            item.pop(self._name(name.strip(), names), None)
+        return item
+
+    def update_item(self, Key, UpdateExpression, TableName=None, ConditionExpression=None,
+                    ExpressionAttributeNames=None, ExpressionAttributeValues=None, **_):
+        self._call('update_item', self._client_error('ProvisionedThroughputExceededException', 'UpdateItem'))
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        key = self._key(Key)
+        with self._lock:
+            item = dict(self._items.get(key) or Key)
+            if ConditionExpression and not self._condition(item, ConditionExpression, names, values):
+                raise self._client_error('ConditionalCheckFailedException', 'UpdateItem')('The conditional request failed')
+            self._items[key] = self._updated(item, UpdateExpression, names, values)
+        return {}
+
+    def transact_write_items(self, TransactItems, **_):
+        """All-or-nothing Update actions; a failed condition cancels the whole transaction."""
+        self._call('transact_write_items', self._client_error('ProvisionedThroughputExceededException', 'TransactWriteItems'))
+        with self._lock:
+            updates, reasons = [], []
+            for action in TransactItems:
+                update = action['Update']
+                names = update.get('ExpressionAttributeNames') or {}
+                values = update.get('ExpressionAttributeValues') or {}
+                key = self._key(update['Key'])
+                item = dict(self._items.get(key) or update['Key'])
+                condition = update.get('ConditionExpression')
+                if condition and not self._condition(item, condition, names, values):
+                    reasons.append({'Code': 'ConditionalCheckFailed'})
+                    continue
+                reasons.append({'Code': 'None'})
+                updates.append((key, self._updated(item, update['UpdateExpression'], names, values)))
+            if len(updates) < len(TransactItems):
+                raise ClientError({'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+                                   'CancellationReasons': reasons}, 'TransactWriteItems')
+            self._items.update(updates)
+        return {}
+
+    def put_item(self, Item, TableName=None, **_):
+        self._call('put_item')
+        self.put(Item)
+        return {}
+
+    # Control-plane calls are counted but never fail
+    def _count(self, name):
+        with self._faults_lock:
+            self.calls[name] += 1
+
+    def describe_table(self, TableName=None, **_):
+        self._count('describe_table')
+        indexes = [{'IndexName': name, 'IndexStatus': 'ACTIVE',
+                    'KeySchema': [{'AttributeName': hash_key, 'KeyType': 'HASH'},
+                                  {'AttributeName': range_key, 'KeyType': 'RANGE'}]}
+                   for name, (hash_key, range_key) in self.indexes.items()]
+        table = {'TableName': TableName, 'TableStatus': 'ACTIVE',
+                 'BillingModeSummary': {'BillingMode': 'PAY_PER_REQUEST'}}
+        if indexes:
+            table['GlobalSecondaryIndexes'] = indexes
+        return {'Table': table}
+
+    def update_table(self, GlobalSecondaryIndexUpdates=(), TableName=None, **_):
+        """Create global secondary indexes; they are active (and backfilled) immediately."""
+        self._count('update_table')
+        for update in GlobalSecondaryIndexUpdates:
+            index = update['Create']
+            schema = {key['KeyType']: key['AttributeName'] for key in index['KeySchema']}
+            self.indexes[index['IndexName']] = (schema['HASH'], schema['RANGE'])
+        return self.describe_table(TableName)
+
+    @staticmethod
+    def _client_error(code, operation):
+        def build(message):
+            return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+        return build
+
+    def resource(self):
+        """Return a Table-resource view of this table (plain Python values instead of {'S': ...})."""
+        return FakeTableResource(self)
+
+
+class FakeTableResource:
+    """boto3 Table resource interface over a FakeStockTable."""
+
+    def __init__(self, table):
+        self.table = table
+        self._serializer = TypeSerializer()
+        self._deserializer = TypeDeserializer()
+
+    def _to_low(self, values):
+        return {name: self._serializer.serialize(value) for name, value in (values or {}).items()}
+
+    def _from_low(self, item):
+        return {name: self._deserializer.deserialize(value) for name, value in item.items()}
+
+    def scan(self, ExpressionAttributeValues=None, ExclusiveStartKey=None, **kwargs):
+        response = self.table.scan(
+            ExpressionAttributeValues=self._to_low(ExpressionAttributeValues),
+            ExclusiveStartKey=self._to_low(ExclusiveStartKey) if ExclusiveStartKey else None,
+            **kwargs
+        )
+        response['Items'] = [self._from_low(item) for item in response['Items']]
+        if 'LastEvaluatedKey' in response:
+            response['LastEvaluatedKey'] = self._from_low(response['LastEvaluatedKey'])
+        return response
+
+    def query(self, ExpressionAttributeValues=None, ExclusiveStartKey=None, **kwargs):
+        response = self.table.query(
+            ExpressionAttributeValues=self._to_low(ExpressionAttributeValues),
+            ExclusiveStartKey=self._to_low(ExclusiveStartKey) if ExclusiveStartKey else None,
+            **kwargs
+        )
+        response['Items'] = [self._from_low(item) for item in response['Items']]
+        if 'LastEvaluatedKey' in response:
+            response['LastEvaluatedKey'] = self._from_low(response['LastEvaluatedKey'])
+        return response
+
+    def update_item(self, Key, ExpressionAttributeValues=None, **kwargs):
+        return self.table.update_item(Key=self._to_low(Key),
+                                      ExpressionAttributeValues=self._to_low(ExpressionAttributeValues), **kwargs)
+
+    def put_item(self, Item, **kwargs):
+        return self.table.put_item(Item=self._to_low(Item), **kwargs)
+
+
+# Function to fill a fake table and broker with a synthetic universe
+def seed_universe(table, broker, master, count, seed=0):
+    """Create count StockEligibility rows for the first instruments of the master, with broker prices.
+
+    About half of the rows are eligible with a BaseValue, and their prices are spread around the
+    BaseValue so that some of them cross the additional-quantity ladder.
+    """
+    rng = random.Random(seed)
+    for index in range(min(count, len(master))):
+        token, _, symbol, _, _ = master.row(index)
+        base_value = round(rng.uniform(50, 2000), 2)
+        eligible = rng.random() < 0.5
+        item = {
+            'InstrumentName': {'S': symbol},
+            'Eligibility': {'S': 'Eligible'},
+            'EligibilityStatus': {'S': 'Eligible' if eligible else 'Ineligible'},
+            'FirstDayProcessed': {'BOOL': eligible},
+            'Token': {'N': str(token)},
+            'DefaultQuantity': {'N': str(rng.randint(0, 5))},
+            'AdditionalQuantity': {'N': str(rng.randint(0, 3))}
+        }
+        item['BaseValue'] = {'N': str(base_value)} if eligible else {'NULL': True}
+        table.put(item)
+        broker.prices[token] = round(base_value * rng.uniform(0.95, 1.02), 2)
@@ -0,0 +1,135 @@
+# Fill tracking by order book reconciliation.
+# Instead of sleeping a fixed 5-10 seconds and calling order_history once per order, the tracker
+# polls the full order book with exponential backoff until every order of the run is terminal.
+# Each poll round costs one broker call no matter how many orders are pending, and fast fills are
+# picked up on the first short poll.
+
+import logging
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+# Order statuses after which an order will not change any more
+TERMINAL_STATUSES = {'EXECUTED', 'COMPLETE', 'REJECTED', 'CANCELLED'}
+
+# Statuses that mean the order was (fully) filled
+FILLED_STATUSES = {'EXECUTED', 'COMPLETE'}
+
+# Number of orders requested per order book page
+ORDERBOOK_PAGE_SIZE = 500
+
+
+# Function to read the order ID from an order book entry
+def order_id_of(order):
+    return str(order.get('order_id') or order.get('orderId') or '')
+
+
+# Function to read the normalised status of an order book entry
+def order_status(order):
+    return str(order.get('status', '')).upper()
+
+
+# Function to read the executed average price of an order, or None if it did not fill
+def average_fill_price(order):
+    """Return the average traded price of a filled order rounded to two decimals."""
+    if order is None or order_status(order) not in FILLED_STATUSES:
+        return None
+    price = order.get('average_price') or order.get('avg_price') or order.get('traded_price')
+    if not price:
+        return None
+    return Decimal(str(price)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+# Function to read how much of an order has traded so far
+def traded_quantity(order):
+    return int(order.get('traded_quantity') or order.get('filled_quantity') or 0)
+
+
+# Function to read the average price of the part of an order that traded, or None if none did
+def average_traded_price(order):
+    """Like average_fill_price, but also for an order that traded in part before it was cancelled or expired."""
+    if order is None:
+        return None
+    if order_status(order) in FILLED_STATUSES:
+        return average_fill_price(order)
+    if traded_quantity(order) <= 0:
+        return None
+    price = order.get('average_price') or order.get('avg_price') or order.get('traded_price')
+    if not price:
+        return None
+    return Decimal(str(price)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+# Function to fetch the order book as an order_id -> order map
+def fetch_order_book(client, wanted=None, page_size=ORDERBOOK_PAGE_SIZE):
+    """Fetch the day's order book.
+
+    Pages are only followed while some of the wanted order IDs have not been seen yet, so a
+    normal run makes a single call.
+    """
+    book = {}
+    offset = 1
+    while True:
+        response = client.orders(limit=page_size, offset=offset)
+        entries = response.get('orders') or response.get('data') or []
+        for order in entries:
+            book[order_id_of(order)] = order
+
+        if len(entries) < page_size:
+            break
+        if wanted is not None and all(order_id in book for order_id in wanted):
+            break
+        offset += page_size
+    return book
+
+
+# Function to fetch one order by ID, e.g. one of an earlier day that the day's order book no longer lists
+def fetch_order(client, order_id):
+    """Return the order's latest known entry from its history, or None if it cannot be read."""
+    try:
+        entries = client.order_history(str(order_id)).get('data') or []
+    except Exception as e:
+        logging.error(f"Error fetching order {order_id}: {str(e)}")
+        return None
+    return next((order for order in entries if order_status(order) in TERMINAL_STATUSES), entries[0] if entries else None)
+
+
+# Function to poll the order book until every order is terminal
+def track_fills(client, order_ids, on_terminal=None, initial_delay=0.25, max_delay=5, timeout=60):
+    """Poll the order book with exponential backoff until all order_ids are terminal.
+
+    on_terminal(orders) is called once per poll round with the orders that became terminal in that
+    round, so callers can apply updates as fills arrive. Returns (terminal, unresolved) where
+    terminal maps order ID -> order book entry and unresolved lists the IDs still open at timeout.
+    """
+    pending = {str(order_id) for order_id in order_ids}
+    terminal = {}
+    delay = initial_delay
+    deadline = time.monotonic() + timeout
+
+    while pending:
+        time.sleep(delay)
+        try:
+            book = fetch_order_book(client, wanted=pending)
+        except Exception as e:
+            logging.error(f"Error fetching order book: {str(e)}")
+            book = {}
+
+        finished = {}
+        for order_id in list(pending):
+            order = book.get(order_id)
+            if order is not None and order_status(order) in TERMINAL_STATUSES:
+                finished[order_id] = order
+                pending.discard(order_id)
+
+        if finished:
+            logging.info(f"{len(finished)} orders reached a terminal state, {len(pending)} still pending.")
+            terminal.update(finished)
+            if on_terminal is not None:
+                on_terminal(finished)
+
+        if pending and time.monotonic() + delay > deadline:
+            logging.warning(f"Orders still open after {timeout}s: {sorted(pending)}")
+            break
+        delay = min(delay * 2, max_delay)
+
+    return terminal, sorted(pending)
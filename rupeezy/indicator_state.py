@@ -0,0 +1,208 @@
+# Incremental RSI / EMA state for the eligibility condition.
+# RSI(65) and EMA(RSI,35) are recursive filters, so instead of recomputing them from the full
+# candle history on every run we keep a compact state per instrument (Wilder averages, last close,
+# EMA value and the running weekly bar) next to its StockEligibility row and advance it by one step
+# per new daily bar. The state is stored as a small JSON string in the IndicatorState attribute.
+# Only bars of completed sessions may be applied (completed_closes): advance_state ignores later bars
+# for a date it has seen, so a bar still forming when the job runs would stay in the state for good.
+#
+# rebuild_state is the full-recompute fallback for rows without state, and check_consistency
+# compares a state with the batch engine in indicators.py. Running
+# `python rupeezy/indicator_state.py CANDLE_DIR` checks every <SYMBOL>.csv in the directory.
+
+import json
+import sys
+import logging
+from datetime import date, datetime, timedelta
+
+import pytz
+
+from indicators import RSI_PERIOD, EMA_PERIOD
+
+# Version of the stored state layout; states with another version are rebuilt
+STATE_VERSION = 1
+
+IST = pytz.timezone('Asia/Kolkata')
+
+
+# Function to create an empty RSI/EMA filter state for one timeframe
+def new_filter_state():
+    # n: deltas seen, g/l: Wilder averages (sums while seeding), c: last close,
+    # m: RSI values seen, e: EMA of RSI (sum while seeding), r: latest RSI, x: latest EMA
+    return {'n': 0, 'g': 0.0, 'l': 0.0, 'c': None, 'm': 0, 'e': 0.0, 'r': None, 'x': None}
+
+
+# Function to advance a filter state by one closing price in constant time
+def update_filter(state, close, rsi_period=RSI_PERIOD, ema_period=EMA_PERIOD):
+    """Feed one close into the state and return the latest (rsi, ema); either may be None while seeding."""
+    if state['c'] is None:
+        state['c'] = close
+        return state['r'], state['x']
+
+    delta = close - state['c']
+    state['c'] = close
+    state['n'] += 1
+    gain, loss = max(delta, 0.0), max(-delta, 0.0)
+
+    if state['n'] < rsi_period:
+        state['g'] += gain
+        state['l'] += loss
+        return state['r'], state['x']
+    if state['n'] == rsi_period:
+        # Seed Wilder's averages with the simple average of the first period deltas
+        state['g'] = (state['g'] + gain) / rsi_period
+        state['l'] = (state['l'] + loss) / rsi_period
+    else:
+        state['g'] += (gain - state['g']) / rsi_period
+        state['l'] += (loss - state['l']) / rsi_period
+
+    if state['l'] == 0:
+        rsi = 100.0 if state['g'] > 0 else None
+    else:
+        rsi = 100.0 - 100.0 / (1.0 + state['g'] / state['l'])
+    if rsi is None:
+        return state['r'], state['x']
+    state['r'] = rsi
+
+    state['m'] += 1
+    if state['m'] < ema_period:
+        state['e'] += rsi
+    elif state['m'] == ema_period:
+        state['e'] = (state['e'] + rsi) / ema_period
+        state['x'] = state['e']
+    else:
+        state['e'] += (rsi - state['e']) * 2.0 / (ema_period + 1)
+        state['x'] = state['e']
+    return state['r'], state['x']
+
+
+# Function to find the Friday that closes the week of a given day
+def week_ending(day):
+    return day + timedelta(days=(4 - day.weekday()) % 7)
+
+
+# Function to create an empty per-instrument state
+def new_state():
+    return {
+        'v': STATE_VERSION,
+        'date': None,          # Date of the last daily bar applied
+        'daily': new_filter_state(),
+        'weekly': new_filter_state(),  # Completed weeks only
+        'week': None,          # Week-ending Friday of the running week
+        'week_close': None,    # Latest close of the running week
+        'wr': None,            # Weekly RSI including the running week
+        'wx': None             # Weekly EMA including the running week
+    }
+
+
+# Function to apply one new daily bar to an instrument's state
+def advance_state(state, day, close):
+    """Advance the daily and weekly filters by one bar; bars at or before the state's date are ignored."""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    if state['date'] is not None and day <= date.fromisoformat(state['date']):
+        return state
+
+    close = float(close)
+    update_filter(state['daily'], close)
+
+    week = week_ending(day).isoformat()
+    if state['week'] is not None and week != state['week']:
+        # The previous week is complete: commit its close to the weekly filter
+        update_filter(state['weekly'], state['week_close'])
+    state['week'] = week
+    state['week_close'] = close
+
+    # Latest weekly values treat the running week's last close as its close, without committing it
+    provisional = dict(state['weekly'])
+    state['wr'], state['wx'] = update_filter(provisional, close)
+
+    state['date'] = day.isoformat()
+    return state
+
+
+# Function to drop the bars of sessions that have not closed yet
+def completed_closes(closes, today=None):
+    """Return the closes dated before today (IST), i.e. up to the previous session's close."""
+    import pandas as pd
+    today = today or datetime.now(IST).date()
+    return closes[closes.index < pd.Timestamp(today)]
+
+
+# Function to rebuild an instrument's state from its full history
+def rebuild_state(closes):
+    """Full-recompute fallback: fold every (date, close) of a pandas Series into a fresh state."""
+    state = new_state()
+    for timestamp, close in closes.dropna().sort_index().items():
+        advance_state(state, timestamp.date(), close)
+    return state
+
+
+# Function to evaluate the eligibility condition on a state
+def state_is_eligible(state):
+    daily = state['daily']
+    daily_below = daily['r'] is not None and daily['x'] is not None and daily['r'] < daily['x']
+    weekly_below = state['wr'] is not None and state['wx'] is not None and state['wr'] < state['wx']
+    return daily_below or weekly_below
+
+
+# Function to serialise a state for the IndicatorState attribute
+def dump_state(state):
+    return json.dumps(state, separators=(',', ':'))
+
+
+# Function to read a stored state, returning None if it is missing or from another layout version
+def load_state(raw):
+    if not raw:
+        return None
+    try:
+        state = json.loads(raw)
+    except ValueError:
+        return None
+    return state if state.get('v') == STATE_VERSION else None
+
+
+# Function to compare an incremental state with the batch engine's result for the same history
+def check_consistency(state, closes, tolerance=1e-6):
+    """Return a list of (field, incremental, batch) tuples that differ by more than the tolerance."""
+    import numpy as np
+    from indicators import wilder_rsi, ema, latest_values, weekly_closes
+
+    frame = closes.dropna().sort_index().to_frame()
+    mismatches = []
+    for field, batch_closes, incremental in (
+            ('daily', frame, (state['daily']['r'], state['daily']['x'])),
+            ('weekly', weekly_closes(frame), (state['wr'], state['wx']))):
+        rsi = wilder_rsi(batch_closes.to_numpy())
+        batch = (latest_values(rsi)[0], latest_values(ema(rsi))[0])
+        for name, inc_value, batch_value in zip(('rsi', 'ema'), incremental, batch):
+            inc_value = np.nan if inc_value is None else inc_value
+            if np.isnan(inc_value) and np.isnan(batch_value):
+                continue
+            if not abs(inc_value - batch_value) <= tolerance:
+                mismatches.append((f"{field}_{name}", inc_value, batch_value))
+    return mismatches
+
+
+# Consistency check: rebuild every instrument's state incrementally and compare with the batch engine
+if __name__ == "__main__":
+    import os
+    from indicators import load_daily_series_from_csv
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if len(sys.argv) != 2:
+        print("Usage: python rupeezy/indicator_state.py CANDLE_DIR")
+        sys.exit(2)
+
+    failures = 0
+    for file_name in sorted(os.listdir(sys.argv[1])):
+        symbol, extension = os.path.splitext(file_name)
+        if extension.lower() != '.csv':
+            continue
+        closes = load_daily_series_from_csv(sys.argv[1], symbol)
+        mismatches = check_consistency(rebuild_state(closes), closes)
+        if mismatches:
+            failures += 1
+            logging.error(f"{symbol}: incremental state differs from batch result: {mismatches}")
+    logging.info(f"Consistency check finished with {failures} mismatching instruments.")
+    sys.exit(1 if failures else 0)
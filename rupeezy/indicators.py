@@ -0,0 +1,253 @@
+# Local RSI / EMA indicator engine.
+# Evaluates the same condition the Chartink screener is asked for in beest_eligibility_and_price_check.py,
+#   latest rsi(65) < latest ema(rsi(65),35) or weekly rsi(65) < weekly ema(rsi(65),35)
+# directly from daily candles, for the whole instrument universe at once. Closes are held in a
+# (days x instruments) array and the recursive filters run column-wise over all instruments in
+# pandas' compiled ewm, so there is no Python loop over instruments or days.
+#
+# Parity harness: run `python rupeezy/indicators.py CANDLE_DIR CHARTINK_JSON` against a saved
+# Chartink response and a directory of <SYMBOL>.csv candle files for the same day. It prints the
+# instruments the two sources disagree on and exits with status 1 if there are any. The cases under
+# tests/fixtures/parity are checked the same way by tests/test_indicators_parity.py.
+
+import logging
+import os
+import sys
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Indicator parameters of the eligibility condition
+RSI_PERIOD = 65
+EMA_PERIOD = 35
+
+# Weekly bars close on Friday, like the exchange week
+WEEKLY_RULE = 'W-FRI'
+
+# Days of daily history needed for the weekly RSI(65) / EMA(35) to settle
+HISTORY_DAYS = 5 * 365
+
+
+# Function to run a seeded first-order recursive filter over every column at once
+def _seeded_recursive_filter(values, period, alpha):
+    """Apply x[t] = x[t-1] + alpha * (v[t] - x[t-1]) column-wise.
+
+    Each column is seeded with the simple average of its first `period` valid values, which is how
+    Wilder's RSI and the classic EMA are initialised. NaN inputs (e.g. before an instrument was
+    listed) are skipped and leave the state untouched; outputs are NaN until the seed is complete.
+    The recursion itself runs in pandas' compiled ewm across all columns.
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    seen = np.cumsum(valid, axis=0)
+    running_sum = np.cumsum(np.where(valid, values, 0.0), axis=0)
+
+    # Replace the first `period` valid values by their average, placed on the period-th one
+    seeded = np.where(valid & (seen >= period),
+                      np.where(seen == period, running_sum / period, values),
+                      np.nan)
+
+    filtered = pd.DataFrame(seeded).ewm(alpha=alpha, adjust=False, ignore_na=True).mean().to_numpy()
+    return np.where(seen < period, np.nan, filtered)
+
+
+# Function to compute Wilder's RSI for every column of a closes array
+def wilder_rsi(closes, period=RSI_PERIOD):
+    """Return Wilder's RSI for a (time x instruments) closes array; first row is always NaN."""
+    closes = np.asarray(closes, dtype=float)
+    # Changes are measured against the previous available close, so a missing bar does not drop a delta
+    previous = pd.DataFrame(closes).ffill().shift(1).to_numpy()
+    delta = closes - previous
+
+    gains = np.where(np.isnan(delta), np.nan, np.clip(delta, 0, None))
+    losses = np.where(np.isnan(delta), np.nan, np.clip(-delta, 0, None))
+    avg_gain = _seeded_recursive_filter(gains, period, 1.0 / period)
+    avg_loss = _seeded_recursive_filter(losses, period, 1.0 / period)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    # No losses at all means RSI 100
+    rsi = np.where((avg_loss == 0) & (avg_gain > 0), 100.0, rsi)
+    return rsi
+
+
+# Function to compute the EMA of every column of an array
+def ema(values, period=EMA_PERIOD):
+    return _seeded_recursive_filter(np.asarray(values, dtype=float), period, 2.0 / (period + 1))
+
+
+# Function to read the last non-NaN value of each column
+def latest_values(values):
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    last_index = np.where(valid.any(axis=0), values.shape[0] - 1 - np.argmax(valid[::-1], axis=0), -1)
+    result = np.full(values.shape[1], np.nan)
+    has_value = last_index >= 0
+    result[has_value] = values[last_index[has_value], np.nonzero(has_value)[0]]
+    return result
+
+
+# Function to evaluate "rsi < ema(rsi)" on the latest bar of every instrument
+def rsi_below_ema(closes, rsi_period=RSI_PERIOD, ema_period=EMA_PERIOD):
+    rsi = wilder_rsi(closes, rsi_period)
+    rsi_ema = ema(rsi, ema_period)
+    latest_rsi = latest_values(rsi)
+    latest_ema = latest_values(rsi_ema)
+    with np.errstate(invalid='ignore'):
+        return latest_rsi < latest_ema  # NaN compares False, so short histories are never eligible
+
+
+# Function to resample daily closes to weekly closes
+def weekly_closes(daily_closes):
+    """Resample a date-indexed closes frame to week-ending-Friday closes (the running week uses the latest close)."""
+    return daily_closes.resample(WEEKLY_RULE).last()
+
+
+# Function to evaluate the eligibility condition for every instrument
+def evaluate_eligibility(daily_closes):
+    """Return the set of symbols that satisfy the daily-or-weekly RSI/EMA condition.
+
+    daily_closes is a DataFrame indexed by date with one column per symbol; missing bars are NaN.
+    """
+    if daily_closes.empty:
+        return set()
+    daily_closes = daily_closes.sort_index()
+    daily = rsi_below_ema(daily_closes.to_numpy())
+    weekly = rsi_below_ema(weekly_closes(daily_closes).to_numpy())
+    eligible = daily | weekly
+    return set(daily_closes.columns[eligible])
+
+
+# Function to evaluate the eligibility condition for every instrument on every day
+def eligibility_history(daily_closes):
+    """Return a boolean (dates x symbols) frame of the condition as of each day's close.
+
+    The daily side is exact. The weekly side uses the latest completed week (a Friday counts as
+    complete on its own close) rather than the provisional running week, so it can lag by a few days.
+    """
+    daily_closes = daily_closes.sort_index()
+    closes = daily_closes.to_numpy()
+    rsi = wilder_rsi(closes)
+    with np.errstate(invalid='ignore'):
+        daily = rsi < ema(rsi)
+    weekly_frame = weekly_closes(daily_closes)
+    weekly_rsi = wilder_rsi(weekly_frame.to_numpy())
+    with np.errstate(invalid='ignore'):
+        weekly = pd.DataFrame(weekly_rsi < ema(weekly_rsi), index=weekly_frame.index, columns=daily_closes.columns)
+    weekly = weekly.reindex(daily_closes.index, method='ffill').fillna(False).astype(bool)
+    return pd.DataFrame(daily, index=daily_closes.index, columns=daily_closes.columns) | weekly
+
+
+# Function to load one instrument's daily closes from <SYMBOL>.csv, optionally only after a date
+def load_daily_series_from_csv(candle_dir, symbol, since=None):
+    frame = pd.read_csv(os.path.join(candle_dir, f"{symbol}.csv"), usecols=['date', 'close'], parse_dates=['date'])
+    closes = frame.set_index('date')['close']
+    if since is not None:
+        closes = closes[closes.index > pd.Timestamp(since)]
+    return closes
+
+
+# Function to load one instrument's daily closes from the broker history API, optionally only after a date
+def load_daily_series_from_broker(client, token, since=None, days=HISTORY_DAYS, exchange=None):
+    from vortex_api import Constants as Vc  # The SDK only accepts its own enums here
+    to = datetime.now()
+    start = pd.Timestamp(since).to_pydatetime() + timedelta(days=1) if since is not None else to - timedelta(days=days)
+    response = client.historical_candles(exchange or Vc.ExchangeTypes.NSE_EQUITY, int(token), to, start,
+                                         Vc.Resolutions.DAY)
+    if response.get('s') != 'ok':
+        raise ValueError(f"No candle data for token {token}: {response}")
+    from candle_store import ist_index
+    dates = ist_index(response['t'])
+    closes = pd.Series(response['c'], index=dates)
+    if since is not None:
+        closes = closes[closes.index > pd.Timestamp(since)]
+    return closes
+
+
+# Function to load one instrument's daily closes from an open candle_store.CandleStore, optionally only after a date
+def load_daily_series_from_store(store, symbol, since=None):
+    bars = store.series(symbol, 'close')
+    if bars is None:
+        raise ValueError(f"No candles stored for {symbol}")
+    from candle_store import ist_index
+    times, values = bars
+    closes = pd.Series(values, index=ist_index(times, store.resolution))
+    if since is not None:
+        closes = closes[closes.index > pd.Timestamp(since)]
+    return closes
+
+
+# Function to load daily closes from a directory of <SYMBOL>.csv files
+def load_daily_closes_from_csv(candle_dir, symbols=None):
+    """Read date/close columns from every <SYMBOL>.csv in candle_dir into one closes frame."""
+    series = {}
+    for file_name in sorted(os.listdir(candle_dir)):
+        symbol, extension = os.path.splitext(file_name)
+        if extension.lower() != '.csv' or (symbols is not None and symbol not in symbols):
+            continue
+        series[symbol] = load_daily_series_from_csv(candle_dir, symbol)
+    return pd.DataFrame(series)
+
+
+# Function to load daily closes for many instruments from the memory-mapped candle store
+def load_daily_closes_from_store(store_dir, symbols=None, days=HISTORY_DAYS):
+    """Return the last `days` of daily closes in the store as one closes frame."""
+    from candle_store import CandleStore
+    store = CandleStore(store_dir)
+    return store.frame('close', start=datetime.now() - timedelta(days=days), symbols=symbols)
+
+
+# Function to load daily closes for many instruments from the broker history API
+def load_daily_closes_from_broker(client, tokens_by_symbol, days=HISTORY_DAYS, exchange=None):
+    """Fetch daily candles for each symbol -> token pair and return one closes frame.
+
+    Symbols whose candles could not be fetched have no column.
+    """
+    series = {}
+    for symbol, token in tokens_by_symbol.items():
+        try:
+            series[symbol] = load_daily_series_from_broker(client, token, days=days, exchange=exchange)
+        except Exception as e:
+            logging.error(f"Error fetching candles for {symbol}: {str(e)}")
+    return pd.DataFrame(series)
+
+
+# Function to list the symbols of a closes frame that have any candles at all
+def loaded_symbols(daily_closes):
+    return set(daily_closes.columns[daily_closes.notna().any(axis=0).to_numpy()])
+
+
+# Function to compare the local eligible set with the one Chartink returned
+def compare_with_chartink(local_eligible, chartink_eligible, universe=None):
+    """Return the symbols only one side considers eligible, restricted to the universe if given."""
+    local_eligible = set(local_eligible)
+    chartink_eligible = set(chartink_eligible)
+    if universe is not None:
+        chartink_eligible &= set(universe)
+    return {
+        'only_local': sorted(local_eligible - chartink_eligible),
+        'only_chartink': sorted(chartink_eligible - local_eligible)
+    }
+
+
+# Parity harness: compare a saved Chartink response against candles on disk
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if len(sys.argv) != 3:
+        print("Usage: python rupeezy/indicators.py CANDLE_DIR CHARTINK_JSON")
+        sys.exit(2)
+
+    closes = load_daily_closes_from_csv(sys.argv[1])
+    with open(sys.argv[2]) as chartink_file:
+        chartink_eligible = {item['nsecode'] for item in json.load(chartink_file)['data']}
+
+    started = datetime.now()
+    local_eligible = evaluate_eligibility(closes)
+    elapsed_ms = (datetime.now() - started).total_seconds() * 1000
+    logging.info(f"Evaluated {closes.shape[1]} instruments x {closes.shape[0]} days in {elapsed_ms:.1f} ms.")
+
+    diff = compare_with_chartink(local_eligible, chartink_eligible, universe=closes.columns)
+    print(json.dumps(diff, indent=2))
+    sys.exit(1 if diff['only_local'] or diff['only_chartink'] else 0)
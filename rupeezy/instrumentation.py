@@ -0,0 +1,168 @@
+# Lightweight run instrumentation for the rupeezy jobs.
+# Each job entry point runs inside run(job), which collects:
+#   phases - wall time per span (scan, screener, quotes, order_submit, fill_wait, db_write, ...);
+#            spans may nest, so each phase's time is inclusive of the spans inside it
+#   calls  - per service and endpoint: call count, errors, total seconds and a latency histogram
+# and writes a JSON summary to RUN_SUMMARY_DIR when the run ends. Broker calls are recorded by
+# rate_limit.RateLimitedClient and DynamoDB calls by the InstrumentedClient that clients.py wraps
+# around the boto3 objects. Recording is a perf_counter pair and a locked dict update per event.
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from collections import defaultdict
+
+# Directory the JSON run summaries are written to; empty disables the files
+RUN_SUMMARY_DIR = os.getenv('RUN_SUMMARY_DIR', 'run_summaries')
+# Upper bounds (milliseconds) of the latency histogram buckets; slower calls go to 'inf'
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+_BUCKET_LABELS = [str(bound) for bound in LATENCY_BUCKETS_MS] + ['inf']
+
+
+class Recorder:
+    """Phase timings and call statistics of one run."""
+
+    def __init__(self, job=None):
+        self.job = job
+        self.started_at = datetime.now().astimezone()
+        self.started = time.perf_counter()
+        self.phases = defaultdict(lambda: {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        self.calls = defaultdict(lambda: defaultdict(
+            lambda: {'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'histogram_ms': [0] * len(_BUCKET_LABELS)}))
+        self._lock = threading.Lock()
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            phase = self.phases[name]
+            phase['count'] += 1
+            phase['total_seconds'] += seconds
+            phase['max_seconds'] = max(phase['max_seconds'], seconds)
+
+    def add_call(self, service, endpoint, seconds, ok=True):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            stats = self.calls[service][endpoint]
+            stats['calls'] += 1
+            stats['errors'] += not ok
+            stats['total_seconds'] += seconds
+            stats['histogram_ms'][bucket] += 1
+
+    def summary(self, status='ok'):
+        with self._lock:
+            return {
+                'job': self.job,
+                'started': self.started_at.isoformat(timespec='seconds'),
+                'wall_seconds': round(time.perf_counter() - self.started, 6),
+                'status': status,
+                'phases': {name: dict(phase, total_seconds=round(phase['total_seconds'], 6),
+                                      max_seconds=round(phase['max_seconds'], 6))
+                           for name, phase in self.phases.items()},
+                'calls': {service: {endpoint: dict(stats, total_seconds=round(stats['total_seconds'], 6),
+                                                   histogram_ms=dict(zip(_BUCKET_LABELS, stats['histogram_ms'])))
+                                    for endpoint, stats in endpoints.items()}
+                          for service, endpoints in self.calls.items()}
+            }
+
+
+# Recorder of the run in progress; events outside a run go to an unnamed recorder
+_current = Recorder()
+_last_summary = None
+
+
+# Function to time a phase of the current run
+@contextmanager
+def span(name):
+    recorder = _current
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_phase(name, time.perf_counter() - started)
+
+
+# Function to record a duration that is not a span of its own, e.g. the time to the first order
+def record_phase(name, seconds):
+    _current.add_phase(name, seconds)
+
+
+# Function to record one API call in the current run
+def record_call(service, endpoint, seconds, ok=True):
+    _current.add_call(service, endpoint, seconds, ok)
+
+
+class InstrumentedClient:
+    """Proxy that records the latency and outcome of every method call on the wrapped client."""
+
+    def __init__(self, client, service):
+        object.__setattr__(self, '_client', client)
+        object.__setattr__(self, '_service', service)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            ok = False
+            try:
+                result = attribute(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                record_call(self._service, name, time.perf_counter() - started, ok)
+        return timed
+
+    def __setattr__(self, name, value):
+        setattr(self._client, name, value)
+
+
+# Function to write a run summary as JSON
+def write_summary(summary, summary_dir=RUN_SUMMARY_DIR):
+    """Write the summary to <summary_dir>/<job>-<start time>.json and return the path."""
+    os.makedirs(summary_dir, exist_ok=True)
+    stamp = summary['started'].replace(':', '').replace('-', '')[:15]
+    path = os.path.join(summary_dir, f"{summary['job']}-{stamp}.json")
+    with open(path, 'w') as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    return path
+
+
+# Function to instrument a whole job run (usable as a context manager or a decorator)
+@contextmanager
+def run(job, summary_dir=None):
+    """Collect phases and calls for the job and write the summary when it ends.
+
+    A run started inside another run is recorded as a span of the outer one.
+    """
+    global _current, _last_summary
+    if _current.job is not None:
+        with span(job):
+            yield
+        return
+
+    _current = Recorder(job)
+    status = 'error'
+    try:
+        yield
+        status = 'ok'
+    finally:
+        recorder, _current = _current, Recorder()
+        _last_summary = recorder.summary(status)
+        summary_dir = RUN_SUMMARY_DIR if summary_dir is None else summary_dir
+        try:
+            if summary_dir:
+                path = write_summary(_last_summary, summary_dir)
+                logging.info(f"Run summary for {job} written to {path} ({_last_summary['wall_seconds']:.3f}s).")
+        except OSError as e:
+            logging.error(f"Could not write the run summary for {job}: {e}")
+
+
+# Function to get the summary of the last finished run
+def last_run_summary():
+    return _last_summary
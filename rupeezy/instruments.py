@@ -0,0 +1,237 @@
+# Instrument master loaded from rupeezy_instruments_list.txt.
+# The file is tab separated: token, exchange, symbol, segment, series. It is parsed once into
+# compact array-backed columns with symbol -> token and token -> symbol indexes, and a binary
+# snapshot keyed on the file's mtime and size is written next to it so later loads skip parsing.
+# refresh_from_broker applies the differences from the broker's master download in place.
+
+import os
+import pickle
+import logging
+import threading
+from array import array
+
+# Default location of the instrument list shipped with the repository
+DEFAULT_MASTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rupeezy_instruments_list.txt')
+
+# Bump when the snapshot layout changes so old snapshots are ignored
+SNAPSHOT_VERSION = 1
+
+# The subset of the broker master this list tracks
+MASTER_EXCHANGE = 'NSE_EQ'
+MASTER_SERIES = 'EQ'
+
+
+# Function to compute the snapshot path for a master file
+def snapshot_path_for(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.snapshot")
+
+
+class InstrumentMaster:
+    """Array-backed instrument table with symbol and token indexes."""
+
+    __slots__ = ('tokens', 'symbols', 'exchange_codes', 'segment_codes', 'series_codes',
+                 'categories', '_category_index', '_by_symbol', '_by_token')
+
+    def __init__(self):
+        self.tokens = array('q')          # Broker token per row
+        self.symbols = []                 # Trading symbol per row
+        self.exchange_codes = array('H')  # Index into categories per row
+        self.segment_codes = array('H')
+        self.series_codes = array('H')
+        self.categories = []              # Distinct exchange / segment / series strings
+        self._category_index = {}
+        self._by_symbol = {}
+        self._by_token = {}
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def _code(self, value):
+        code = self._category_index.get(value)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(value)
+            self._category_index[value] = code
+        return code
+
+    def append(self, token, exchange, symbol, segment, series):
+        """Add one row and index it."""
+        row = len(self.tokens)
+        self.tokens.append(int(token))
+        self.symbols.append(symbol)
+        self.exchange_codes.append(self._code(exchange))
+        self.segment_codes.append(self._code(segment))
+        self.series_codes.append(self._code(series))
+        self._by_symbol[symbol] = row
+        self._by_token[int(token)] = row
+
+    def row(self, index):
+        """Return (token, exchange, symbol, segment, series) for a row index."""
+        return (self.tokens[index], self.categories[self.exchange_codes[index]], self.symbols[index],
+                self.categories[self.segment_codes[index]], self.categories[self.series_codes[index]])
+
+    def rows(self):
+        return [self.row(index) for index in range(len(self))]
+
+    def token_for(self, symbol):
+        """Return the token of a symbol, or None if it is not in the master."""
+        row = self._by_symbol.get(symbol)
+        return None if row is None else self.tokens[row]
+
+    def symbol_for(self, token):
+        """Return the symbol of a token, or None if it is not in the master."""
+        row = self._by_token.get(int(token))
+        return None if row is None else self.symbols[row]
+
+    def _reindex(self):
+        self._by_symbol = {symbol: row for row, symbol in enumerate(self.symbols)}
+        self._by_token = {token: row for row, token in enumerate(self.tokens)}
+
+    # Snapshots store the columns only; the indexes are rebuilt on load
+    def __getstate__(self):
+        return (self.tokens, self.symbols, self.exchange_codes, self.segment_codes, self.series_codes, self.categories)
+
+    def __setstate__(self, state):
+        (self.tokens, self.symbols, self.exchange_codes, self.segment_codes,
+         self.series_codes, self.categories) = state
+        self._category_index = {value: code for code, value in enumerate(self.categories)}
+        self._reindex()
+
+
+# Function to parse the tab-separated instrument list
+def parse_master_file(path):
+    master = InstrumentMaster()
+    with open(path) as master_file:
+        for line in master_file:
+            fields = [field.strip() for field in line.split('\t')]
+            if len(fields) < 5 or not fields[0].isdigit():
+                continue
+            master.append(*fields[:5])
+    return master
+
+
+# Function to write the instrument list back in its tab-separated format
+def save_master_file(master, path=DEFAULT_MASTER_PATH):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as master_file:
+        for token, exchange, symbol, segment, series in master.rows():
+            master_file.write(f"{token}\t{exchange}\t{symbol}\t{segment}\t{series}\n")
+    os.replace(temp_path, path)
+
+
+# Function to load the master, using the binary snapshot when it matches the file
+def load_master(path=DEFAULT_MASTER_PATH, snapshot_path=None):
+    """Load the instrument master, parsing the text file only when its snapshot is stale."""
+    snapshot_path = snapshot_path or snapshot_path_for(path)
+    stat = os.stat(path)
+    key = (SNAPSHOT_VERSION, stat.st_mtime_ns, stat.st_size)
+
+    try:
+        with open(snapshot_path, 'rb') as snapshot_file:
+            snapshot_key, master = pickle.load(snapshot_file)
+        if snapshot_key == key:
+            return master
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        pass
+
+    master = parse_master_file(path)
+    try:
+        with open(f"{snapshot_path}.tmp", 'wb') as snapshot_file:
+            pickle.dump((key, master), snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{snapshot_path}.tmp", snapshot_path)
+    except OSError as e:
+        logging.warning(f"Could not write instrument snapshot {snapshot_path}: {e}")
+    return master
+
+
+_shared_master = None
+_shared_lock = threading.Lock()
+
+
+# Function to get the process-wide master, loading it on first use
+def get_master():
+    global _shared_master
+    with _shared_lock:
+        if _shared_master is None:
+            _shared_master = load_master()
+        return _shared_master
+
+
+# Function to compute the differences between the master and the broker's master download
+def diff_against_broker(master, broker_rows):
+    """Compare with client.download_master() rows (header row first).
+
+    Returns (added, removed, renamed): rows to add, tokens to drop and token -> new symbol.
+    """
+    header = [column.strip().lower() for column in broker_rows[0]]
+    column = {name: index for index, name in enumerate(header)}
+    current = {}
+    for row in broker_rows[1:]:
+        if len(row) < len(header):
+            continue
+        if row[column['exchange']].strip() != MASTER_EXCHANGE or row[column['series']].strip() != MASTER_SERIES:
+            continue
+        token = int(row[column['token']])
+        current[token] = (token, MASTER_EXCHANGE, row[column['symbol']].strip(),
+                          row[column['instrument_name']].strip(), MASTER_SERIES)
+
+    known = set(master.tokens)
+    added = [current[token] for token in current.keys() - known]
+    removed = sorted(known - current.keys())
+    renamed = {token: current[token][2] for token in known & current.keys()
+               if master.symbol_for(token) != current[token][2]}
+    return added, removed, renamed
+
+
+# Function to apply a broker master diff to the local master
+def apply_master_diff(master, added, removed, renamed):
+    """Apply the diff in place and return the master."""
+    if removed:
+        drop = set(removed)
+        keep = [index for index, token in enumerate(master.tokens) if token not in drop]
+        master.tokens = array('q', (master.tokens[i] for i in keep))
+        master.symbols = [master.symbols[i] for i in keep]
+        master.exchange_codes = array('H', (master.exchange_codes[i] for i in keep))
+        master.segment_codes = array('H', (master.segment_codes[i] for i in keep))
+        master.series_codes = array('H', (master.series_codes[i] for i in keep))
+    for token, symbol in renamed.items():
+        master.symbols[master._by_token[token]] = symbol
+    master._reindex()
+    for row in added:
+        master.append(*row)
+    return master
+
+
+# Function to refresh the local master from the broker's download and persist it
+def refresh_from_broker(client, path=DEFAULT_MASTER_PATH):
+    """Download the broker master, apply only the differences and rewrite the list if anything changed."""
+    master = load_master(path)
+    added, removed, renamed = diff_against_broker(master, client.download_master())
+    if added or removed or renamed:
+        apply_master_diff(master, added, removed, renamed)
+        save_master_file(master, path)
+        load_master(path)  # Refresh the snapshot for the new file
+    logging.info(f"Instrument master refresh: {len(added)} added, {len(removed)} removed, {len(renamed)} renamed.")
+    return master
+
+
+# Function to check the tokens stored in DynamoDB against the master in bulk
+def check_tokens(master, tokens_by_symbol):
+    """Return (symbol, stored_token, master_token) for every symbol whose stored token disagrees."""
+    mismatches = []
+    for symbol, stored_token in tokens_by_symbol.items():
+        master_token = master.token_for(symbol)
+        if master_token is None or stored_token is None or int(stored_token) != master_token:
+            mismatches.append((symbol, stored_token, master_token))
+    return mismatches
+
+
+# Function to pick the token to trade a symbol with; None when the stored and master tokens disagree or neither exists
+def resolve_token(master, symbol, stored_token):
+    master_token = master.token_for(symbol)
+    if stored_token is None:
+        return master_token
+    if master_token is not None and int(stored_token) != master_token:
+        return None  # Nobody has checked which one is right; the caller skips the symbol
+    return int(stored_token)
@@ -0,0 +1,66 @@
+# Trigger-price ladder for the additional-quantity strategy.
+# Every instrument carries the absolute prices at which each ladder level is reached, computed once
+# from its BaseValue: level k triggers at BaseValue * (1 - k * step%). Checking a price is then a
+# bisect against the instrument's sorted ladder, and a whole batch of instruments is evaluated in one
+# NumPy comparison. The number of levels crossed is the AdditionalQuantity multiplier, so a gap-down
+# through several levels buys all of them at once (see PriceDrop_Buy_Logic.txt).
+# "Levels crossed since the last check" needs no state of its own: every fill moves BaseValue (stored
+# in DynamoDB) to the executed price, and the ladders are built from the current BaseValues on each
+# run, so the levels already bought are never counted again.
+#
+# LADDER_LEVELS (default 3) sets the number of levels and LADDER_STEP_PERCENT (default 1) the drop
+# between levels.
+
+import os
+from bisect import bisect_left
+
+import numpy as np
+
+LADDER_LEVELS = int(os.getenv('LADDER_LEVELS', '3'))
+LADDER_STEP_PERCENT = float(os.getenv('LADDER_STEP_PERCENT', '1'))
+
+
+# Function to compute the trigger price of one ladder level
+def trigger_prices(base_values, level, step=LADDER_STEP_PERCENT):
+    """Trigger price of ladder level `level` (1 is the first) for an array of BaseValues; broadcasts over step.
+
+    Prices are floored to the paisa so that a trigger is never above the exact level price.
+    """
+    prices = np.asarray(base_values, dtype=float) * (100.0 - level * np.asarray(step, dtype=float)) / 100.0
+    return np.floor(prices * 100.0 + 1e-6) / 100.0
+
+
+# Function to compute the trigger prices for one or many BaseValues
+def build_ladders(base_values, levels=LADDER_LEVELS, step=LADDER_STEP_PERCENT):
+    """Return an array of trigger prices, sorted ascending along the last axis (deepest level first)."""
+    base_values = np.asarray(base_values, dtype=float)
+    return trigger_prices(base_values[..., None], np.arange(levels, 0, -1), step)
+
+
+# Function to build the ladder of a single BaseValue as a sorted list
+def build_ladder(base_value, levels=LADDER_LEVELS, step=LADDER_STEP_PERCENT):
+    return build_ladders(float(base_value), levels, step).tolist()
+
+
+# Function to count how many ladder levels a price has reached
+def levels_crossed(ladder, price):
+    """Number of trigger prices at or above price; 0 means no level is reached."""
+    return len(ladder) - bisect_left(ladder, float(price))
+
+
+class LadderBook:
+    """Ladders for a batch of instruments, built from their current BaseValues."""
+
+    def __init__(self, base_values, levels=LADDER_LEVELS, step=LADDER_STEP_PERCENT):
+        self.levels = levels
+        self.step = step
+        self.triggers = build_ladders(base_values, levels, step).reshape(-1, levels)
+
+    def __len__(self):
+        return len(self.triggers)
+
+    def crossed(self, prices):
+        """Levels reached by each price in one vectorized pass, i.e. the multiplier to buy now; NaN prices
+        reach no level."""
+        prices = np.asarray(prices, dtype=float)
+        return (self.triggers >= prices[:, None]).sum(axis=1)
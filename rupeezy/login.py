@@ -1,14 +1,97 @@
-import requests  # Importing the requests library for making HTTP requests to the Rupeezy API
 import os  # Importing the os library to access environment variables (like API keys, passwords, etc.)
+import json  # Reading and writing the token cache file
+import time  # Expiry checks for the cached token
+import base64  # Decoding the expiry claim of the access token
 import logging  # Importing the logging module to log information and errors during the script execution
+import threading  # Guarding the in-process token cache
+from datetime import datetime, timedelta
 
 # Setup basic logging configuration to show info and error messages with timestamps
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+# API endpoint for Rupeezy login
+LOGIN_URL = "https://vortex.trade.rupeezy.in/user/login"
+
+# Token cache: the token and its expiry are kept in a file only the owner can read, so every job
+# (and every run of the scheduler) reuses one login until the token is close to expiring
+TOKEN_CACHE_PATH = os.getenv('RUPEEZY_TOKEN_CACHE', os.path.join(os.path.expanduser('~'), '.rupeezy_token.json'))
+REFRESH_MARGIN_SECONDS = 10 * 60  # Log in again this long before the token expires
+TOKEN_EXPIRY_TIME_IST = (6, 0)    # Assumed expiry (next day, IST) when the token carries no exp claim
+
+_session = None  # Pooled HTTP session reused by every login
+_cached = None   # In-process copy of the cached token: {'access_token': ..., 'expires_at': ...}
+_token_lock = threading.Lock()
+
+
+# Function to get the pooled HTTP session used for logins
+def get_session():
+    global _session
+    if _session is None:
+        import requests  # Only needed when a login is actually due
+        _session = requests.Session()
+    return _session
+
+
+# Function to generate the TOTP in-process from TOTP_SECRET_KEY, falling back to a TOTP from the environment
+def generate_totp():
+    secret = os.getenv('TOTP_SECRET_KEY')
+    if secret:
+        import pyotp
+        return pyotp.TOTP(secret).now()
+    return os.getenv('TOTP')
+
+
+# Function to work out when an access token expires
+def token_expiry(access_token, now=None):
+    """Return the expiry as a Unix timestamp: the token's JWT exp claim if it has one, else the next 6:00 IST."""
+    try:
+        payload = access_token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        if 'exp' in claims:
+            return float(claims['exp'])
+    except Exception:
+        pass
+    import pytz
+    ist = pytz.timezone('Asia/Kolkata')
+    now = now or datetime.now(ist)
+    expiry = now.replace(hour=TOKEN_EXPIRY_TIME_IST[0], minute=TOKEN_EXPIRY_TIME_IST[1], second=0, microsecond=0)
+    if expiry <= now:
+        expiry += timedelta(days=1)
+    return expiry.timestamp()
+
+
+# Function to check whether a cached token can still be used
+def _is_fresh(cached):
+    return bool(cached and cached.get('access_token')
+                and cached.get('expires_at', 0) - REFRESH_MARGIN_SECONDS > time.time())
+
+
+# Function to read the token cache file
+def read_token_cache(path=TOKEN_CACHE_PATH):
+    try:
+        if os.stat(path).st_mode & 0o077:
+            logging.warning(f"Token cache {path} is readable by other users; restricting it to the owner.")
+            os.chmod(path, 0o600)
+        with open(path) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+
+# Function to write the token cache file with owner-only permissions
+def write_token_cache(cached, path=TOKEN_CACHE_PATH):
+    temp_path = f"{path}.tmp"
+    descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w') as cache_file:
+        json.dump(cached, cache_file)
+    os.replace(temp_path, path)
+
+
 def login_and_get_token():
+    import requests  # Imported here so scripts that reuse a cached token never load it
     try:
         # Retrieve environment variables (these are stored outside the script, typically in your system or CI/CD environment)
-        totp = os.getenv('TOTP')  # Time-based One-Time Password (TOTP) fetched from environment
+        totp = generate_totp()  # Time-based One-Time Password (TOTP), generated in-process when the secret is available
         api_key = os.getenv('RUPEEZY_API_KEY')  # API key for authenticating with the Rupeezy platform
         client_code = os.getenv('RUPEEZY_CLIENT_CODE')  # Client code for login
         password = os.getenv('RUPEEZY_PASSWORD')  # Password for the Rupeezy account
@@ -18,10 +101,9 @@ def login_and_get_token():
         if not all([totp, api_key, client_code, password, application_id]):
             raise ValueError("One or more required environment variables are not set.")  # If any variable is missing, raise a ValueError
 
-        logging.info("Using TOTP: %s", totp)  # Log the TOTP (useful for tracking/debugging)
+        logging.info("Logging in to Rupeezy with a fresh TOTP.")
 
-        # Prepare the URL for the login API and set the headers for the HTTP request
-        url = "https://vortex.trade.rupeezy.in/user/login"  # API endpoint for Rupeezy login
+        # Prepare the headers for the HTTP request to the login API
         headers = {
             "x-api-key": api_key,  # Send the API key as a header
             "Content-Type": "application/json"  # Specify that the request body is in JSON format
@@ -35,8 +117,8 @@ def login_and_get_token():
             "application_id": application_id  # Application ID for Rupeezy
         }
 
-        # Send the POST request to the login API with headers and data
-        response = requests.post(url, headers=headers, json=data)  # Sending HTTP POST request
+        # Send the POST request to the login API over the pooled session
+        response = get_session().post(LOGIN_URL, headers=headers, json=data)  # Sending HTTP POST request
         response.raise_for_status()  # Raise an exception if the server returns an HTTP error (e.g., 4xx or 5xx status codes)
 
         # Process the response JSON data to extract the access token
@@ -60,9 +142,49 @@ def login_and_get_token():
         logging.error("An unexpected error occurred: %s", e)  # Catch and log any other unexpected errors
     return None  # Return None if any error occurred
 
+# Function to get a valid access token, logging in only when needed
+def get_access_token(force_refresh=False):
+    """Return the cached access token, or log in if it is missing, about to expire or force_refresh is set.
+
+    The token is looked up in this process first, then in the token cache file, then in
+    RUPEEZY_ACCESS_TOKEN; only if none of them is usable does this log in and update the cache.
+    """
+    global _cached
+    with _token_lock:
+        if not force_refresh:
+            if _is_fresh(_cached):
+                return _cached['access_token']
+            cached = read_token_cache()
+            if _is_fresh(cached):
+                _cached = cached
+                return cached['access_token']
+            env_token = os.getenv('RUPEEZY_ACCESS_TOKEN')
+            if env_token and _cached is None and cached is None:
+                # A token handed over by the environment; its expiry is only known if it carries one
+                _cached = {'access_token': env_token, 'expires_at': token_expiry(env_token)}
+                return env_token
+
+        access_token = login_and_get_token()
+        if not access_token:
+            return None
+        _cached = {'access_token': access_token, 'expires_at': token_expiry(access_token)}
+        try:
+            write_token_cache(_cached)
+        except OSError as e:
+            logging.error(f"Could not write the token cache {TOKEN_CACHE_PATH}: {e}")
+        return access_token
+
+
+# Function to drop the cached token after the broker rejected it and log in again
+def refresh_access_token():
+    return get_access_token(force_refresh=True)
+
+
 # This block runs only when the script is executed directly (i.e., not imported as a module)
+# Pass --refresh to log in even if the cached token is still valid
 if __name__ == "__main__":
-    token = login_and_get_token()  # Call the login function to attempt to get the access token
+    import sys
+    token = get_access_token(force_refresh='--refresh' in sys.argv)  # Get the cached token or log in for a new one
     if token:
         print(token)  # Print the access token if successfully retrieved
     else:
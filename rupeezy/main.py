@@ -1,217 +1,261 @@
 # InstrumentName: It identifies the stock by InstrumentName and uses this key to update DynamoDB when necessary.
 # EligibilityStatus: This script only processes stocks with EligibilityStatus = Eligible. It fetches eligible stocks from DynamoDB.
 # BaseValue:
-# If BaseValue is less than or equal to 0 (or null), after the first successful order, the script updates the BaseValue to the order price.
+# If BaseValue is less than or equal to 0 (or null), after the first successful order, the script updates the BaseValue to the executed average price.
 # If BaseValue is already set (greater than 0), it does not update the BaseValue.
 # DefaultQuantity: The script places an order only if the stock has a DefaultQuantity greater than 0. If DefaultQuantity is 0, the order is skipped.
 # FirstDayProcessed: If FirstDayProcessed is False, the script updates it to True after setting the BaseValue for the first time.
 
 import logging  # A Python module for logging messages during program execution
 import os  # A module for interacting with the operating system, like reading environment variables
-import boto3  # The AWS SDK for Python, used to interact with AWS services like DynamoDB
-from vortex_api import AsthaTradeVortexAPI  # Importing custom SDK (from vortex API) to interact with the broker API
-from vortex_api import Constants as Vc  # Importing constants from the vortex API to use in order placement
+import time  # perf_counter for the time to the first order
 from decimal import Decimal
-import time  # Import time to use sleep for retry logic
+from datetime import date, datetime  # The day of an order's journal key and the release time of the default buy
+from order_engine import execute_orders, settle_earlier_orders  # Concurrent order submission and fill collection
+from fill_tracker import average_fill_price  # Executed average price from the order book
+from stock_index import fetch_by_status, stock_key, sort_key_of, DEFAULT_SORT_KEY  # Index-backed lookups and keys
+from instruments import get_master, resolve_token  # Local instrument master
+from clients import LazyClient, get_broker_client, get_dynamodb_client, get_stock_mirror, warm_broker_connections  # Process-wide broker and DynamoDB clients
+from state_mirror import modified_at  # ModifiedAt stamp read by the mirror's incremental sync
+from order_journal import OrderJournal  # Crash-safe record of every order placed
+from instrumentation import run, span  # Phase timings and the JSON run summary
 
 # Setup basic logging. This logs debug-level information in a formatted manner
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-# Initialize a DynamoDB client using boto3 to interact with the DynamoDB service in the 'ap-south-1' region
-dynamodb = boto3.client('dynamodb', region_name='ap-south-1')
-
-# Retrieve secrets like API keys and access tokens from environment variables (set in the system or in a .env file)
-api_secret = os.getenv('RUPEEZY_API_KEY')  # Fetch API key from environment
-application_id = os.getenv('RUPEEZY_APPLICATION_ID')  # Fetch Application ID
-access_token = os.getenv('RUPEEZY_ACCESS_TOKEN')  # Fetch Access token
-
-# Create an instance of the AsthaTradeVortexAPI client, passing in the required API keys and tokens
-client = AsthaTradeVortexAPI(api_secret, application_id)
-client.access_token = access_token  # Set the access token to authenticate requests
+# Shared DynamoDB client (region 'ap-south-1') and broker API client, authenticated from the environment
+# (RUPEEZY_API_KEY, RUPEEZY_APPLICATION_ID) and the token cache. Both are built on first use, so importing
+# this module is cheap; the scheduler daemon reuses the same instances.
+dynamodb = LazyClient(get_dynamodb_client)
+client = LazyClient(get_broker_client)
 
 # Function to fetch eligible stocks from the DynamoDB 'StockEligibility' table
 def fetch_eligible_stocks_from_dynamodb():
     """Fetch all eligible stocks from DynamoDB."""
     try:
-        response = dynamodb.scan(
-            TableName='StockEligibility',  # The name of the DynamoDB table
-            FilterExpression="EligibilityStatus = :status",  # A filter to only fetch stocks that are eligible
-            ExpressionAttributeValues={':status': {'S': 'Eligible'}}  # AttributeValue to match "Eligible" stocks
+        mirror = get_stock_mirror()
+        if mirror is not None:
+            # Catch up with DynamoDB and read the eligible rows from the local index
+            mirror.sync()
+            return mirror.query(status='Eligible')
+
+        # Query the EligibilityStatus index, reading only the attributes this script uses
+        items = fetch_by_status(
+            dynamodb, 'Eligible',
+            attributes=('InstrumentName', 'Eligibility', 'EligibilityStatus', 'DefaultQuantity', 'BaseValue', 'Token')
         )
         
         # Inspect the EligibilityStatus for each stock
-        for stock in response['Items']:
-            logging.debug(f"EligibilityStatus for {stock['InstrumentName']['S']}: {repr(stock['EligibilityStatus']['S'])}")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            for stock in items:
+                logging.debug("EligibilityStatus for %s: %r", stock['InstrumentName']['S'], stock['EligibilityStatus']['S'])
         
-        return response['Items']  # Return the list of eligible stock items from the response
+        return items  # Return the list of eligible stock items from all pages
     except Exception as e:  # If any error occurs, log the error
         logging.error(f"Error fetching eligible stocks from DynamoDB: {e}")
         return []  # Return an empty list in case of failure
 
-# Function to place an order using the SDK with retry logic
+# Function to place an order using the SDK (rate limiting and retries happen in the shared client)
 def trigger_order_via_sdk(client, order_details):
     """Trigger an order using the SDK and log the response."""
-    retries = 3  # Number of retry attempts
-    delay = 5  # Delay in seconds between retries
-
-    for attempt in range(retries):
-        try:
-            # Choose the correct order type (market or limit) based on the variety specified in 'order_details'
-            variety = Vc.VarietyTypes.REGULAR_MARKET_ORDER if order_details['variety'] == "RL-MKT" else Vc.VarietyTypes.REGULAR_LIMIT_ORDER
-
-            # Place the order using the broker's API, providing all necessary parameters
-            response = client.place_order(
-                exchange=Vc.ExchangeTypes.NSE_EQUITY,  # The exchange (NSE Equity in this case)
-                token=order_details['token'],  # Stock token (unique identifier for the stock)
-                transaction_type=Vc.TransactionSides.BUY if order_details['transaction_type'] == "BUY" else Vc.TransactionSides.SELL,  # Buy or Sell
-                product=Vc.ProductTypes.MTF,  # Product type (e.g., MTF)
-                variety=variety,  # Order variety (market or limit)
-                quantity=order_details['quantity'],  # Quantity of stocks to buy
-                price=order_details['price'],  # Order price (if a limit order)
-                trigger_price=order_details['trigger_price'],  # Trigger price (if applicable)
-                disclosed_quantity=order_details['disclosed_quantity'],  # Disclosed quantity
-                validity=Vc.ValidityTypes.FULL_DAY if order_details['validity'] == "DAY" else Vc.ValidityTypes.IMMEDIATE_OR_CANCEL  # Order validity
-            )
-            logging.info(f"Order placed. Full response: {response}")  # Log the full response from the API
-            return response  # Return the response for further processing
-        except Exception as e:  # Log errors if the order fails
-            logging.error(f"Error during order placement: {str(e)}. Attempt {attempt + 1} of {retries}")
-            if attempt < retries - 1:  # If it's not the last attempt, wait before retrying
-                time.sleep(delay)
-            else:
-                return None  # Return None if all retries fail
-
-# Function to fetch the order details with retry logic
-def fetch_order_details(client, order_id):
-    """Fetch order details for a given order ID."""
-    retries = 3  # Number of retry attempts
-    delay = 5  # Delay in seconds between retries
-
-    for attempt in range(retries):
-        try:
-            response = client.order_history(order_id)  # Fetch the order history based on order_id
-            logging.info(f"Order Details for {order_id}: {response}")  # Log the fetched details
-            return response  # Return the response for use later (e.g., for updating BaseValue)
-        except Exception as e:
-            logging.error(f"Error fetching order details for {order_id}: {str(e)}. Attempt {attempt + 1} of {retries}")
-            if attempt < retries - 1:  # If it's not the last attempt, wait before retrying
-                time.sleep(delay)
-            else:
-                return None  # Return None if all retries fail
-
-# Function to fetch current positions with retry logic
+    from vortex_api import Constants as Vc  # Constants for order placement; deferred because vortex_api is slow to import
+    try:
+        # Choose the correct order type (market or limit) based on the variety specified in 'order_details'
+        variety = Vc.VarietyTypes.REGULAR_MARKET_ORDER if order_details['variety'] == "RL-MKT" else Vc.VarietyTypes.REGULAR_LIMIT_ORDER
+
+        # Place the order using the broker's API, providing all necessary parameters
+        response = client.place_order(
+            exchange=Vc.ExchangeTypes.NSE_EQUITY,  # The exchange (NSE Equity in this case)
+            token=order_details['token'],  # Stock token (unique identifier for the stock)
+            transaction_type=Vc.TransactionSides.BUY if order_details['transaction_type'] == "BUY" else Vc.TransactionSides.SELL,  # Buy or Sell
+            product=Vc.ProductTypes.MTF,  # Product type (e.g., MTF)
+            variety=variety,  # Order variety (market or limit)
+            quantity=order_details['quantity'],  # Quantity of stocks to buy
+            price=order_details['price'],  # Order price (if a limit order)
+            trigger_price=order_details['trigger_price'],  # Trigger price (if applicable)
+            disclosed_quantity=order_details['disclosed_quantity'],  # Disclosed quantity
+            validity=Vc.ValidityTypes.FULL_DAY if order_details['validity'] == "DAY" else Vc.ValidityTypes.IMMEDIATE_OR_CANCEL  # Order validity
+        )
+        logging.debug("Order placed. Full response: %s", response)  # Log the full response from the API
+        return response  # Return the response for further processing
+    except Exception as e:  # Log errors if the order fails after the client's retries
+        logging.error(f"Error during order placement: {str(e)}")
+        return None
+
+# Function to fetch current positions
 def fetch_positions(client):
-    """Fetch current positions with retry logic."""
-    retries = 3  # Number of retry attempts
-    delay = 5  # Delay in seconds between retries
-
-    for attempt in range(retries):
-        try:
-            response = client.positions()  # Fetch the current positions from the API
-            logging.info(f"Current Positions: {response}")  # Log the current positions
-            return response
-        except Exception as e:  # Log errors if fetching positions fails
-            logging.error(f"Error fetching positions: {str(e)}. Attempt {attempt + 1} of {retries}")
-            if attempt < retries - 1:  # If it's not the last attempt, wait before retrying
-                time.sleep(delay)
-            else:
-                return None  # Return None if all retries fail
-
-# Function to update the BaseValue for a stock in DynamoDB
-def update_base_value_in_dynamodb(instrument_name, base_value):
-    """Update the BaseValue in DynamoDB for a given instrument."""
+    """Fetch current positions; retriable failures are retried by the shared client."""
+    try:
+        response = client.positions()  # Fetch the current positions from the API
+        logging.debug("Current Positions: %s", response)  # Log the current positions
+        return response
+    except Exception as e:  # Log errors if fetching positions fails
+        logging.error(f"Error fetching positions: {str(e)}")
+        return None
+
+# Function to set the BaseValue and the FirstDayProcessed flag for a stock in DynamoDB
+def update_base_value_in_dynamodb(instrument_name, base_value, sort_key=DEFAULT_SORT_KEY):
+    """Set the BaseValue and mark FirstDayProcessed as True in a single update."""
     try:
-        # Update the BaseValue field in DynamoDB for the stock
         dynamodb.update_item(
             TableName='StockEligibility',  # The name of the DynamoDB table
-            Key={
-                'InstrumentName': {'S': instrument_name},  # The partition key (instrument name)
-                'Eligibility': {'S': 'Eligible'}  # The sort key (eligibility status)
-            },
-            UpdateExpression="SET BaseValue = :bv",  # The update expression to set the BaseValue
+            Key=stock_key(instrument_name, sort_key),  # The row's own partition and sort key
+            UpdateExpression="SET BaseValue = :bv, FirstDayProcessed = :fdp, ModifiedAt = :ma",
             ExpressionAttributeValues={
-                ':bv': {'N': str(base_value)}  # The value to set for BaseValue (must be a stringified number)
+                ':bv': {'N': str(base_value)},  # The value to set for BaseValue (must be a stringified number)
+                ':fdp': {'BOOL': True},
+                ':ma': {'N': str(modified_at())}
             }
         )
-        logging.info(f"Updated BaseValue for {instrument_name} to {base_value}.")  # Log the update
+        logging.info(f"Updated BaseValue for {instrument_name} to {base_value} and FirstDayProcessed to True.")
+        return True
     except Exception as e:
         logging.error(f"Error updating BaseValue for {instrument_name}: {str(e)}")
+        return False
 
-# Function to update the FirstDayProcessed flag in DynamoDB
-def update_first_day_processed_flag(instrument_name):
-    """Update the FirstDayProcessed flag to True in DynamoDB for a given instrument."""
-    try:
-        # Update the FirstDayProcessed field in DynamoDB to True
-        dynamodb.update_item(
-            TableName='StockEligibility',
-            Key={
-                'InstrumentName': {'S': instrument_name},
-                'Eligibility': {'S': 'Eligible'}
-            },
-            UpdateExpression="SET FirstDayProcessed = :fdp",
-            ExpressionAttributeValues={
-                ':fdp': {'BOOL': True}
-            }
-        )
-        logging.info(f"Updated FirstDayProcessed flag to True for {instrument_name}.")
-    except Exception as e:
-        logging.error(f"Error updating FirstDayProcessed for {instrument_name}: {str(e)}")
+# Function to build the market order for a stock's default quantity
+def build_default_order(stock, default_quantity, token):
+    return {
+        "exchange": "NSE_EQ",
+        "token": token,
+        "symbol": stock['InstrumentName']['S'],
+        "transaction_type": "BUY",
+        "product": "MTF",
+        "variety": "RL-MKT",
+        "quantity": default_quantity,
+        "price": 0.0,
+        "trigger_price": 0.0,
+        "disclosed_quantity": 0,
+        "validity": "DAY",
+        "validity_days": 1,
+        "is_amo": False
+    }
 
-# The main script execution starts here
-if __name__ == "__main__":
-    eligible_stocks = fetch_eligible_stocks_from_dynamodb()
+# Function to apply the BaseValue / FirstDayProcessed updates for a round of finished orders
+@span('db_write')
+def apply_default_fills(fills):
+    """Set the BaseValue from the executed average price where it was not set before.
+
+    Returns the order IDs whose update failed, so the order journal retries them.
+    """
+    mirror = get_stock_mirror()
+    not_applied = []
+    queued = {}  # Order IDs per instrument whose update is queued on the mirror
+    for stock, order_id, order in fills:
+        instrument_name = stock['InstrumentName']['S']
+        base_value = Decimal(stock.get('BaseValue', {}).get('N', -1))  # Get BaseValue, default to -1
+
+        # Only update BaseValue if it's less than or equal to 0 or missing (null)
+        if base_value > 0:
+            logging.info(f"BaseValue and FirstDayProcessed are already set for {instrument_name}. Skipping BaseValue update.")
+            continue
+
+        executed_price = average_fill_price(order)
+        if executed_price is None:
+            logging.error(f"Order {order_id} for {instrument_name} did not fill (status {order.get('status')}).")
+            continue
+        if mirror is not None:
+            mirror.update(instrument_name, sort_key_of(stock), {'BaseValue': {'N': str(executed_price)}, 'FirstDayProcessed': {'BOOL': True}})
+            queued.setdefault(instrument_name, []).append(order_id)
+        elif not update_base_value_in_dynamodb(instrument_name, executed_price, sort_key_of(stock)):
+            not_applied.append(order_id)
+
+    # Write the queued updates of this round in one batch
+    if queued:
+        for instrument_name, _ in mirror.flush():
+            not_applied.extend(queued.get(instrument_name, []))
+        logging.info(f"Updated BaseValue for {len(queued)} stocks through the mirror.")
+    return not_applied
+
+# Journal key prefix of the default-quantity orders
+DEFAULT_ORDER_PREFIX = 'default_buy:'
+
+# Function to build the idempotency key of a stock's default-quantity order
+def default_order_key(stock):
+    # One buy per stock and day; earlier days' unapplied fills are settled separately
+    return f"{DEFAULT_ORDER_PREFIX}{date.today().isoformat()}:{stock['InstrumentName']['S']}"
+
+# Function to find the stock an earlier day's default-order key belongs to
+def stock_for_key(eligible_stocks, key):
+    """Return the eligible stock of a default_buy:<day>:<InstrumentName> key, or None."""
+    instrument_name = key[len(DEFAULT_ORDER_PREFIX):].split(':', 1)[-1]
+    return next((stock for stock in eligible_stocks if stock['InstrumentName']['S'] == instrument_name), None)
+
+# Function to build the default-quantity order requests for all eligible stocks
+def build_default_orders(eligible_stocks):
+    """Return the (stock, order_details) pairs of every stock with a DefaultQuantity and a checked token."""
+    master = get_master()
+    orders = []
+    for stock in eligible_stocks:
+        instrument_name = stock['InstrumentName']['S']
+        default_quantity = int(stock.get('DefaultQuantity', {}).get('N', 0))
+
+        if default_quantity == 0:
+            logging.info(f"Skipping order placement for {instrument_name} as DefaultQuantity is 0.")
+            continue
+
+        # Check the token typed into DynamoDB against the instrument master
+        stored_token = stock.get('Token', {}).get('N')
+        token = resolve_token(master, instrument_name, stored_token)
+        if token is None:
+            logging.error(f"Skipping order placement for {instrument_name}: DynamoDB token {stored_token} and "
+                          f"instrument master token {master.token_for(instrument_name)} do not agree on one token.")
+            continue
+
+        orders.append((stock, build_default_order(stock, default_quantity, token)))
+    return orders
+
+# Function to get today's moment in IST for a clock time like "09:15"
+def ist_today_at(clock):
+    import pytz
+    ist = pytz.timezone('Asia/Kolkata')
+    return ist.localize(datetime.combine(datetime.now(ist).date(), datetime.strptime(clock, '%H:%M').time()))
+
+# Function to run the whole default-buy job
+@run('default_buy')
+def run_default_buy(release_at=None):
+    """Place the default-quantity orders for all eligible stocks and log the resulting positions.
+
+    With release_at (an aware datetime, e.g. the 9:15 IST open) the job warms up first: it validates the
+    token, opens the broker connections, loads the eligible set and the instrument master and builds
+    every order, then sends the whole batch at release_at. Without it the orders go out as soon as
+    they are built, and the time to the first order is measured from the start of the job.
+    """
+    started = time.perf_counter()
+    with span('warm_up'):
+        if release_at is not None:
+            warm_broker_connections()
+            get_master()
+        with span('scan'):
+            eligible_stocks = fetch_eligible_stocks_from_dynamodb()
+        orders = build_default_orders(eligible_stocks)
 
     if not eligible_stocks:  # If no eligible stocks are found
         logging.info("No eligible stocks found.")
+        return
+
+    # Journal every order so a restarted run never buys the same stock twice in a day
+    with OrderJournal() as journal:
+        # Apply earlier days' fills whose update failed; today's orders are placed regardless
+        settle_earlier_orders(client, journal, DEFAULT_ORDER_PREFIX,
+                              lambda key: stock_for_key(eligible_stocks, key), apply_default_fills)
+        execute_orders(
+            client, orders,
+            place_fn=trigger_order_via_sdk,
+            on_fills=apply_default_fills,
+            journal=journal,
+            order_key=default_order_key,
+            release_at=release_at,
+            started_at=None if release_at is not None else started
+        )
+
+    fetch_positions(client)
+
+# The main script execution starts here
+# Usage: python rupeezy/main.py [--release HH:MM]  (warm up now, send the orders at HH:MM IST)
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 2 and sys.argv[1] == '--release':
+        run_default_buy(release_at=ist_today_at(sys.argv[2]))
     else:
-        with open("order_ids.txt", "w") as order_file:
-            for stock in eligible_stocks:
-                default_quantity = int(stock.get('DefaultQuantity', {}).get('N', 0))
-                base_value = Decimal(stock.get('BaseValue', {}).get('N', -1))  # Get BaseValue, default to -1
-                first_day_processed = stock.get('FirstDayProcessed', {}).get('BOOL', False)
-
-                if default_quantity == 0:
-                    logging.info(f"Skipping order placement for {stock['InstrumentName']['S']} as DefaultQuantity is 0.")
-                    continue
-
-                order_details = {
-                    "exchange": "NSE_EQ",
-                    "token": int(stock['Token']['N']),
-                    "symbol": stock['InstrumentName']['S'],
-                    "transaction_type": "BUY",
-                    "product": "MTF",
-                    "variety": "RL-MKT",
-                    "quantity": default_quantity,
-                    "price": 0.0,
-                    "trigger_price": 0.0,
-                    "disclosed_quantity": 0,
-                    "validity": "DAY",
-                    "validity_days": 1,
-                    "is_amo": False
-                }
-
-                # Place the order and get the response
-                response = trigger_order_via_sdk(client, order_details)
-                if response:
-                    order_id = response['data']['orderId']  # Extract the order ID from the response
-                    logging.info(f"Order placed successfully for {stock['InstrumentName']['S']}: {response}")
-                    order_file.write(f"{order_id}\n")
-                    
-                    # Add a sleep to wait before fetching order details
-                    time.sleep(10)  # Wait 10 seconds before fetching order details
-                    
-                    order_details_response = fetch_order_details(client, order_id)
-
-                    # Only update BaseValue if it's less than or equal to 0 or missing (null)
-                    if base_value <= 0:
-                        if order_details_response and 'data' in order_details_response:
-                            base_value = order_details_response['data'][0].get('order_price', 0)  # Extract the order price as the BaseValue
-                            update_base_value_in_dynamodb(stock['InstrumentName']['S'], base_value)
-                            update_first_day_processed_flag(stock['InstrumentName']['S'])  # Set the FirstDayProcessed flag to True
-                            logging.info(f"BaseValue for {stock['InstrumentName']['S']} updated to {base_value}")
-                    else:
-                        logging.info(f"BaseValue and FirstDayProcessed are already set for {stock['InstrumentName']['S']}. Skipping BaseValue update.")
-                else:
-                    logging.error(f"Order placement failed for {stock['InstrumentName']['S']}")
-        
-        fetch_positions(client)
+        run_default_buy()
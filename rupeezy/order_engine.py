@@ -0,0 +1,290 @@
+# Order execution engine shared by main.py and price_drop.py.
+# Orders are submitted concurrently through a bounded thread pool and fills are collected
+# separately by reconciling against the order book (see fill_tracker.py), so a run costs roughly
+# the time of its slowest order instead of the sum of all of them. Every poll round hands the
+# orders that finished in that round back to the caller through on_fills, which is where the
+# scripts write their BaseValue / FirstDayProcessed updates in one pass. With an order journal
+# (order_journal.py) every order is recorded before it is sent, so a restarted run reconciles the
+# orders it already placed instead of buying them again.
+#
+# With release_at, everything up to the broker call (journal reconciliation, worker threads) is done
+# first and the workers are held until that moment, so a prepared batch goes out at once, e.g. at the
+# market open. Each run records time_to_first_order and time_to_last_order (broker acknowledgements,
+# measured from the release, or from started_at) in the run summary.
+
+import time
+import logging
+import threading
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fill_tracker import (track_fills, fetch_order_book, fetch_order, order_status, average_fill_price,
+                          FILLED_STATUSES, TERMINAL_STATUSES)
+from order_journal import FILLED, APPLIED, FAILED
+from instrumentation import span, record_phase
+
+# Upper bound on concurrent broker calls made by a single run
+DEFAULT_MAX_WORKERS = 8
+
+
+def _variety(details):
+    variety = details.get('variety')
+    return getattr(variety, 'value', variety)
+
+
+# Function to check whether an order book entry looks like the order described by order details
+def _matches(order, order_details):
+    quantity = order.get('total_quantity', order.get('quantity'))
+    return (str(order.get('token')) == str(order_details['token'])
+            and quantity is not None and int(quantity) == int(order_details['quantity'])
+            # A market order must not be matched to a resting limit order of the same size
+            and (None in (_variety(order), _variety(order_details)) or _variety(order) == _variety(order_details)))
+
+
+# Function to rebuild the order book entry of a fill recorded in the journal
+def journaled_fill(entry):
+    return {'order_id': entry['order_id'], 'token': entry.get('token'), 'quantity': entry.get('quantity'),
+            'traded_quantity': entry.get('quantity'), 'status': 'EXECUTED', 'average_price': entry['price']}
+
+
+# Function to sort a run's orders against the journal before anything is placed
+def reconcile_with_journal(client, journal, orders, order_key):
+    """Split orders into (to_place, in_flight, filled).
+
+    to_place lists (key, context, order_details) for orders that have to be sent. in_flight maps the
+    broker order ID -> (key, context) of orders an earlier run already placed, which only need their
+    fills tracked. filled maps the order ID -> (key, context, order) of fills the journal recorded but
+    whose update was never applied (possibly on an earlier day, when the order book no longer lists
+    them). An order placed on an earlier day is looked up by its ID, since it is final by now.
+    Orders whose fill was already applied are dropped. An intent without a broker ID (crash
+    between sending and journaling) is only sent again if the order book has no order it could have
+    become; an order the journal does not know is never claimed, since it may have been placed by hand.
+    """
+    to_place, in_flight, filled, orphans = [], {}, {}, []
+    today = date.today().isoformat()
+    for context, order_details in orders:
+        key = order_key(context)
+        entry = journal.get(key)
+        if entry is None or entry['state'] == FAILED:
+            to_place.append((key, context, order_details))
+        elif entry['state'] == APPLIED:
+            logging.info(f"Order for {context} ({key}) was already filled and applied; not placing it again.")
+        elif entry['state'] == FILLED and entry.get('order_id') and entry.get('price') is not None:
+            logging.info(f"Applying the journaled fill of order {entry['order_id']} for {context}.")
+            filled[entry['order_id']] = (key, context, journaled_fill(entry))
+        elif entry.get('order_id') and entry.get('day') not in (None, today):
+            order = fetch_order(client, entry['order_id'])
+            if order is None or order_status(order) not in TERMINAL_STATUSES:
+                logging.error(f"Could not find the final status of order {entry['order_id']} for {context} "
+                              f"from {entry['day']}; not placing it this run.")
+            elif average_fill_price(order) is not None:
+                logging.info(f"Applying the fill of order {entry['order_id']} for {context} from {entry['day']}.")
+                filled[entry['order_id']] = (key, context, order)
+            else:
+                journal.record_failed(key, order_status(order))
+                to_place.append((key, context, order_details))
+        elif entry.get('order_id'):
+            logging.info(f"Reconciling order {entry['order_id']} for {context} from an earlier run.")
+            in_flight[entry['order_id']] = (key, context)
+        else:
+            orphans.append((key, context, order_details))
+
+    if orphans:
+        try:
+            book = fetch_order_book(client)
+        except Exception as e:
+            logging.error(f"Error fetching order book to reconcile {len(orphans)} unconfirmed orders: {str(e)}")
+            book = None
+        journaled = journal.order_ids()
+        for key, context, order_details in orphans:
+            if book is None:
+                # Without the order book a resend could double-buy; leave it for the next run
+                logging.error(f"Order for {context} ({key}) may have been sent; skipping it this run.")
+                continue
+            candidates = [order_id for order_id, order in book.items()
+                          if order_id not in journaled and _matches(order, order_details)]
+            if not candidates:
+                to_place.append((key, context, order_details))
+                continue
+            # Either the lost order or a manual one: neither claim it nor risk buying twice
+            logging.error(f"Order for {context} ({key}) may have been sent as one of {sorted(candidates)}; "
+                          f"check the order book. Not placing it this run.")
+    return to_place, in_flight, filled
+
+
+# Function to hand a round of finished orders to on_fills and journal the outcome
+def _report_fills(journal, on_fills, placed, finished):
+    """placed maps order ID -> (key, context); finished maps order ID -> order book entry."""
+    fills = [(placed[order_id][1], order_id, order) for order_id, order in finished.items()]
+    if journal is not None:
+        for order_id, order in finished.items():
+            journal.record_filled(placed[order_id][0], average_fill_price(order))
+    try:
+        not_applied = set(on_fills(fills) or ())
+    except Exception as e:
+        logging.error(f"Error applying fills for orders {sorted(finished)}: {str(e)}")
+        return
+    if journal is not None:
+        for order_id, order in finished.items():
+            key = placed[order_id][0]
+            if order_id in not_applied:
+                continue  # Left as filled; the next run applies it again
+            if order_status(order) in FILLED_STATUSES:
+                journal.record_applied(key)
+            else:
+                journal.record_failed(key, order_status(order))
+
+
+# Function to settle the orders earlier days' runs left unfinished under a key prefix
+def settle_earlier_orders(client, journal, prefix, context_of, on_fills):
+    """Apply the fills of orders placed on an earlier day whose update was never applied.
+
+    For jobs whose keys carry the day (e.g. the default buy), today's orders never see these
+    entries, so they are settled here before planning. Each unfinished entry under prefix from an
+    earlier day is resolved from its journaled fill price or by looking its order ID up, and its
+    fill goes to on_fills with the context context_of(key) returns. Orders that did not fill, or
+    that never got an order ID, are marked failed. Entries without a context or without a readable
+    final status are left for a later run. Returns the order IDs whose fills were reported.
+    """
+    today = date.today().isoformat()
+    placed, finished = {}, {}
+    for key, entry in list(journal.entries.items()):
+        if (not key.startswith(prefix) or entry.get('day') in (None, today)
+                or entry['state'] in (APPLIED, FAILED)):
+            continue
+        context = context_of(key)
+        if context is None:
+            logging.warning(f"No context for the journaled order {key} from {entry['day']}; leaving it.")
+            continue
+        if not entry.get('order_id'):
+            # A day order that never got its ID is over; today's order replaces it
+            logging.error(f"Order for {context} ({key}) from {entry['day']} has no order ID; "
+                          f"check the trade history. Marking it failed.")
+            journal.record_failed(key, 'unconfirmed')
+            continue
+        if entry['state'] == FILLED and entry.get('price') is not None:
+            order = journaled_fill(entry)
+        else:
+            order = fetch_order(client, entry['order_id'])
+            if order is None or order_status(order) not in TERMINAL_STATUSES:
+                logging.error(f"Could not find the final status of order {entry['order_id']} for {context} "
+                              f"from {entry['day']}; leaving it for a later run.")
+                continue
+        logging.info(f"Settling order {entry['order_id']} for {context} from {entry['day']}.")
+        placed[entry['order_id']] = (key, context)
+        finished[entry['order_id']] = order
+    if finished:
+        _report_fills(journal, on_fills, placed, finished)
+    return list(finished)
+
+
+# Function to sleep until an aware datetime (returns at once if it has passed)
+def wait_until(moment):
+    while True:
+        remaining = moment.timestamp() - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 30))
+
+
+# Function to submit a batch of orders concurrently and collect their fills
+def execute_orders(client, orders, place_fn, on_fills, journal=None, order_key=None,
+                   max_workers=DEFAULT_MAX_WORKERS, fill_timeout=60, release_at=None, started_at=None):
+    """Place all orders concurrently and report fills as they arrive.
+
+    orders is a list of (context, order_details) pairs. The context is opaque to the engine and is
+    handed back unchanged. place_fn(client, order_details) is the script's own broker wrapper.
+    on_fills(fills) is called once per order book poll round with a list of
+    (context, order_id, order) tuples for the orders that reached a terminal state in that round, and
+    may return the order IDs whose update could not be applied. With a journal (order_journal.OrderJournal), order_key(context) gives each order's idempotency
+    key: every order is journaled before it is sent and orders left unfinished by an earlier run
+    are reconciled instead of placed again. With release_at (an aware datetime) the orders are held
+    until then and sent together. started_at (a time.perf_counter() value, e.g. the start of the job)
+    is where the time to the first and last order is measured from; the release otherwise.
+    Returns the list of order IDs that were placed or reconciled.
+    """
+    if not orders:
+        return []
+
+    if journal is not None:
+        to_place, placed, journaled_fills = reconcile_with_journal(client, journal, orders, order_key)
+    else:
+        to_place, placed, journaled_fills = [(None, context, order_details) for context, order_details in orders], {}, {}
+
+    release = threading.Event()
+    aborted = threading.Event()  # Set when the release wait failed; held orders are then dropped
+    acknowledged = []  # perf_counter() of every accepted order
+
+    # Function to journal and send one order
+    def place(key, order_details):
+        if journal is not None:
+            journal.record_intent(key, order_details)
+        release.wait()
+        if aborted.is_set():
+            if journal is not None:
+                journal.record_failed(key, 'release aborted')
+            return None
+        response = place_fn(client, order_details)
+        if response:
+            acknowledged.append(time.perf_counter())
+        if journal is not None:
+            if response:
+                journal.record_placed(key, response['data']['orderId'])
+            else:
+                journal.record_failed(key, 'not placed')
+        return response
+
+    with span('order_submit'), ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(place, key, order_details): (key, context) for key, context, order_details in to_place}
+        if release_at is not None and futures:
+            logging.info(f"{len(futures)} orders prepared; holding them until {release_at.isoformat(timespec='seconds')}.")
+            try:
+                with span('release_wait'):
+                    wait_until(release_at)
+            except BaseException:
+                aborted.set()
+                raise
+            finally:
+                # Always wake the workers, otherwise the executor's shutdown waits on them forever
+                release.set()
+        released = time.perf_counter()
+        release.set()
+        for future in as_completed(futures):
+            key, context = futures[future]
+            try:
+                response = future.result()
+            except Exception as e:
+                logging.error(f"Unexpected error placing order for {context}: {str(e)}")
+                continue
+            if not response:
+                logging.error(f"Order placement failed for {context}")
+                continue
+
+            order_id = str(response['data']['orderId'])
+            placed[order_id] = (key, context)
+            logging.info(f"Order {order_id} placed for {context}")
+
+    if acknowledged:
+        reference = released if started_at is None else started_at
+        first, last = min(acknowledged) - reference, max(acknowledged) - reference
+        record_phase('time_to_first_order', first)
+        record_phase('time_to_last_order', last)
+        logging.info(f"First order acknowledged after {first * 1000:.0f} ms, last after {last * 1000:.0f} ms "
+                     f"({len(acknowledged)} orders).")
+
+    # Callback for the fill tracker: attach each finished order to its context
+    def report(finished):
+        _report_fills(journal, on_fills, placed, finished)
+
+    if journaled_fills:
+        for order_id, (key, context, _) in journaled_fills.items():
+            placed[order_id] = (key, context)
+        report({order_id: order for order_id, (_, _, order) in journaled_fills.items()})
+    tracked = {order_id: entry for order_id, entry in placed.items() if order_id not in journaled_fills}
+    if tracked:
+        with span('fill_wait'):  # Includes the on_fills updates made while waiting
+            _, unresolved = track_fills(client, tracked, on_terminal=report, timeout=fill_timeout)
+        for order_id in unresolved:
+            logging.error(f"No terminal status for order {order_id} ({placed[order_id][1]}); state not updated.")
+
+    return list(placed)
@@ -0,0 +1,167 @@
+# Crash-safe order journal.
+# main.py and price_drop.py used to truncate order_ids.txt on every run, so an order placed just
+# before a crash was forgotten and bought again on the next run. Every order now goes through an
+# append-only journal of compact JSON lines, keyed by an idempotency key the caller derives from
+# what the order is for (job, day or BaseValue, instrument). A fill whose DynamoDB update failed is
+# still applied by a later day's run (see order_engine.settle_earlier_orders for day-keyed jobs):
+#   intent  - written and fsynced before the order is sent
+#   placed  - the broker's order ID
+#   filled  - the terminal status and average price from the order book
+#   applied - the DynamoDB update for the fill is done
+#   failed  - the order was not placed or did not fill; the key may be retried
+# Concurrent writers share fsyncs (group commit). On the next run the journal is replayed and
+# unfinished orders are reconciled against the order book instead of being placed again.
+# Replay drops applied and failed orders of earlier days, and unfinished ones once they are older than
+# JOURNAL_RETENTION_DAYS, so the file stays small.
+
+import os
+import json
+import logging
+import threading
+from datetime import date, timedelta
+
+# Default journal location (ORDER_JOURNAL overrides it)
+DEFAULT_JOURNAL_PATH = os.getenv('ORDER_JOURNAL', 'order_journal.jsonl')
+
+# Journal states
+INTENT = 'intent'
+PLACED = 'placed'
+FILLED = 'filled'
+APPLIED = 'applied'
+FAILED = 'failed'
+
+# States in which nothing is left to do for the key
+FINISHED_STATES = {APPLIED, FAILED}
+
+# Days an unfinished order (intent, placed, filled) is kept for a later run to resolve
+JOURNAL_RETENTION_DAYS = int(os.getenv('JOURNAL_RETENTION_DAYS', '7'))
+
+
+class OrderJournal:
+    """Append-only order journal with group-committed writes and replay on open."""
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self.entries = {}  # key -> latest known state of the order
+        self._replay()
+        self._file = open(path, 'a')
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._appended = 0  # Records handed to the journal
+        self._synced = 0    # Records known to be on disk
+        self._flushing = False
+
+    # Function to rebuild the entries from the file and drop finished orders of earlier days
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        records, stale = [], False
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    stale = True  # Torn last line from a crash; rewrite without it
+                    continue
+                records.append(record)
+                self._apply(record)
+
+        today = date.today()
+        expired = (today - timedelta(days=JOURNAL_RETENTION_DAYS)).isoformat()
+        keep = set()
+        for key, entry in self.entries.items():
+            day = entry.get('day') or today.isoformat()
+            if day == today.isoformat() or (entry['state'] not in FINISHED_STATES and day > expired):
+                keep.add(key)
+            elif entry['state'] not in FINISHED_STATES:
+                logging.warning(f"Dropping journaled order {key} ({entry['state']}, {day}) that was never resolved.")
+        if stale or len(keep) < len(self.entries):
+            self.entries = {key: entry for key, entry in self.entries.items() if key in keep}
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as journal_file:
+                for record in records:
+                    if record['k'] in keep:
+                        journal_file.write(json.dumps(record, separators=(',', ':')) + "\n")
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            os.replace(temp_path, self.path)
+
+    def _apply(self, record):
+        entry = self.entries.setdefault(record['k'], {'day': record.get('d'), 'order_id': None})
+        entry['state'] = record['s']
+        for field, name in (('d', 'day'), ('id', 'order_id'), ('tok', 'token'), ('q', 'quantity'), ('p', 'price')):
+            if field in record:
+                entry[name] = record[field]
+
+    # Function to append a record, waiting until it is on disk when sync is set
+    def _append(self, record, sync=True):
+        with self._cond:
+            self._apply(record)
+            self._buffer.append(json.dumps(record, separators=(',', ':')) + "\n")
+            self._appended += 1
+            sequence = self._appended
+            if not sync:
+                return
+            # Group commit: one writer flushes everything buffered so far, the others wait for it
+            while self._synced < sequence:
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+                self._flushing = True
+                batch, self._buffer = self._buffer, []
+                upto = self._appended
+                self._cond.release()
+                try:
+                    self._file.write(''.join(batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except BaseException:
+                    self._cond.acquire()
+                    # Not known to be on disk: put the records back for the next flush (replay tolerates repeats)
+                    self._buffer = batch + self._buffer
+                    self._flushing = False
+                    self._cond.notify_all()
+                    raise
+                self._cond.acquire()
+                self._flushing = False
+                self._synced = upto
+                self._cond.notify_all()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def record_intent(self, key, order_details):
+        self._append({'k': key, 's': INTENT, 'd': date.today().isoformat(),
+                      'tok': int(order_details['token']), 'q': int(order_details['quantity'])})
+
+    def record_placed(self, key, order_id):
+        self._append({'k': key, 's': PLACED, 'id': str(order_id)})
+
+    def record_filled(self, key, price):
+        # Not synced on its own: the applied record that follows is
+        self._append({'k': key, 's': FILLED, 'p': None if price is None else str(price)}, sync=False)
+
+    def record_applied(self, key):
+        self._append({'k': key, 's': APPLIED})
+
+    def record_failed(self, key, reason=None):
+        self._append({'k': key, 's': FAILED, **({'r': reason} if reason else {})})
+
+    def order_ids(self):
+        """Broker order IDs known to the journal."""
+        return {entry['order_id'] for entry in self.entries.values() if entry.get('order_id')}
+
+    def close(self):
+        with self._cond:
+            if self._buffer:
+                self._file.write(''.join(self._buffer))
+                self._buffer = []
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,111 @@
+# Funds-aware planning of the additional-quantity buys.
+# process_additional_quantity used to decide and spend in one loop: walking the candidates in scan
+# order, it subtracted each order's cost from available_funds as it went, so when funds were short the
+# scan order decided who got capital. plan_additional_orders separates the decision. It takes the
+# candidates' BaseValues, AdditionalQuantities, the batched prices and one funds snapshot, and in one
+# vectorized pass computes every instrument's drop, levels crossed, quantity and cost. It then ranks
+# the triggered instruments (deepest drop first by default) and allocates the budget in that order.
+# The result is an immutable OrderPlan that the caller turns into orders and submits in bulk.
+#
+# ORDER_PLAN_RANK selects the ranking: 'drop' (deepest percentage drop first), 'levels' (most ladder
+# levels crossed first, then drop) or 'scan' (candidate order, the old behaviour).
+
+import os
+
+import numpy as np
+
+ORDER_PLAN_RANK = os.getenv('ORDER_PLAN_RANK', 'drop')
+
+
+# Function to compute the order in which triggered rows are funded
+def rank_rows(rows, drops, multipliers, rank=ORDER_PLAN_RANK):
+    """Return rows sorted by priority; ties keep the candidate order."""
+    if rank == 'scan':
+        return rows
+    if rank == 'drop':
+        return rows[np.argsort(-drops[rows], kind='stable')]
+    if rank == 'levels':
+        return rows[np.lexsort((-drops[rows], -multipliers[rows]))]
+    raise ValueError(f"Unknown order plan ranking: {rank}")
+
+
+# Function to hand out the budget to ranked rows
+def allocate(ranked, costs, funds):
+    """Fund the ranked rows in order, skipping any that no longer fit; returns (funded, unfunded, remaining).
+
+    The affordable prefix is found with one cumulative sum; only the rows after it are checked one by one,
+    so smaller orders further down can still use what the first unaffordable one left over.
+    """
+    spent = np.cumsum(costs[ranked])
+    prefix = int(np.searchsorted(spent, funds, side='right'))
+    funded = list(ranked[:prefix])
+    remaining = funds - (spent[prefix - 1] if prefix else 0.0)
+    unfunded = []
+    for row in ranked[prefix:]:
+        if costs[row] <= remaining:
+            funded.append(row)
+            remaining -= costs[row]
+        else:
+            unfunded.append(row)
+    return np.array(funded, dtype=np.int64), np.array(unfunded, dtype=np.int64), remaining
+
+
+def _frozen(values, dtype):
+    array = np.array(values, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+class OrderPlan:
+    """Immutable result of one planning pass: the funded rows in submission order and what they cost.
+
+    rows index the candidate list given to plan_additional_orders. multipliers, quantities, costs and
+    drops are aligned with rows. unfunded lists the triggered rows the budget did not cover.
+    """
+
+    __slots__ = ('rows', 'multipliers', 'quantities', 'costs', 'drops', 'unfunded', 'funds', 'remaining_funds')
+
+    def __init__(self, rows, multipliers, quantities, costs, drops, unfunded, funds, remaining_funds):
+        for name, values, dtype in (('rows', rows, np.int64), ('multipliers', multipliers, np.int64),
+                                    ('quantities', quantities, np.int64), ('costs', costs, float),
+                                    ('drops', drops, float), ('unfunded', unfunded, np.int64)):
+            object.__setattr__(self, name, _frozen(values, dtype))
+        object.__setattr__(self, 'funds', float(funds))
+        object.__setattr__(self, 'remaining_funds', float(remaining_funds))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("OrderPlan is immutable")
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        """Yield (row, multiplier, quantity, cost, drop) per funded order, in submission order."""
+        return zip(self.rows.tolist(), self.multipliers.tolist(), self.quantities.tolist(),
+                   self.costs.tolist(), self.drops.tolist())
+
+    def total_cost(self):
+        return float(self.costs.sum())
+
+
+# Function to plan one run's additional-quantity orders
+def plan_additional_orders(base_values, additional_quantities, prices, available_funds, book, rank=ORDER_PLAN_RANK):
+    """Decide every additional-quantity buy of a run in one pass.
+
+    base_values, additional_quantities and prices are aligned with the rows of book (a ladder.LadderBook);
+    missing prices are NaN. available_funds is the funds snapshot (float('inf') when unknown); the
+    book is only read.
+    """
+    base_values = np.asarray(base_values, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    multipliers = book.crossed(prices)
+    quantities = multipliers * np.asarray(additional_quantities, dtype=np.int64)
+    with np.errstate(invalid='ignore'):
+        costs = prices * quantities
+        drops = (base_values - prices) / base_values * 100
+
+    triggered = np.flatnonzero((quantities > 0) & ~np.isnan(prices))
+    ranked = rank_rows(triggered, drops, multipliers, rank)
+    funded, unfunded, remaining = allocate(ranked, costs, float(available_funds))
+    return OrderPlan(funded, multipliers[funded], quantities[funded], costs[funded], drops[funded],
+                     unfunded, available_funds, remaining)
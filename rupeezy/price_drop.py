@@ -6,132 +6,82 @@
 # This ensures there are no contradictions or unnecessary actions taken. Only eligible stocks with valid BaseValue, having passed the first-day order, and with a non-zero AdditionalQuantity, are considered for further orders based on price drops.
 
 import logging
-import boto3
 from decimal import Decimal, ROUND_HALF_UP
-from vortex_api import AsthaTradeVortexAPI, Constants as Vc
 import os
-from botocore.exceptions import ClientError
-import time
+from quotes import fetch_current_prices
+from order_engine import execute_orders
+from order_plan import plan_additional_orders
+from fill_tracker import average_traded_price
+from stock_index import fetch_additional_candidates as query_additional_candidates, stock_key, sort_key_of, DEFAULT_SORT_KEY
+from instruments import get_master, resolve_token
+from clients import LazyClient, get_broker_client, get_stock_table, get_stock_mirror
+from state_mirror import modified_at
+from order_journal import OrderJournal
+from instrumentation import run, span
 
 # Set up basic logging configuration
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-# Initialize a connection to DynamoDB
-dynamodb = boto3.resource('dynamodb', region_name='ap-south-1')
-table = dynamodb.Table('StockEligibility')
-
-# Initialize the broker API client
-api_secret = os.getenv('RUPEEZY_API_KEY')
-application_id = os.getenv('RUPEEZY_APPLICATION_ID')
-access_token = os.getenv('RUPEEZY_ACCESS_TOKEN')
-
-if not api_secret or not application_id or not access_token:
-    logging.error("API credentials are missing. Exiting script.")
-    exit(1)
-
-client = AsthaTradeVortexAPI(api_secret, application_id)
-client.access_token = access_token
-
-# Function to fetch the current stock price
-def get_current_price(instrument_token):
-    retries = 3
-    delay = 5
-    for attempt in range(retries):
-        try:
-            response = client.quotes([f"NSE_EQ-{instrument_token}"], mode=Vc.QuoteModes.LTP)
-            logging.debug(f"Full response from quotes API for token {instrument_token}: {response}")
-            if 'data' not in response or f"NSE_EQ-{instrument_token}" not in response['data']:
-                logging.error(f"Missing data or token key in response for token {instrument_token}: {response}")
-                return None
-            ltp = response['data'][f"NSE_EQ-{instrument_token}"].get('last_trade_price', 0)
-            if ltp == 0:
-                logging.error(f"Received LTP as 0 for token {instrument_token}: {response}")
-                return None
-            price = Decimal(ltp).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            return price
-        except Exception as e:
-            logging.error(f"Error fetching current price for token {instrument_token}: {str(e)}. Attempt {attempt + 1} of {retries}")
-            if attempt < retries - 1:
-                time.sleep(delay)
-            else:
-                return None
-
-# Function to check available funds with retry mechanism
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# Shared StockEligibility table resource and broker API client, both built on first use; the broker
+# client needs RUPEEZY_API_KEY and RUPEEZY_APPLICATION_ID, and its access token comes from login.py
+table = LazyClient(get_stock_table)
+client = LazyClient(get_broker_client)
+
+# Function to check available funds (retries happen in the shared client)
 def check_available_funds():
-    retries = 5  # Set the number of retries to 5
-    delay = 5  # Delay between retries in seconds
-    for attempt in range(retries):
-        try:
-            response = client.funds()
-            logging.debug(f"Full response from funds API: {response}")
-            available_funds = Decimal(response.get('nse', {}).get('net_available', 0))
-            return available_funds
-        except Exception as e:
-            logging.error(f"Error fetching available funds: {str(e)}. Attempt {attempt + 1} of {retries}")
-            if attempt < retries - 1:  # Retry if not the last attempt
-                time.sleep(delay)
-            else:
-                return None  # Return None if all retries fail
+    try:
+        response = client.funds()
+        logging.debug("Full response from funds API: %s", response)
+        available_funds = Decimal(response.get('nse', {}).get('net_available', 0))
+        return available_funds
+    except Exception as e:
+        logging.error(f"Error fetching available funds: {str(e)}")
+        return None  # Return None if the call failed after the client's retries
 
 # Function to calculate percentage drop
 def calculate_percentage_drop(base_value, current_price):
     return ((base_value - current_price) / base_value) * 100
 
-# Function to fetch order details with retry logic
-def fetch_order_details_with_retry(client, order_id):
-    retries = 3
-    delay = 5
-    for attempt in range(retries):
-        try:
-            response = client.order_history(order_id)
-            logging.info(f"Order Details for {order_id}: {response}")
-            return response
-        except Exception as e:
-            logging.error(f"Error fetching order details for {order_id}: {str(e)}. Attempt {attempt + 1} of {retries}")
-            if attempt < retries - 1:
-                time.sleep(delay)
-            else:
-                return None
-
 # Function to update BaseValue in DynamoDB
-def update_base_value_in_dynamodb(instrument_name, base_value):
+def update_base_value_in_dynamodb(instrument_name, base_value, sort_key=DEFAULT_SORT_KEY):
     try:
         # Round the base_value to two decimal places before updating
         rounded_base_value = Decimal(base_value).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         table.update_item(
-            Key={
-                'InstrumentName': instrument_name,
-                'Eligibility': 'Eligible'  # Ensure you're using the correct sort key here
-            },
-            UpdateExpression="SET BaseValue = :bv",
-            ExpressionAttributeValues={':bv': rounded_base_value}
+            Key=stock_key(instrument_name, sort_key, low_level=False),  # The row's own sort key
+            UpdateExpression="SET BaseValue = :bv, ModifiedAt = :ma",
+            ExpressionAttributeValues={':bv': rounded_base_value, ':ma': modified_at()}
         )
         logging.info(f"Updated BaseValue for {instrument_name} to {rounded_base_value}.")
+        return True
     except Exception as e:
         logging.error(f"Error updating BaseValue for {instrument_name}: {str(e)}")
+        return False
 
 
-# Main function to process additional quantity logic
-def process_additional_quantity():
-    available_funds = check_available_funds()
-    if available_funds is None:
-        logging.warning("Unable to retrieve available funds. Continuing without funds check.")
-        available_funds = Decimal('Infinity')  # Set it to a high value so that funds limit is not a constraint
-
-    with open("order_ids.txt", "w") as order_file:
-        try:
-            response = table.scan(
-                FilterExpression="EligibilityStatus = :status AND AdditionalQuantity > :qty",
-                ExpressionAttributeValues={':status': 'Eligible', ':qty': Decimal('0')}
+# Function to fetch the instruments that can be evaluated for additional quantity
+def fetch_additional_candidates():
+    """Return (instrument, token, additional_quantity, base_value, sort_key) for every stock that qualifies, or None on error."""
+    from botocore.exceptions import ClientError
+    try:
+        mirror = get_stock_mirror()
+        if mirror is not None:
+            # Served from the mirror's (EligibilityStatus, AdditionalQuantity) index
+            mirror.sync()
+            items = mirror.query(status='Eligible', additional_quantity_above=0, plain=True)
+        else:
+            # Query the sparse index of rows that have an AdditionalQuantity
+            items = query_additional_candidates(
+                table, 'Eligible',
+                attributes=('InstrumentName', 'Eligibility', 'Token', 'AdditionalQuantity', 'FirstDayProcessed', 'BaseValue'),
+                low_level=False
             )
-            items = response.get('Items', [])
-        except ClientError as e:
-            logging.error(f"Error scanning DynamoDB table: {e}")
-            return
 
+        master = get_master()
+        candidates = []
         for item in items:
             instrument = item.get('InstrumentName', '')
-            instrument_token = int(item.get('Token', 0))
+            instrument_token = resolve_token(master, instrument, item.get('Token'))
             additional_quantity = int(item.get('AdditionalQuantity', 0))
             first_day_processed = item.get('FirstDayProcessed', False)
             base_value = item.get('BaseValue', None)
@@ -145,76 +95,120 @@ def process_additional_quantity():
             if additional_quantity == 0:
                 logging.info(f"Skipping {instrument} - AdditionalQuantity is 0.")
                 continue
+            if not instrument_token:
+                logging.error(f"Skipping {instrument} - DynamoDB token {item.get('Token')} and instrument master "
+                              f"token {master.token_for(instrument)} do not agree on one token.")
+                continue
+            if item.get('Token') is not None and int(item['Token']) != instrument_token:
+                logging.warning(f"Token mismatch for {instrument}: DynamoDB has {item['Token']}, instrument master has {instrument_token}.")
+
+            candidates.append((instrument, instrument_token, additional_quantity, Decimal(base_value), sort_key_of(item)))
+        return candidates
+    except ClientError as e:
+        logging.error(f"Error scanning DynamoDB table: {e}")
+        return None
+
+# Main function to process additional quantity logic
+@run('price_drop')
+def process_additional_quantity():
+    import numpy as np
+    from ladder import LadderBook
+
+    available_funds = check_available_funds()
+    if available_funds is None:
+        logging.warning("Unable to retrieve available funds. Continuing without funds check.")
+        available_funds = Decimal('Infinity')  # Set it to a high value so that funds limit is not a constraint
+
+    # Journal every order so a restarted run reconciles instead of buying the same level twice
+    with OrderJournal() as journal:
+        # Keep only the instruments that can be evaluated at all
+        with span('scan'):
+            candidates = fetch_additional_candidates()
+        if not candidates:
+            return
 
-            base_value = Decimal(base_value)
-            current_price = get_current_price(instrument_token)
-            if current_price is None:
+        # Fetch the LTP of every candidate in batched quote requests
+        prices = fetch_current_prices(client, [candidate[1] for candidate in candidates])
+
+        for instrument, instrument_token, *_ in candidates:
+            if instrument_token not in prices:
                 logging.info(f"Could not fetch the current price for {instrument}. Skipping.")
-                continue
 
-            percentage_drop = calculate_percentage_drop(base_value, current_price)
-            total_cost = current_price * additional_quantity
-
-            if percentage_drop >= 3:
-                total_cost = current_price * 3 * additional_quantity
-                if total_cost <= available_funds:
-                    logging.info(f"{instrument} is down by {percentage_drop:.2f}% - Buying 3x AdditionalQuantity ({3 * additional_quantity} units)")
-                    response = trigger_order_via_sdk(client, prepare_order_details(instrument_token, 3 * additional_quantity))
-                    if response:
-                        order_id = response['data']['orderId']
-                        order_file.write(f"{order_id}\n")
-                        time.sleep(5)
-                        order_details_response = fetch_order_details_with_retry(client, order_id)
-                        if order_details_response:
-                            executed_price = order_details_response['data'][0].get('order_price', None)
-                            if executed_price:
-                                update_base_value_in_dynamodb(instrument, executed_price)
-                    available_funds -= total_cost
-
-            elif percentage_drop >= 2:
-                total_cost = current_price * 2 * additional_quantity
-                if total_cost <= available_funds:
-                    logging.info(f"{instrument} is down by {percentage_drop:.2f}% - Buying 2x AdditionalQuantity ({2 * additional_quantity} units)")
-                    response = trigger_order_via_sdk(client, prepare_order_details(instrument_token, 2 * additional_quantity))
-                    if response:
-                        order_id = response['data']['orderId']
-                        order_file.write(f"{order_id}\n")
-                        time.sleep(5)
-                        order_details_response = fetch_order_details_with_retry(client, order_id)
-                        if order_details_response:
-                            executed_price = order_details_response['data'][0].get('order_price', None)
-                            if executed_price:
-                                update_base_value_in_dynamodb(instrument, executed_price)
-                    available_funds -= total_cost
-
-            elif percentage_drop >= 1:
-                if total_cost <= available_funds:
-                    logging.info(f"{instrument} is down by {percentage_drop:.2f}% - Buying AdditionalQuantity ({additional_quantity} units)")
-                    response = trigger_order_via_sdk(client, prepare_order_details(instrument_token, additional_quantity))
-                    if response:
-                        order_id = response['data']['orderId']
-                        order_file.write(f"{order_id}\n")
-                        time.sleep(5)
-                        order_details_response = fetch_order_details_with_retry(client, order_id)
-                        if order_details_response:
-                            executed_price = order_details_response['data'][0].get('order_price', None)
-                            if executed_price:
-                                update_base_value_in_dynamodb(instrument, executed_price)
-                    available_funds -= total_cost
-
-            else:
-                logging.info(f"{instrument} is down by {percentage_drop:.2f}% - No action taken")
+        # Plan every order from one funds snapshot: levels, quantities and costs in one vectorized
+        # pass, then the budget goes to the deepest drops first
+        with span('plan'):
+            book = LadderBook([candidate[3] for candidate in candidates])
+            plan = plan_additional_orders(
+                base_values=[candidate[3] for candidate in candidates],
+                additional_quantities=[candidate[2] for candidate in candidates],
+                prices=[float(prices.get(candidate[1], np.nan)) for candidate in candidates],
+                available_funds=available_funds,
+                book=book
+            )
+
+        orders = []
+        for row, multiplier, quantity, _, drop in plan:
+            instrument, instrument_token, _, base_value, sort_key = candidates[row]
+            logging.info(f"{instrument} is down by {drop:.2f}% - Buying {multiplier}x AdditionalQuantity ({quantity} units)")
+            orders.append(((instrument, base_value, sort_key), prepare_order_details(instrument_token, quantity)))
+        for row in plan.unfunded:
+            logging.info(f"{candidates[row][0]} crossed its trigger but is not covered by the available funds.")
+        logging.info(f"Planned {len(plan)} orders costing {plan.total_cost():.2f} of {plan.funds:.2f} available; "
+                     f"{len(plan.unfunded)} left unfunded.")
+
+        # Submit all orders concurrently and update BaseValue as fills arrive
+        execute_orders(
+            client, orders,
+            place_fn=trigger_order_via_sdk,
+            on_fills=apply_additional_fills,
+            journal=journal,
+            order_key=additional_order_key
+        )
+
+# Function to build the idempotency key of an additional-quantity order
+def additional_order_key(context):
+    """One order per instrument and BaseValue: once a fill moves the BaseValue, the next level is a new key."""
+    instrument, base_value = context[0], context[1]  # The stream passes (instrument, base_value) only
+    return f"price_drop:{instrument}:{Decimal(str(base_value)):.2f}"
+
+# Function to update BaseValue from the executed average price for a round of finished orders
+@span('db_write')
+def apply_additional_fills(fills):
+    """Returns the order IDs whose BaseValue update failed, so the order journal retries them."""
+    mirror = get_stock_mirror()
+    not_applied = []
+    queued = {}  # Order IDs per instrument whose update is queued on the mirror
+    for (instrument, _, sort_key), order_id, order in fills:
+        executed_price = average_traded_price(order)  # Part fills of cancelled or expired orders count too
+        if executed_price is None:
+            logging.error(f"Order {order_id} for {instrument} did not fill (status {order.get('status')}).")
+            continue
+        if mirror is not None:
+            rounded_base_value = Decimal(executed_price).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            mirror.update(instrument, sort_key, {'BaseValue': {'N': str(rounded_base_value)}})
+            queued.setdefault(instrument, []).append(order_id)
+        elif not update_base_value_in_dynamodb(instrument, executed_price, sort_key):
+            not_applied.append(order_id)
+
+    # Write the queued updates of this round in one batch
+    if queued:
+        for instrument, _ in mirror.flush():
+            not_applied.extend(queued.get(instrument, []))
+        logging.info(f"Updated BaseValue for {len(queued)} stocks through the mirror.")
+    return not_applied
 
 # Function to prepare the order details for placing an order via the broker's API
-def prepare_order_details(instrument_token, quantity):
+def prepare_order_details(instrument_token, quantity, price=None):
+    """Market order details, or a limit order at price (the resting ladder's orders)."""
+    from vortex_api import Constants as Vc
     return {
         "exchange": Vc.ExchangeTypes.NSE_EQUITY,
         "token": instrument_token,
         "transaction_type": Vc.TransactionSides.BUY,
         "product": Vc.ProductTypes.MTF,
-        "variety": Vc.VarietyTypes.REGULAR_MARKET_ORDER,
+        "variety": Vc.VarietyTypes.REGULAR_MARKET_ORDER if price is None else Vc.VarietyTypes.REGULAR_LIMIT_ORDER,
         "quantity": quantity,
-        "price": 0.0,
+        "price": 0.0 if price is None else float(price),
         "trigger_price": 0.0,
         "disclosed_quantity": 0,
         "validity": Vc.ValidityTypes.FULL_DAY
@@ -224,12 +218,103 @@ def prepare_order_details(instrument_token, quantity):
 def trigger_order_via_sdk(client, order_details):
     try:
         response = client.place_order(**order_details)
-        logging.info(f"Order placed successfully: {response}")
+        logging.debug("Order placed successfully: %s", response)
         return response
     except Exception as e:
         logging.error(f"Error placing order: {str(e)}")
         return None
 
+# Streaming mode: evaluate the ladder on every LTP tick instead of at fixed times
+@run('price_drop_stream')
+def run_price_drop_stream(feed=None):
+    """Subscribe to LTP ticks for every candidate and buy as soon as a ladder level is crossed.
+
+    Pass a streaming.ReplayFeed as feed to replay recorded ticks instead of connecting to the broker.
+    """
+    from vortex_api import Constants as Vc
+    from streaming import PriceDropStream, run_stream
+
+    with span('scan'):
+        candidates = fetch_additional_candidates()
+    if not candidates:
+        logging.info("No instruments qualify for additional quantity. Nothing to stream.")
+        return
+
+    available_funds = check_available_funds()
+    if available_funds is None:
+        logging.warning("Unable to retrieve available funds. Continuing without funds check.")
+        available_funds = Decimal('Infinity')
+
+    # Fills are written back to each row's own sort key
+    sort_keys = {candidate[0]: candidate[4] for candidate in candidates}
+    journal = OrderJournal()
+    stream = PriceDropStream(
+        client,
+        prepare_order_fn=prepare_order_details,
+        place_fn=trigger_order_via_sdk,
+        on_fill=lambda instrument, price: update_base_value_in_dynamodb(instrument, price, sort_keys[instrument]),
+        available_funds=available_funds,
+        journal=journal,
+        order_key=additional_order_key
+    )
+    for instrument, instrument_token, additional_quantity, base_value, _ in candidates:
+        stream.arm(instrument, instrument_token, additional_quantity, base_value)
+
+    if feed is None:
+        from vortex_api import VortexFeed
+        feed = VortexFeed(client.access_token)
+    try:
+        run_stream(stream, feed, exchange=Vc.ExchangeTypes.NSE_EQUITY, mode=Vc.QuoteModes.LTP)
+    finally:
+        journal.close()
+
+# Resting mode: keep limit buys resting at the broker at every ladder level instead of polling prices
+@run('price_drop_resting')
+def sync_resting_ladders(settle_only=False):
+    """Bring the resting ladder orders in line with the candidates' BaseValues and eligibility.
+
+    With settle_only the day's new fills are applied to BaseValue and no orders are sent (after the close).
+    """
+    from resting_ladder import RestingLadder
+
+    with span('scan'):
+        candidates = fetch_additional_candidates()
+    if candidates is None:
+        # Without the candidates every resting order would look stale; leave them as they are
+        logging.error("Could not read the candidates. Leaving the resting orders unchanged.")
+        return None
+
+    available_funds = float('inf')
+    if not settle_only:
+        funds = check_available_funds()
+        if funds is None:
+            logging.warning("Unable to retrieve available funds. Continuing without funds check.")
+        else:
+            available_funds = float(funds)
+
+    with OrderJournal() as journal:
+        ladder = RestingLadder(client, prepare_order_details, apply_additional_fills, journal)
+        with span('sync'):
+            return ladder.sync(
+                [((instrument, base_value, sort_key), instrument_token, additional_quantity, base_value)
+                 for instrument, instrument_token, additional_quantity, base_value, sort_key in candidates],
+                available_funds=available_funds,
+                settle_only=settle_only
+            )
+
 # Main function to run when the script is executed
+# Usage: python rupeezy/price_drop.py [--stream | --replay TICKS_CSV | --resting | --settle]
 if __name__ == "__main__":
-    process_additional_quantity()
+    import sys
+    if not os.getenv('RUPEEZY_API_KEY') or not os.getenv('RUPEEZY_APPLICATION_ID'):
+        logging.error("API credentials are missing. Exiting script.")
+        sys.exit(1)
+    if len(sys.argv) > 1 and sys.argv[1] == '--stream':
+        run_price_drop_stream()
+    elif len(sys.argv) > 2 and sys.argv[1] == '--replay':
+        from streaming import ReplayFeed
+        run_price_drop_stream(ReplayFeed.from_csv(sys.argv[2]))
+    elif len(sys.argv) > 1 and sys.argv[1] in ('--resting', '--settle'):
+        sync_resting_ladders(settle_only=sys.argv[1] == '--settle')
+    else:
+        process_additional_quantity()
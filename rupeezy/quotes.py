@@ -0,0 +1,65 @@
+# Batched LTP quote fetching for the broker API.
+# The quotes endpoint accepts a list of instruments, so instead of one round trip per token we
+# split the whole universe into chunks sized to the broker's per-request limit.
+
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+
+from instrumentation import span
+
+# Maximum number of instruments the Vortex quotes endpoint accepts in a single request
+QUOTE_BATCH_SIZE = 1000
+
+
+# Function to build the instrument key the quotes API expects for an NSE equity token
+def quote_key(instrument_token):
+    return f"NSE_EQ-{instrument_token}"
+
+
+# Function to split a list of tokens into chunks of at most chunk_size
+def chunk_tokens(tokens, chunk_size=QUOTE_BATCH_SIZE):
+    return [tokens[i:i + chunk_size] for i in range(0, len(tokens), chunk_size)]
+
+
+# Function to extract LTPs for one chunk from a quotes response
+def parse_ltp_response(response, chunk):
+    """Return a token -> price map for the tokens of this chunk found in the response."""
+    prices = {}
+    data = response.get('data') if isinstance(response, dict) else None
+    if data is None:
+        raise ValueError(f"Missing data in quotes response: {response}")
+
+    for instrument_token in chunk:
+        quote = data.get(quote_key(instrument_token))
+        if quote is None:
+            logging.error(f"Missing token key in quotes response for token {instrument_token}")
+            continue
+        ltp = quote.get('last_trade_price', 0)
+        if not ltp:
+            logging.error(f"Received LTP as 0 for token {instrument_token}")
+            continue
+        prices[instrument_token] = Decimal(str(ltp)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return prices
+
+
+# Function to fetch the current price of many instruments in as few requests as possible
+def fetch_current_prices(client, instrument_tokens, chunk_size=QUOTE_BATCH_SIZE):
+    """Fetch LTPs for all tokens in chunks and return a token -> Decimal price map.
+
+    Retries are left to the rate-limited client (rate_limit.py); a chunk that still fails is
+    logged and skipped. Tokens the broker returned without a usable price are left out of the map.
+    """
+    from vortex_api import Constants as Vc  # Deferred: importing vortex_api loads its websocket stack
+    tokens = list(dict.fromkeys(instrument_tokens))  # De-duplicate while keeping order
+    prices = {}
+
+    with span('quotes'):
+        for chunk in chunk_tokens(tokens, chunk_size):
+            try:
+                response = client.quotes([quote_key(t) for t in chunk], mode=Vc.QuoteModes.LTP)
+                logging.debug("Quotes response for %d tokens: %s", len(chunk), response)
+                prices.update(parse_ltp_response(response, chunk))
+            except Exception as e:
+                logging.error(f"Error fetching quotes for a chunk of {len(chunk)} tokens: {str(e)}")
+
+    return prices
@@ -0,0 +1,175 @@
+# Client-side rate limiting and retries for every broker call.
+# Each script used to wrap its broker calls in its own `for attempt in range(retries)` loop with a
+# fixed 5 s sleep, which under concurrency either trips the broker's rate limits or sits idle.
+# RateLimitedClient wraps the broker client once (clients.get_broker_client does this), so every
+# call waits on a per-endpoint token bucket, and only retriable failures (network errors, HTTP 429
+# and 5xx) are retried with jittered exponential backoff. Calls that create orders are only retried
+# when the broker certainly did not accept them (HTTP 429, connection not established). An HTTP 401
+# calls on_auth_failure once for a new access token and repeats the call with it.
+#
+# BROKER_RATE_LIMITS overrides the per-second rates, e.g. "place_order=10,quotes=1:2" (rate[:burst]).
+
+import os
+import time
+import random
+import logging
+import threading
+from collections import defaultdict
+
+from instrumentation import record_call
+
+# Requests per second allowed per endpoint, and for every endpoint not listed
+DEFAULT_RATE_LIMITS = {
+    'place_order': 10,
+    'modify_order': 10,
+    'cancel_order': 10,
+    'quotes': 1,
+    'orders': 5,
+    'historical_candles': 3,
+}
+DEFAULT_RATE = 10
+
+# Calls that must not be repeated unless the broker certainly rejected them
+NON_IDEMPOTENT_CALLS = {'place_order', 'modify_order', 'cancel_order'}
+
+# Retry schedule: base * 2 ** attempt seconds, capped, with jitter
+RETRY_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 8.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate tokens per second, holding at most burst tokens."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping only as long as needed; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+# Function to read the configured rate limits
+def load_rate_limits():
+    """Return endpoint -> (rate, burst), with BROKER_RATE_LIMITS applied over the defaults."""
+    limits = {name: (rate, None) for name, rate in DEFAULT_RATE_LIMITS.items()}
+    for entry in os.getenv('BROKER_RATE_LIMITS', '').split(','):
+        if '=' not in entry:
+            continue
+        name, value = entry.split('=', 1)
+        rate, _, burst = value.partition(':')
+        limits[name.strip()] = (float(rate), float(burst) if burst else None)
+    return limits
+
+
+# Function to read the HTTP status code of a failed request, if any
+def _status_code(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+# Function to decide whether a failed call may be retried
+def is_retriable(error, idempotent=True):
+    import requests  # Only needed once a call has failed
+    if getattr(error, 'retriable', False):
+        return True
+    status = _status_code(error)
+    if status == 429:
+        return True  # Rate limited: the request was not processed
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True  # Never reached the broker
+    if not idempotent:
+        return False
+    if status is not None:
+        return status >= 500
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+class RateLimitedClient:
+    """Proxy for the broker client that rate-limits and retries every method call."""
+
+    def __init__(self, client, limits=None, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY,
+                 max_delay=RETRY_MAX_DELAY, on_auth_failure=None):
+        object.__setattr__(self, '_client', client)
+        object.__setattr__(self, '_on_auth_failure', on_auth_failure)
+        object.__setattr__(self, '_limits', load_rate_limits() if limits is None else limits)
+        object.__setattr__(self, '_buckets', {})
+        object.__setattr__(self, '_lock', threading.Lock())
+        object.__setattr__(self, '_retry', (attempts, base_delay, max_delay))
+        object.__setattr__(self, 'counters', defaultdict(lambda: defaultdict(float)))
+
+    def _bucket(self, name):
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                rate, burst = self._limits.get(name, (DEFAULT_RATE, None))
+                bucket = self._buckets[name] = TokenBucket(rate, burst)
+            return bucket
+
+    def _count(self, name, counter, amount=1):
+        with self._lock:
+            self.counters[name][counter] += amount
+
+    def _call(self, name, method, *args, **kwargs):
+        attempts, base_delay, max_delay = self._retry
+        idempotent = name not in NON_IDEMPOTENT_CALLS
+        reauthenticated = False
+        attempt = 0
+        while True:
+            self._count(name, 'throttled_seconds', self._bucket(name).acquire())
+            self._count(name, 'calls')
+            started = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+                record_call('broker', name, time.perf_counter() - started)
+                return result
+            except Exception as e:
+                record_call('broker', name, time.perf_counter() - started, ok=False)
+                if _status_code(e) == 401 and self._on_auth_failure is not None and not reauthenticated:
+                    # The token was rejected: get a new one once and repeat the call
+                    reauthenticated = True
+                    access_token = self._on_auth_failure()
+                    if access_token:
+                        self._client.access_token = access_token
+                        self._count(name, 'reauthentications')
+                        continue
+                if attempt == attempts - 1 or not is_retriable(e, idempotent):
+                    self._count(name, 'failures')
+                    raise
+                delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                self._count(name, 'retries')
+                logging.warning(f"Broker call {name} failed ({e}); retry {attempt + 1} in {delay:.2f}s.")
+                time.sleep(delay)
+                attempt += 1
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        def limited(*args, **kwargs):
+            return self._call(name, attribute, *args, **kwargs)
+        return limited
+
+    def __setattr__(self, name, value):
+        setattr(self._client, name, value)  # e.g. access_token goes to the wrapped client
+
+    def stats(self):
+        """Return endpoint -> {calls, retries, failures, throttled_seconds}."""
+        with self._lock:
+            return {name: dict(counters) for name, counters in self.counters.items()}
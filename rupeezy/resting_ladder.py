@@ -0,0 +1,289 @@
+# Broker-side resting orders for the additional-quantity ladder.
+# The price-drop job used to poll quotes at fixed times (or follow the tick stream) and send a market
+# order once a ladder level had been crossed, so it only saw the drops that were still there when it
+# looked. RestingLadder instead keeps a limit buy of AdditionalQuantity resting at the broker at every
+# ladder level below each candidate's BaseValue, and the exchange fills a level the moment the price
+# trades through it. Each sync reads the open order book once, diffs the resting orders against the
+# ladders the candidates should have and sends only the place / modify / cancel calls that differ,
+# concurrently. A ladder whose BaseValue and eligibility did not change costs nothing, so a sync in the
+# steady state is one order book read (plus the funds check) however many instruments are managed.
+#
+# The ladder only ever touches orders it placed itself: every placement is written to the order
+# journal under a resting: key (intent before the call, the broker's order ID after it), and order book
+# entries whose IDs are not journaled there, such as manual MTF limit buys, are left alone.
+#
+# Fills found in the order book move the instrument's BaseValue to its deepest new fill through the
+# caller's on_fills, and the rest of its ladder is re-priced from there in the same sync. Whatever part
+# of an order traded counts, also when the rest of it was cancelled or expired; an order that is still
+# open with a part fill is applied once it is terminal, or by the settle run after the close. The
+# journal entry moves to applied, so a fill is applied once.
+#
+# The Vortex API has no GTT orders, so the resting orders are DAY limit orders: the broker drops them at
+# the close and the first sync of the next day places them again. An instrument that is no longer a
+# candidate has its orders cancelled.
+#
+# RESTING_TICK_SIZE (default 0.05) is the price tick the limits are floored to and RESTING_LADDER_WORKERS
+# (default 8) the number of concurrent order calls.
+
+import os
+import uuid
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fill_tracker import fetch_order_book, order_id_of, order_status, average_traded_price, traded_quantity, TERMINAL_STATUSES
+from ladder import LADDER_LEVELS, LADDER_STEP_PERCENT, build_ladders
+from order_journal import INTENT, PLACED
+from order_plan import allocate
+
+RESTING_TICK_SIZE = float(os.getenv('RESTING_TICK_SIZE', '0.05'))
+RESTING_LADDER_WORKERS = int(os.getenv('RESTING_LADDER_WORKERS', '8'))
+
+# Prefix of the journal keys of the ladder's orders
+JOURNAL_PREFIX = 'resting:'
+
+
+def _token(order):
+    return int(order.get('token') or 0)
+
+
+def _price(order):
+    return round(float(order.get('price') or 0), 2)
+
+
+def _quantity(order):
+    return int(order.get('quantity') or 0)
+
+
+# Function to compute the limit price of every ladder level
+def limit_prices(base_values, levels=LADDER_LEVELS, step=LADDER_STEP_PERCENT, tick_size=RESTING_TICK_SIZE):
+    """Return (instruments, levels) limit prices, shallowest level first.
+
+    The trigger prices are floored to the tick, so a limit is never above its level.
+    """
+    triggers = build_ladders(base_values, levels, step).reshape(-1, levels)[:, ::-1]
+    return np.round(np.floor(triggers / tick_size + 1e-6) * tick_size, 2)
+
+
+# Function to work out the calls that turn one instrument's open orders into its desired ladder
+def diff_ladder(existing, desired):
+    """Return (modify, cancel, place) for open orders existing and desired (price, quantity) levels.
+
+    Orders that already match a level are left alone. The others are paired with the remaining levels
+    from the highest price down, so a shifted ladder is re-priced in place; modify lists (order, (price,
+    quantity)) pairs, cancel the orders left over and place the levels left over.
+    """
+    wanted = sorted(desired, reverse=True)
+    unmatched = []
+    for order in sorted(existing, key=_price, reverse=True):
+        level = (_price(order), _quantity(order))
+        if level in wanted:
+            wanted.remove(level)
+        else:
+            unmatched.append(order)
+    return list(zip(unmatched, wanted)), unmatched[len(wanted):], wanted[len(unmatched):]
+
+
+class RestingLadder:
+    """Keeps a limit buy resting at every ladder level of every candidate, in step with its BaseValue."""
+
+    def __init__(self, client, prepare_order_fn, on_fills, journal, levels=LADDER_LEVELS, step=LADDER_STEP_PERCENT,
+                 tick_size=RESTING_TICK_SIZE, max_workers=RESTING_LADDER_WORKERS):
+        self.client = client
+        self.prepare_order_fn = prepare_order_fn  # (token, quantity, price) -> limit order details
+        self.on_fills = on_fills                  # [(context, order ID, order)] -> order IDs not applied
+        self.journal = journal                    # order_journal.OrderJournal of the ladder's orders
+        self.levels = levels
+        self.step = step
+        self.tick_size = tick_size
+        self.max_workers = max_workers
+
+    # Function to bring the resting orders in line with the candidates
+    def sync(self, ladders, available_funds=float('inf'), settle_only=False):
+        """Apply new fills, then place, re-price and cancel resting orders; returns counts of what was done.
+
+        ladders lists (context, token, additional_quantity, base_value) for every instrument that should
+        rest orders; context is handed back to on_fills. Open ladder orders of any other token are
+        cancelled. With settle_only the fills are applied, part fills of open orders included, and no
+        orders are sent (for after the close).
+        """
+        stats = Counter()
+        keys = self._journaled_orders(stats)
+        managed = [(keys[order_id], order) for order_id, order in fetch_order_book(self.client).items()
+                   if order_id in keys]
+        by_token = {int(entry[1]): entry for entry in ladders}
+
+        # Fills first: they move BaseValue and so the ladder
+        base_values, held = self._apply_fills(managed, by_token, stats, settle_only)
+        if settle_only:
+            logging.info(f"Resting ladder settled: {dict(stats)}")
+            return dict(stats)
+
+        open_orders = {}
+        blocked = 0.0  # Funds held by the open orders this sync may move
+        for _, order in managed:
+            if order_status(order) in TERMINAL_STATUSES:
+                continue
+            if traded_quantity(order):
+                # Part-filled: left to complete or expire, so its fill is never lost to a cancel
+                stats['part_filled'] += 1
+                continue
+            open_orders.setdefault(_token(order), []).append(order)
+            blocked += _price(order) * _quantity(order)
+
+        desired = self._desired(ladders, base_values, held, float(available_funds) + blocked, stats)
+
+        cancels, modifies, places = [], [], []
+        for token, orders in open_orders.items():
+            if token in held:
+                continue  # Its fill is not applied yet; leave the ladder until the BaseValue moved
+            modify, cancel, place = diff_ladder(orders, desired.pop(token, []))
+            modifies.extend((token, order, level) for order, level in modify)
+            cancels.extend(cancel)
+            places.extend((token, level) for level in place)
+            stats['unchanged'] += len(orders) - len(modify) - len(cancel)
+        for token, levels in desired.items():
+            places.extend((token, level) for level in levels)
+
+        self._submit(cancels, modifies, places, stats)
+        logging.info(f"Resting ladder synced for {len(by_token)} instruments: {dict(stats)}")
+        return dict(stats)
+
+    # Function to map the broker order IDs of the ladder's journaled orders to their journal keys
+    def _journaled_orders(self, stats):
+        """Return order ID -> key of the orders still waiting for their fill to be applied.
+
+        An intent without an order ID is a placement whose outcome was never recorded (a crash during the
+        call); it is marked failed rather than guessed from the order book.
+        """
+        keys = {}
+        for key, entry in list(self.journal.entries.items()):
+            if not key.startswith(JOURNAL_PREFIX):
+                continue
+            if entry['state'] == PLACED and entry.get('order_id'):
+                keys[entry['order_id']] = key
+            elif entry['state'] == INTENT:
+                logging.warning(f"Ladder order {key} for token {entry.get('token')} was sent without its order ID "
+                                f"being recorded; it is not managed and may still rest at the broker.")
+                self.journal.record_failed(key, 'unconfirmed')
+                stats['unconfirmed'] += 1
+        return keys
+
+    # Function to hand the fills not applied yet to on_fills
+    def _apply_fills(self, managed, by_token, stats, settle_only):
+        """Return (token -> BaseValue after its fills, tokens whose fills could not be applied).
+
+        Each instrument's new fills are reported as one fill, its deepest: BaseValue moves to the lowest
+        price the ladder bought at, as it moved to the market order's price in the polling job.
+        """
+        new_fills = {}
+        for key, order in managed:
+            if average_traded_price(order) is None:
+                continue  # Nothing traded (or no price to move BaseValue to yet)
+            if order_status(order) not in TERMINAL_STATUSES and not settle_only:
+                continue  # Part-filled and still open: applied once it is done
+            new_fills.setdefault(_token(order), []).append((key, order))
+
+        fills, groups = [], {}
+        for token, orders in new_fills.items():
+            if token not in by_token:
+                logging.warning(f"Ladder orders {[order_id_of(order) for _, order in orders]} for token {token} "
+                                f"traded, but it is no longer a candidate; its BaseValue is not updated.")
+                continue
+            deepest = min((order for _, order in orders), key=average_traded_price)
+            fills.append((by_token[token][0], order_id_of(deepest), deepest))
+            groups[order_id_of(deepest)] = (token, deepest, orders)
+        if not fills:
+            return {}, set()
+
+        not_applied = set(self.on_fills(fills) or ())
+        base_values, held = {}, set()
+        for order_id, (token, deepest, orders) in groups.items():
+            if order_id in not_applied:
+                held.add(token)
+                continue
+            base_values[token] = average_traded_price(deepest)
+            for key, order in orders:
+                self.journal.record_filled(key, average_traded_price(order))
+                self.journal.record_applied(key)
+            stats['filled'] += len(orders)
+        return base_values, held
+
+    # Function to compute the funded resting orders of every candidate
+    def _desired(self, ladders, base_values, held, budget, stats):
+        """Return token -> [(price, quantity)]; when the budget is short the shallower levels are funded first."""
+        active = [entry for entry in ladders if int(entry[1]) not in held and int(entry[2]) > 0]
+        if not active:
+            return {}
+        tokens = [int(entry[1]) for entry in active]
+        quantities = np.array([int(entry[2]) for entry in active], dtype=np.int64)
+        prices = limit_prices([float(base_values.get(token, entry[3])) for token, entry in zip(tokens, active)],
+                              self.levels, self.step, self.tick_size)
+
+        # Level-major order: every instrument's first level, then every second level, and so on
+        costs = (prices * quantities[:, None]).T.ravel()
+        funded, unfunded, _ = allocate(np.arange(len(costs)), costs, float(budget))
+        stats['unfunded'] += len(unfunded)
+        desired = {}
+        for index in sorted(funded.tolist()):
+            level, row = divmod(index, len(active))
+            desired.setdefault(tokens[row], []).append((float(prices[row, level]), int(quantities[row])))
+        return desired
+
+    # Function to send the order calls of a sync concurrently
+    def _submit(self, cancels, modifies, places, stats):
+        calls = {
+            'cancelled': [(f"cancel {order_id_of(order)}", self._cancel, (order,)) for order in cancels],
+            'modified': [(f"modify {order_id_of(order)}", self._modify, (token, order, level))
+                         for token, order, level in modifies],
+            'placed': [(f"place {token} @ {level[0]}", self._place, (token, level)) for token, level in places],
+        }
+        # Cancels go first so the funds they release are there for the re-priced and new orders
+        for outcome, batch in calls.items():
+            if not batch:
+                continue
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(batch)))) as pool:
+                results = list(pool.map(self._attempt, batch))
+            stats[outcome] += sum(results)
+            stats['failed'] += len(results) - sum(results)
+
+    @staticmethod
+    def _attempt(call):
+        description, function, args = call
+        try:
+            function(*args)
+            return True
+        except Exception as e:
+            logging.error(f"Resting ladder call failed ({description}): {str(e)}")
+            return False
+
+    def _cancel(self, order):
+        self.client.cancel_order(order_id=order_id_of(order))
+
+    def _modify(self, token, order, level):
+        price, quantity = level
+        details = self.prepare_order_fn(token, quantity, price)
+        self.client.modify_order(
+            order_id=order_id_of(order),
+            variety=details['variety'],
+            quantity=quantity,
+            traded_quantity=0,
+            price=price,
+            trigger_price=details['trigger_price'],
+            disclosed_quantity=details['disclosed_quantity'],
+            validity=details['validity']
+        )
+
+    def _place(self, token, level):
+        price, quantity = level
+        order_details = self.prepare_order_fn(token, quantity, price)
+        key = f"{JOURNAL_PREFIX}{token}:{uuid.uuid4().hex[:12]}"
+        self.journal.record_intent(key, order_details)
+        try:
+            order_id = str(self.client.place_order(**order_details)['data']['orderId'])
+        except Exception as e:
+            self.journal.record_failed(key, str(e)[:200])
+            raise
+        self.journal.record_placed(key, order_id)
@@ -0,0 +1,213 @@
+# Long-running scheduler daemon for all Beest jobs.
+# Replaces the separate GitHub Actions workflows (login, eligibility check, default buy and price
+# drop), each of which paid for a cold checkout, dependency install, Python start and fresh client
+# setup. This process imports every job once, shares one broker client, one DynamoDB client and the
+# in-memory instrument master between them, and runs them on the IST market calendar.
+#
+# Run with `python rupeezy/scheduler.py`. Set PRICE_DROP_INTERVAL_MINUTES to also check price drops
+# every N minutes during market hours, and NSE_HOLIDAYS to a comma-separated list of ISO dates.
+# Jobs run one at a time. A job whose time passes while another one is still running runs late, as soon
+# as that one finishes, unless it is more than JOB_CATCH_UP_MINUTES (default 60) overdue; several missed
+# times of the same job are covered by one late run.
+# PRICE_DROP_MODE=resting keeps the ladder as limit orders resting at the broker (resting_ladder.py):
+# the price-drop runs then sync those orders, the first one just after the open, and a settle run after
+# the close applies the day's last fills to BaseValue.
+
+import os
+import signal
+import logging
+import importlib
+import threading
+from datetime import datetime, date, time, timedelta
+
+import pytz
+
+from clients import set_access_token, get_broker_client, get_dynamodb_client, get_stock_table
+from instruments import get_master
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+IST = pytz.timezone('Asia/Kolkata')
+
+# Regular NSE session
+MARKET_OPEN = time(9, 15)
+MARKET_CLOSE = time(15, 30)
+
+# Times of the jobs that used to be GitHub Actions cron entries (converted from UTC to IST)
+LOGIN_TIME = time(9, 3)
+# Eligibility makes one rate-limited candle request per instrument; it starts right after the login so
+# that it normally finishes well before the default buy warms up (if not, the buy runs late)
+ELIGIBILITY_TIME = time(9, 4)
+# The default buy warms up before the open and releases its prepared orders at MARKET_OPEN
+DEFAULT_BUY_TIME = time(9, 12)
+PRICE_DROP_TIMES = [time(9, 57), time(14, 19)]
+# Resting mode: the ladder orders are placed once the market is open and settled after the close. The
+# first sync leaves room for the default buy's fill tracking (up to a minute after the open) to finish
+PRICE_DROP_MODE = os.getenv('PRICE_DROP_MODE', 'poll')
+RESTING_SYNC_TIME = time(9, 20)
+RESTING_SETTLE_TIME = time(15, 35)
+
+
+# Minutes after its scheduled time during which an overdue job is still run
+JOB_CATCH_UP_MINUTES = int(os.getenv('JOB_CATCH_UP_MINUTES', '60'))
+
+
+# Function to read the exchange holidays from the environment
+def load_holidays():
+    raw = os.getenv('NSE_HOLIDAYS', '')
+    return {date.fromisoformat(day.strip()) for day in raw.split(',') if day.strip()}
+
+
+# Function to check whether the exchange is open on a given day
+def is_trading_day(day, holidays):
+    return day.weekday() < 5 and day not in holidays
+
+
+# Function to list the price-drop check times for the day
+def price_drop_times():
+    """The two historical runs, plus one every PRICE_DROP_INTERVAL_MINUTES during market hours if set."""
+    times = set(PRICE_DROP_TIMES)
+    interval = int(os.getenv('PRICE_DROP_INTERVAL_MINUTES', '0') or 0)
+    if interval > 0:
+        moment = datetime.combine(date.today(), MARKET_OPEN) + timedelta(minutes=interval)
+        close = datetime.combine(date.today(), MARKET_CLOSE)
+        while moment <= close:
+            times.add(moment.time())
+            moment += timedelta(minutes=interval)
+    return sorted(times)
+
+
+# Function to find the next time a job should run after a given moment
+def next_run_time(job, now, holidays):
+    """First scheduled time of the job strictly after now (which may lie in the past)."""
+    day = now.date()
+    for _ in range(15):  # Enough to skip a long weekend plus holidays
+        if is_trading_day(day, holidays):
+            for at in job['times']:
+                candidate = IST.localize(datetime.combine(day, at))
+                if candidate > now:
+                    return candidate
+        day += timedelta(days=1)
+    return None
+
+
+# Job: make sure a fresh access token is cached and installed on the shared client
+def run_login():
+    import login
+    access_token = login.get_access_token()  # Logs in only if the cached token is close to expiry
+    if access_token:
+        set_access_token(access_token)
+    else:
+        logging.error("Login job did not return an access token.")
+
+
+# Job: update eligibility
+def run_eligibility():
+    import beest_eligibility_and_price_check
+    beest_eligibility_and_price_check.update_stock_eligibility()
+
+
+# Job: prepare the default-quantity orders and send them at the open
+def run_default_buy():
+    import main
+    main.run_default_buy(release_at=IST.localize(datetime.combine(datetime.now(IST).date(), MARKET_OPEN)))
+
+
+# Job: buy additional quantity on price drops
+def run_price_drop():
+    import price_drop
+    if PRICE_DROP_MODE == 'resting':
+        price_drop.sync_resting_ladders()
+    else:
+        price_drop.process_additional_quantity()
+
+
+# Job: apply the resting ladder's last fills of the day
+def run_price_drop_settle():
+    import price_drop
+    price_drop.sync_resting_ladders(settle_only=True)
+
+
+# Function to build the job table
+def build_jobs():
+    jobs = [
+        {'name': 'login', 'times': [LOGIN_TIME], 'run': run_login},
+        {'name': 'eligibility', 'times': [ELIGIBILITY_TIME], 'run': run_eligibility},
+        {'name': 'default_buy', 'times': [DEFAULT_BUY_TIME], 'run': run_default_buy},
+    ]
+    if PRICE_DROP_MODE == 'resting':
+        jobs.append({'name': 'price_drop', 'times': sorted({RESTING_SYNC_TIME, *price_drop_times()}), 'run': run_price_drop})
+        jobs.append({'name': 'price_drop_settle', 'times': [RESTING_SETTLE_TIME], 'run': run_price_drop_settle})
+    else:
+        jobs.append({'name': 'price_drop', 'times': price_drop_times(), 'run': run_price_drop})
+    return jobs
+
+
+# Modules of the scheduled jobs, imported once by warm_up
+JOB_MODULES = ('beest_eligibility_and_price_check', 'main', 'price_drop')
+
+
+# Function to import the job modules and load shared state before the first job is due
+def warm_up():
+    """Pay the import and client setup cost once, at daemon start, instead of at every job."""
+    run_login()  # Served from the token cache unless the token is about to expire
+    for name in JOB_MODULES:
+        importlib.import_module(name)
+    # The scripts build their clients lazily; build them (and import boto3 / vortex_api) now
+    get_broker_client()
+    get_dynamodb_client()
+    get_stock_table()
+    get_master()
+
+
+# Function to run the jobs forever, one at a time, at their scheduled times
+def run_forever(jobs, stop_event, holidays=None, since=None, catch_up=None):
+    """Run the jobs at their times after since (default now); a restarted daemon does not replay earlier runs."""
+    holidays = load_holidays() if holidays is None else holidays
+    catch_up = timedelta(minutes=JOB_CATCH_UP_MINUTES) if catch_up is None else catch_up
+    since = since or datetime.now(IST)
+    handled = {job['name']: since for job in jobs}  # Job -> the last of its times that was run or skipped
+    while not stop_event.is_set():
+        # Each job's next time follows the last time it was handled, not the clock, so a time that
+        # passed while another job was running is still due
+        upcoming = [(next_run_time(job, handled[job['name']], holidays), job) for job in jobs]
+        upcoming = [(at, job) for at, job in upcoming if at is not None]
+        if not upcoming:
+            logging.error("No upcoming job runs found; stopping scheduler.")
+            return
+        at, job = min(upcoming, key=lambda entry: entry[0])
+
+        late = (datetime.now(IST) - at).total_seconds()
+        if late > catch_up.total_seconds():
+            logging.error(f"Job {job['name']} due at {at.strftime('%Y-%m-%d %H:%M')} IST is {late / 60:.0f} minutes "
+                          f"overdue; skipping that run.")
+            handled[job['name']] = at
+            continue
+        if late > 0:
+            logging.warning(f"Job {job['name']} due at {at.strftime('%H:%M')} IST is running {late:.0f}s late.")
+        else:
+            logging.info(f"Next job: {job['name']} at {at.strftime('%Y-%m-%d %H:%M')} IST.")
+            if stop_event.wait(-late):
+                return
+
+        started = datetime.now(IST)
+        try:
+            job['run']()
+        except Exception as e:
+            logging.error(f"Job {job['name']} failed: {e}")
+        finished = datetime.now(IST)
+        # Times of this job that passed while it ran are covered by this run
+        handled[job['name']] = max(at, finished)
+        logging.info(f"Job {job['name']} finished in {(finished - started).total_seconds():.2f}s.")
+
+
+# Main execution block: start the daemon
+if __name__ == "__main__":
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    started = datetime.now(IST)  # Times that pass during the warm-up still run
+    warm_up()
+    run_forever(build_jobs(), stop, since=started)
+    logging.info("Scheduler stopped.")
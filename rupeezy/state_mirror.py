@@ -0,0 +1,290 @@
+# Local SQLite mirror of the StockEligibility table.
+# Every job used to scan the whole table from DynamoDB on every run and write one update_item per
+# stock, although the table is small and only these scripts write to it. StockMirror keeps a copy of
+# every item in SQLite, indexed on EligibilityStatus, AdditionalQuantity and FirstDayProcessed, so
+# filters like "Eligible AND AdditionalQuantity > 0" are local index lookups. Writes are queued and
+# sent to DynamoDB in TransactWriteItems batches (BatchWriteItem cannot carry update or condition
+# expressions), then applied to the mirror.
+#
+# Every write stamps a ModifiedAt attribute (milliseconds since the epoch). sync() queries
+# stock_index.MODIFIED_INDEX (EligibilityStatus / ModifiedAt) for the items stamped since the last sync,
+# once per known status, so it reads and pays for the changed items only. The whole table is re-read
+# every MIRROR_FULL_SYNC_SECONDS, and whenever the index does not exist yet: that also drops deleted
+# items and picks up rows written without the stamp. A row edited by hand in the console is therefore
+# only seen by the next full sync unless the edit also sets ModifiedAt to the current epoch milliseconds.
+#
+# Set STOCK_MIRROR_PATH to enable it; clients.get_stock_mirror() returns None otherwise.
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from dynamo_scan import scan_items, query_items, DEFAULT_SCAN_SEGMENTS
+from stock_index import MODIFIED_INDEX, index_unavailable
+
+# SQLite file of the mirror; unset disables it
+STOCK_MIRROR_PATH = os.getenv('STOCK_MIRROR_PATH')
+# Seconds between full re-reads of the table
+MIRROR_FULL_SYNC_SECONDS = float(os.getenv('MIRROR_FULL_SYNC_SECONDS', 6 * 60 * 60))
+# A sync within this many seconds of the last one is skipped
+MIRROR_MAX_AGE_SECONDS = float(os.getenv('MIRROR_MAX_AGE_SECONDS', 30))
+# Incremental syncs look this far behind the last sync to allow for clock skew between writers
+SYNC_SKEW_MS = 60 * 1000
+
+TABLE_NAME = 'StockEligibility'
+# EligibilityStatus values queried by every incremental sync, besides those already in the mirror
+KNOWN_STATUSES = ('Eligible', 'Ineligible')
+# DynamoDB limit on actions per TransactWriteItems call
+TRANSACT_LIMIT = 100
+# Attempts for a batch whose transaction was cancelled for reasons other than a failed condition
+TRANSACT_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stocks (
+    instrument_name TEXT NOT NULL,
+    sort_key TEXT NOT NULL,
+    eligibility_status TEXT,
+    additional_quantity REAL,
+    default_quantity REAL,
+    first_day_processed INTEGER,
+    base_value REAL,
+    modified_at INTEGER,
+    item TEXT NOT NULL,
+    PRIMARY KEY (instrument_name, sort_key)
+);
+CREATE INDEX IF NOT EXISTS stocks_status_additional ON stocks (eligibility_status, additional_quantity);
+CREATE INDEX IF NOT EXISTS stocks_first_day ON stocks (first_day_processed);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+"""
+
+
+# Function to get the ModifiedAt stamp for a write
+def modified_at():
+    return int(time.time() * 1000)
+
+
+# Function to read a number attribute of a low-level item
+def _number(item, name):
+    value = item.get(name, {})
+    return float(value['N']) if 'N' in value else None
+
+
+# Function to build the indexed columns of a low-level item
+def _row(item):
+    first_day = item.get('FirstDayProcessed', {})
+    modified = _number(item, 'ModifiedAt')
+    return (
+        item['InstrumentName']['S'],
+        item['Eligibility']['S'],
+        item.get('EligibilityStatus', {}).get('S'),
+        _number(item, 'AdditionalQuantity'),
+        _number(item, 'DefaultQuantity'),
+        int(first_day['BOOL']) if 'BOOL' in first_day else None,
+        _number(item, 'BaseValue'),
+        None if modified is None else int(modified),
+        json.dumps(item, separators=(',', ':'))
+    )
+
+
+class StockMirror:
+    """SQLite copy of StockEligibility with indexed reads and batched write-through to DynamoDB."""
+
+    def __init__(self, path, dynamodb, table_name=TABLE_NAME):
+        self.path = path
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._pending = {}  # (instrument_name, sort_key) -> {'values': {...}, 'expected': {...}}
+        self._deserializer = None  # boto3's TypeDeserializer, imported on first plain query
+        self._last_sync = 0.0
+
+    def _meta(self, name):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    # Function to fetch the items stamped after a time from the ModifiedAt index, or None without the index
+    def _changed_since(self, since):
+        statuses = set(KNOWN_STATUSES) | {row[0] for row in self._db.execute(
+            "SELECT DISTINCT eligibility_status FROM stocks WHERE eligibility_status IS NOT NULL")}
+        items = []
+        try:
+            for status in sorted(statuses):
+                items.extend(query_items(
+                    self.dynamodb, TableName=self.table_name, IndexName=MODIFIED_INDEX,
+                    KeyConditionExpression="EligibilityStatus = :status AND #m > :since",
+                    ExpressionAttributeNames={'#m': 'ModifiedAt'},
+                    ExpressionAttributeValues={':status': {'S': status}, ':since': {'N': str(since)}}))
+        except Exception as e:
+            if not index_unavailable(e):
+                raise
+            logging.warning(f"Index {MODIFIED_INDEX} is not available ({e}); re-reading the whole table. "
+                            f"Run `python stock_index.py --migrate` to create it.")
+            return None
+        return items
+
+    def _store(self, items):
+        self._db.executemany("INSERT OR REPLACE INTO stocks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [_row(item) for item in items])
+
+    # Function to bring the mirror up to date with DynamoDB
+    def sync(self, full=False, max_age=MIRROR_MAX_AGE_SECONDS):
+        """Fetch the items changed since the last sync (all items when full or when a full sync is due).
+
+        Returns the number of items read, or 0 when the mirror was synced less than max_age seconds ago.
+        """
+        with self._lock:
+            if not full and time.monotonic() - self._last_sync < max_age:
+                return 0
+            started = modified_at()
+            synced_at, full_synced_at = self._meta('synced_at'), self._meta('full_synced_at')
+            full = full or synced_at is None or started - (full_synced_at or 0) > MIRROR_FULL_SYNC_SECONDS * 1000
+
+            items = None if full else self._changed_since(synced_at - SYNC_SKEW_MS)
+            if items is None:
+                full = True
+                items = list(scan_items(self.dynamodb, TableName=self.table_name, total_segments=DEFAULT_SCAN_SEGMENTS))
+
+            with self._db:
+                if full:
+                    self._db.execute("DELETE FROM stocks")
+                    self._db.execute("INSERT OR REPLACE INTO meta VALUES ('full_synced_at', ?)", (started,))
+                self._store(items)
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('synced_at', ?)", (started,))
+            self._last_sync = time.monotonic()
+            logging.info(f"{'Full' if full else 'Incremental'} mirror sync read {len(items)} items.")
+            return len(items)
+
+    # Function to read items from the mirror
+    def query(self, status=None, additional_quantity_above=None, first_day_processed=None, plain=False):
+        """Return the items matching every given filter, in low-level format ({'S': ...}) or, with
+        plain, as plain values like the Table resource returns them."""
+        clauses, params = [], []
+        if status is not None:
+            clauses.append("eligibility_status = ?")
+            params.append(status)
+        if additional_quantity_above is not None:
+            clauses.append("additional_quantity > ?")
+            params.append(additional_quantity_above)
+        if first_day_processed is not None:
+            clauses.append("first_day_processed = ?")
+            params.append(int(first_day_processed))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._db.execute(f"SELECT item FROM stocks{where} ORDER BY instrument_name", params).fetchall()
+        items = [json.loads(row[0]) for row in rows]
+        if plain:
+            if self._deserializer is None:
+                from boto3.dynamodb.types import TypeDeserializer
+                self._deserializer = TypeDeserializer()
+            return [{name: self._deserializer.deserialize(value) for name, value in item.items()} for item in items]
+        return items
+
+    def get(self, instrument_name, sort_key='Eligible'):
+        with self._lock:
+            row = self._db.execute("SELECT item FROM stocks WHERE instrument_name = ? AND sort_key = ?",
+                                   (instrument_name, sort_key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Function to queue an update for the next flush
+    def update(self, instrument_name, sort_key, values, expected=None):
+        """Queue SET values (attribute -> low-level value) for one item.
+
+        expected maps attribute -> the low-level value it must still hold (possibly {'NULL': True}), or None
+        if it must not exist; the update is dropped at flush time if DynamoDB disagrees. Updates to the
+        same item are merged.
+        """
+        with self._lock:
+            pending = self._pending.setdefault((instrument_name, sort_key), {'values': {}, 'expected': dict(expected or {})})
+            pending['values'].update(values)
+
+    def _transact_item(self, key, pending, stamp):
+        values = dict(pending['values'], ModifiedAt={'N': str(stamp)})
+        names, attribute_values, assignments, conditions = {}, {}, [], []
+        for i, (name, value) in enumerate(values.items()):
+            names[f"#a{i}"] = name
+            attribute_values[f":v{i}"] = value
+            assignments.append(f"#a{i} = :v{i}")
+        for i, (name, value) in enumerate(pending['expected'].items()):
+            names[f"#c{i}"] = name
+            if value is None:
+                conditions.append(f"attribute_not_exists(#c{i})")
+            elif value.get('NULL'):
+                # A NULL value cannot be compared with '=', only its type can be checked
+                attribute_values[f":c{i}"] = {'S': 'NULL'}
+                conditions.append(f"attribute_type(#c{i}, :c{i})")
+            else:
+                attribute_values[f":c{i}"] = value
+                conditions.append(f"#c{i} = :c{i}")
+        update = {
+            'TableName': self.table_name,
+            'Key': {'InstrumentName': {'S': key[0]}, 'Eligibility': {'S': key[1]}},
+            'UpdateExpression': "SET " + ", ".join(assignments),
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': attribute_values
+        }
+        if conditions:
+            update['ConditionExpression'] = " AND ".join(conditions)
+        return {'Update': update}
+
+    # Function to write the queued updates to the mirror once DynamoDB has accepted them
+    def _apply(self, keys, pending, stamp):
+        items = []
+        for key in keys:
+            item = self.get(*key) or {'InstrumentName': {'S': key[0]}, 'Eligibility': {'S': key[1]}}
+            item.update(pending[key]['values'])
+            item['ModifiedAt'] = {'N': str(stamp)}
+            items.append(item)
+        with self._db:
+            self._store(items)
+
+    # Function to send the queued updates to DynamoDB
+    def flush(self):
+        """Write every queued update in transactions of up to TRANSACT_LIMIT items.
+
+        Returns the set of (instrument_name, sort_key) keys that were not written, either because
+        their condition failed or because DynamoDB kept rejecting the batch.
+        """
+        from botocore.exceptions import ClientError
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        failed = set()
+        keys = list(pending)
+        for start in range(0, len(keys), TRANSACT_LIMIT):
+            batch = keys[start:start + TRANSACT_LIMIT]
+            for attempt in range(TRANSACT_ATTEMPTS):
+                if not batch:
+                    break
+                stamp = modified_at()
+                try:
+                    self.dynamodb.transact_write_items(
+                        TransactItems=[self._transact_item(key, pending[key], stamp) for key in batch])
+                    with self._lock:
+                        self._apply(batch, pending, stamp)
+                    batch = []
+                except ClientError as e:
+                    reasons = e.response.get('CancellationReasons') or []
+                    if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException' or not reasons:
+                        logging.error(f"Error writing {len(batch)} items to DynamoDB: {e}")
+                        break  # The client has already retried transient errors
+                    # Drop the items whose condition failed and retry the rest
+                    conflicts = {key for key, reason in zip(batch, reasons) if reason.get('Code') == 'ConditionalCheckFailed'}
+                    for key in conflicts:
+                        logging.warning(f"{key[0]} changed since it was read; leaving it for the next run.")
+                    failed |= conflicts
+                    batch = [key for key in batch if key not in conflicts]
+                    if not conflicts:
+                        time.sleep(0.1 * 2 ** attempt)  # Cancelled by a conflicting transaction
+                except Exception as e:
+                    logging.error(f"Error writing {len(batch)} items to DynamoDB: {e}")
+                    break
+            failed |= set(batch)
+        return failed
+
+    def close(self):
+        with self._lock:
+            self._db.close()
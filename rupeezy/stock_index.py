@@ -0,0 +1,202 @@
+# Index-backed access paths for the StockEligibility table.
+# main.py and price_drop.py used to find their work with a filtered Scan, which reads (and bills)
+# every item to keep the eligible ones. A global secondary index makes those lookups Queries whose
+# cost scales with the eligible rows:
+#   EligibilityStatusIndex - EligibilityStatus (hash) / InstrumentName (range)
+#   ModifiedAtIndex        - EligibilityStatus (hash) / ModifiedAt (range): whole items, read by the
+#                            SQLite mirror (state_mirror.py) to fetch only the rows changed since its last sync
+# EligibilityStatusIndex projects the attributes the jobs read. The price-drop candidates are the eligible rows with
+# AdditionalQuantity > 0, read from the same index with a filter. AdditionalQuantity is edited by hand
+# in the console, so the lookup keys on EligibilityStatus, which every row carries, rather than on a
+# flag those edits would have to maintain. Until the index exists (or while it is building) the
+# lookups fall back to the filtered scan.
+#
+# Keys are built here too: every row is keyed by InstrumentName and its own Eligibility sort key,
+# which the jobs now carry from the row they read instead of assuming 'Eligible'.
+#
+# Run `python stock_index.py --migrate` once per table to create the index (--dry-run reports what
+# would change). An AdditionalQuantityIndex left by an earlier version is no longer read and can be
+# deleted, together with the HasAdditionalQuantity attribute it was keyed on.
+
+import logging
+import argparse
+import time
+
+from dynamo_scan import scan_items, query_items, DEFAULT_SCAN_SEGMENTS
+
+TABLE_NAME = 'StockEligibility'
+PARTITION_KEY = 'InstrumentName'
+SORT_KEY = 'Eligibility'
+# Sort key value of the stock rows (the run marker uses 'Meta')
+DEFAULT_SORT_KEY = 'Eligible'
+
+ELIGIBILITY_INDEX = 'EligibilityStatusIndex'
+MODIFIED_INDEX = 'ModifiedAtIndex'
+
+# Non-key attributes copied into the indexes: everything the hot-path lookups read
+INDEX_PROJECTED_ATTRIBUTES = ['Token', 'DefaultQuantity', 'AdditionalQuantity', 'BaseValue', 'FirstDayProcessed']
+
+# Index name -> (hash key, range key)
+INDEXES = {
+    ELIGIBILITY_INDEX: ('EligibilityStatus', PARTITION_KEY),
+    MODIFIED_INDEX: ('EligibilityStatus', 'ModifiedAt'),
+}
+# Index key attributes that are numbers rather than strings
+NUMBER_KEY_ATTRIBUTES = {'ModifiedAt'}
+# Indexes that project every attribute instead of INDEX_PROJECTED_ATTRIBUTES
+FULL_PROJECTION_INDEXES = {MODIFIED_INDEX}
+
+# Indexes found missing (or still building): index name -> when; their lookups go straight to the
+# scan until INDEX_RECHECK_SECONDS have passed
+INDEX_RECHECK_SECONDS = 600
+_missing_indexes = {}
+
+
+# Function to build the primary key of a row
+def stock_key(instrument_name, sort_key=DEFAULT_SORT_KEY, low_level=True):
+    """Return the Key for a row, in low-level ({'S': ...}) or Table resource (plain) format."""
+    if low_level:
+        return {PARTITION_KEY: {'S': instrument_name}, SORT_KEY: {'S': sort_key}}
+    return {PARTITION_KEY: instrument_name, SORT_KEY: sort_key}
+
+
+# Function to read the sort key of an item as read from the table
+def sort_key_of(item):
+    """Return the item's own Eligibility sort key (low-level or plain item), cleaned of stray spaces."""
+    value = item.get(SORT_KEY, DEFAULT_SORT_KEY)
+    if isinstance(value, dict):
+        value = value.get('S', DEFAULT_SORT_KEY)
+    return value.strip()
+
+
+# Function to wrap a value in the format the table object expects
+def _value(value, low_level):
+    if not low_level:
+        return value
+    return {'N': str(value)} if isinstance(value, (int, float)) else {'S': value}
+
+
+# Function to tell whether a failed request was made against an index that does not exist (yet)
+def index_unavailable(error):
+    from botocore.exceptions import ClientError
+    if not isinstance(error, ClientError):
+        return False
+    message = error.response.get('Error', {}).get('Message', '')
+    return error.response.get('Error', {}).get('Code') == 'ValidationException' and 'index' in message.lower()
+
+
+# Function to query an index, falling back to the equivalent filtered scan while it is unavailable
+def _query_or_scan(table, index_name, query_kwargs, scan_kwargs, attributes, low_level):
+    table_kwargs = {'TableName': TABLE_NAME} if low_level else {}
+    if time.monotonic() - _missing_indexes.get(index_name, -INDEX_RECHECK_SECONDS) >= INDEX_RECHECK_SECONDS:
+        try:
+            return list(query_items(table, attributes=attributes, IndexName=index_name, **query_kwargs, **table_kwargs))
+        except Exception as e:
+            if not index_unavailable(e):
+                raise
+            _missing_indexes[index_name] = time.monotonic()
+            logging.warning(f"Index {index_name} is not available ({e}); scanning instead. "
+                            f"Run `python stock_index.py --migrate` to create it.")
+    return list(scan_items(table, attributes=attributes, total_segments=DEFAULT_SCAN_SEGMENTS,
+                           **scan_kwargs, **table_kwargs))
+
+
+# Function to fetch the rows with a given EligibilityStatus
+def fetch_by_status(table, status='Eligible', attributes=None, low_level=True):
+    """Query EligibilityStatusIndex for every row with the status (table: boto3 client if low_level, else Table)."""
+    values = {':status': _value(status, low_level)}
+    return _query_or_scan(
+        table, ELIGIBILITY_INDEX,
+        query_kwargs={'KeyConditionExpression': "EligibilityStatus = :status", 'ExpressionAttributeValues': values},
+        scan_kwargs={'FilterExpression': "EligibilityStatus = :status", 'ExpressionAttributeValues': values},
+        attributes=attributes, low_level=low_level
+    )
+
+
+# Function to fetch the eligible rows that have an AdditionalQuantity to buy
+def fetch_additional_candidates(table, status='Eligible', attributes=None, low_level=True):
+    """Query EligibilityStatusIndex for rows with the status, keeping those with AdditionalQuantity > 0."""
+    values = {':status': _value(status, low_level), ':qty': _value(0, low_level)}
+    return _query_or_scan(
+        table, ELIGIBILITY_INDEX,
+        query_kwargs={'KeyConditionExpression': "EligibilityStatus = :status",
+                      'FilterExpression': "AdditionalQuantity > :qty",
+                      'ExpressionAttributeValues': values},
+        scan_kwargs={'FilterExpression': "EligibilityStatus = :status AND AdditionalQuantity > :qty",
+                     'ExpressionAttributeValues': values},
+        attributes=attributes, low_level=low_level
+    )
+
+
+# Function to create the missing indexes on the table
+def create_indexes(dynamodb, wait=True, poll_interval=15):
+    """Add every index in INDEXES the table lacks (one per UpdateTable call, as DynamoDB requires)."""
+    table = dynamodb.describe_table(TableName=TABLE_NAME)['Table']
+    provisioned = table.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED') == 'PROVISIONED'
+    created = []
+    for index_name, (hash_key, range_key) in INDEXES.items():
+        existing = {index['IndexName'] for index in table.get('GlobalSecondaryIndexes', [])}
+        if index_name in existing:
+            continue
+        index = {
+            'IndexName': index_name,
+            'KeySchema': [{'AttributeName': hash_key, 'KeyType': 'HASH'},
+                          {'AttributeName': range_key, 'KeyType': 'RANGE'}],
+            'Projection': ({'ProjectionType': 'ALL'} if index_name in FULL_PROJECTION_INDEXES else
+                           {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': INDEX_PROJECTED_ATTRIBUTES})
+        }
+        if provisioned:
+            throughput = table.get('ProvisionedThroughput', {})
+            index['ProvisionedThroughput'] = {'ReadCapacityUnits': throughput.get('ReadCapacityUnits', 5),
+                                              'WriteCapacityUnits': throughput.get('WriteCapacityUnits', 5)}
+        logging.info(f"Creating index {index_name} on {TABLE_NAME}.")
+        dynamodb.update_table(
+            TableName=TABLE_NAME,
+            AttributeDefinitions=[{'AttributeName': name, 'AttributeType': 'N' if name in NUMBER_KEY_ATTRIBUTES else 'S'}
+                                  for name in (hash_key, range_key)],
+            GlobalSecondaryIndexUpdates=[{'Create': index}]
+        )
+        created.append(index_name)
+        if wait:
+            table = wait_for_indexes(dynamodb, poll_interval)
+    return created
+
+
+# Function to wait until the table and all its indexes are active
+def wait_for_indexes(dynamodb, poll_interval=15):
+    while True:
+        table = dynamodb.describe_table(TableName=TABLE_NAME)['Table']
+        statuses = [index.get('IndexStatus') for index in table.get('GlobalSecondaryIndexes', [])]
+        if table.get('TableStatus') == 'ACTIVE' and all(status == 'ACTIVE' for status in statuses):
+            return table
+        logging.info(f"Waiting for {TABLE_NAME} indexes to become active: {statuses}")
+        time.sleep(poll_interval)
+
+
+# Function to create the missing indexes
+def migrate(dynamodb, dry_run=False, wait=True):
+    """Return the names of the indexes that were (or, with dry_run, would be) created."""
+    if dry_run:
+        table = dynamodb.describe_table(TableName=TABLE_NAME)['Table']
+        existing = {index['IndexName'] for index in table.get('GlobalSecondaryIndexes', [])}
+        created = [name for name in INDEXES if name not in existing]
+    else:
+        created = create_indexes(dynamodb, wait=wait)
+    logging.info(f"{'Indexes to create' if dry_run else 'Created indexes'}: {created or 'none'}")
+    _missing_indexes.clear()
+    return created
+
+
+# Migration CLI
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Create the StockEligibility secondary indexes.")
+    parser.add_argument('--migrate', action='store_true', help="Create the missing indexes")
+    parser.add_argument('--dry-run', action='store_true', help="Report what --migrate would change")
+    args = parser.parse_args()
+
+    from clients import get_dynamodb_client
+    if args.migrate or args.dry_run:
+        migrate(get_dynamodb_client(), dry_run=args.dry_run)
+    else:
+        parser.print_help()
@@ -0,0 +1,298 @@
+# Real-time price-drop trigger driven by the broker's streaming feed.
+# Instead of checking prices twice a day, price_drop.py can subscribe to LTP ticks for every
+# eligible token and evaluate the additional-quantity ladder on each tick. The hot path is one dict
+# lookup and one float comparison against the top of the token's trigger ladder (ladder.py); only
+# ticks that cross it are bisected into the ladder and hand off to a worker pool that places the order, waits for the fill and re-arms
+# the trigger from the new BaseValue. ReplayFeed stands in for the live feed when testing.
+#
+# A worker always ends by re-arming the instrument or releasing it, and credits its reserved funds back
+# when nothing was bought. An order still open after the fill wait keeps the instrument disarmed and is
+# checked again every PENDING_RECHECK_SECONDS; its late fill moves BaseValue then. A journaled order of
+# the same level (from an earlier run) is resolved from its journal entry instead of buying again.
+
+import csv
+import time
+import logging
+import threading
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+
+from fill_tracker import track_fills, fetch_order, average_traded_price, order_status, TERMINAL_STATUSES
+from ladder import LADDER_LEVELS, build_ladder, levels_crossed
+from order_journal import PLACED, FILLED, APPLIED, FAILED
+
+# Seconds between checks of an order that was still open after the fill wait
+PENDING_RECHECK_SECONDS = 30
+
+
+class PriceDropStream:
+    """Evaluates the additional-quantity ladder for every incoming tick."""
+
+    def __init__(self, client, prepare_order_fn, place_fn, on_fill, available_funds=float('inf'),
+                 levels=LADDER_LEVELS, max_workers=4, journal=None, order_key=None, fill_timeout=30,
+                 recheck_seconds=PENDING_RECHECK_SECONDS):
+        self.client = client
+        self.journal = journal                    # Optional order_journal.OrderJournal
+        self.order_key = order_key                # (instrument, base value) -> idempotency key
+        self.levels = levels
+        self.prepare_order_fn = prepare_order_fn  # (token, quantity) -> order details
+        self.place_fn = place_fn                  # (client, order details) -> broker response
+        self.on_fill = on_fill                    # (instrument, executed price) -> True if applied
+        self.available_funds = float(available_funds)
+        self.fill_timeout = fill_timeout
+        self.recheck_seconds = recheck_seconds
+        self.triggers = {}    # token -> (top trigger price, instrument, additional quantity, base value, ladder)
+        self.in_flight = {}   # token -> entry whose order has not filled yet
+        self.pending = {}     # token -> order ID still open after the fill wait
+        self.ticks_seen = 0
+        self.latencies = []   # Tick-to-submit latency in seconds for each fired order
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._timers = {}     # token -> threading.Timer of the next pending check
+        self._closed = False
+
+    # Function to arm (or re-arm) an instrument's trigger from its BaseValue
+    def arm(self, instrument, token, additional_quantity, base_value):
+        base_value = float(base_value)
+        ladder = build_ladder(base_value, self.levels)
+        with self._lock:
+            self.triggers[int(token)] = (ladder[-1], instrument, int(additional_quantity), base_value, ladder)
+
+    def tokens(self):
+        return list(self.triggers)
+
+    # Feed callback: evaluate every tick against its trigger price
+    def on_price_update(self, ws, ticks):
+        triggers = self.triggers
+        for tick in ticks:
+            self.ticks_seen += 1
+            entry = triggers.get(tick['token'])
+            if entry is None:
+                continue
+            price = tick['last_trade_price']
+            if price and price <= entry[0]:
+                self._fire(tick['token'], entry, price, time.perf_counter())
+
+    # Function to hand a crossed trigger to the order workers
+    def _fire(self, token, entry, price, received_at):
+        _, instrument, additional_quantity, base_value, ladder = entry
+        multiplier = levels_crossed(ladder, price)
+        if multiplier == 0:
+            return
+        quantity = multiplier * additional_quantity
+        cost = price * quantity
+
+        with self._lock:
+            if self.triggers.get(token) is not entry:
+                return  # Another tick already fired this trigger
+            if cost > self.available_funds:
+                logging.info(f"{instrument} crossed its trigger but {cost:.2f} exceeds available funds.")
+                return
+            del self.triggers[token]
+            self.in_flight[token] = entry
+            self.available_funds -= cost
+
+        logging.info(f"{instrument} at {price} is down from {base_value} - buying {multiplier}x AdditionalQuantity ({quantity} units)")
+        self._pool.submit(self._execute, token, entry, quantity, cost, received_at)
+
+    # Worker: place the order, wait for its fill and re-arm from the executed price
+    def _execute(self, token, entry, quantity, cost, received_at):
+        _, instrument, _, base_value, _ = entry
+        outcome = None
+        try:
+            key = self.order_key((instrument, base_value)) if self.journal is not None else None
+            journaled = self.journal.get(key) if key is not None else None
+            if journaled is not None and journaled['state'] != FAILED:
+                # This level was already bought (by an earlier run): settle that order instead
+                logging.info(f"{instrument} already has a journaled order for BaseValue {base_value}; resolving it.")
+                outcome = self._resolve_journaled(key, journaled, instrument)
+                return
+
+            self.latencies.append(time.perf_counter() - received_at)
+            order_details = self.prepare_order_fn(token, quantity)
+            if key is not None:
+                self.journal.record_intent(key, order_details)
+            try:
+                response = self.place_fn(self.client, order_details)
+            except Exception:
+                if key is not None:
+                    self.journal.record_failed(key, 'placement error')
+                raise
+            if not response:
+                if key is not None:
+                    self.journal.record_failed(key, 'not placed')
+                logging.error(f"Order placement failed for {instrument}; re-arming at the old BaseValue.")
+                return
+            order_id = str(response['data']['orderId'])
+            if key is not None:
+                self.journal.record_placed(key, order_id)
+            outcome = self._track(key, order_id, instrument, self.fill_timeout)
+        except Exception as e:
+            logging.error(f"Error buying {instrument}: {str(e)}")
+        finally:
+            self._finish(token, entry, cost, outcome)
+
+    # Function to wait for an order's fill and apply it; returns the executed price, a pending marker or None
+    def _track(self, key, order_id, instrument, timeout):
+        terminal, _ = track_fills(self.client, [order_id], initial_delay=0.1, max_delay=2, timeout=timeout)
+        if order_id not in terminal:
+            logging.warning(f"Order {order_id} for {instrument} is still open; checking it again later.")
+            return ('pending', order_id)
+        executed_price = average_traded_price(terminal[order_id])  # Part fills of cancelled or expired orders count too
+        if executed_price is None:
+            if key is not None:
+                self.journal.record_failed(key, str(terminal[order_id].get('status')))
+            return None
+        if key is not None:
+            self.journal.record_filled(key, executed_price)
+        return self._apply(key, instrument, executed_price)
+
+    # Function to move BaseValue to a fill's price and mark it applied
+    def _apply(self, key, instrument, executed_price):
+        if not self.on_fill(instrument, executed_price):
+            # Left as filled in the journal; the next cross of this level applies it again
+            logging.error(f"BaseValue update for {instrument} failed; keeping it disarmed until the next run.")
+            return ('unresolved', None)
+        if key is not None:
+            self.journal.record_applied(key)
+        return float(executed_price)
+
+    # Function to settle the journaled order of a level instead of placing a second one
+    def _resolve_journaled(self, key, journaled, instrument):
+        if journaled['state'] in (FILLED, APPLIED) and journaled.get('price') is not None:
+            if journaled['state'] == APPLIED:
+                return float(journaled['price'])
+            return self._apply(key, instrument, float(journaled['price']))
+        if journaled['state'] == PLACED and journaled.get('order_id'):
+            if journaled.get('day') in (None, date.today().isoformat()):
+                return self._track(key, journaled['order_id'], instrument, timeout=0)
+            # Placed on an earlier day: final by now, but no longer in the day's order book
+            order = fetch_order(self.client, journaled['order_id'])
+            if order is not None and order_status(order) in TERMINAL_STATUSES:
+                executed_price = average_traded_price(order)
+                if executed_price is None:
+                    self.journal.record_failed(key, order_status(order))
+                    return None
+                self.journal.record_filled(key, executed_price)
+                return self._apply(key, instrument, executed_price)
+        # INTENT without an order ID (it may or may not have reached the broker) or an unknown final status
+        logging.error(f"Journaled order {key} for {instrument} was never confirmed ({journaled['state']}); "
+                      f"not buying this level again today.")
+        return ('unresolved', None)
+
+    # Function to end a worker: re-arm from the new BaseValue, keep a pending order, or release the instrument
+    def _finish(self, token, entry, cost, outcome):
+        _, instrument, additional_quantity, base_value, _ = entry
+        filled = isinstance(outcome, float)
+        with self._lock:
+            self.in_flight.pop(token, None)
+            if isinstance(outcome, tuple) and outcome[0] == 'pending':
+                # The order is live: its funds stay reserved until it resolves
+                self.pending[token] = outcome[1]
+                if not self._closed:
+                    timer = threading.Timer(self.recheck_seconds, self._schedule_recheck, (token, entry, cost))
+                    timer.daemon = True
+                    self._timers[token] = timer
+                    timer.start()
+                return
+            self.pending.pop(token, None)
+            if outcome is None:
+                self.available_funds += cost  # Nothing was bought
+        if filled:
+            self.arm(instrument, token, additional_quantity, outcome)
+        elif outcome is None:
+            self.arm(instrument, token, additional_quantity, base_value)
+        # Unresolved (a fill that could not be applied or an unconfirmed order): released without re-arming,
+        # so it cannot fire again this session
+
+    def _schedule_recheck(self, token, entry, cost):
+        with self._lock:
+            self._timers.pop(token, None)
+            if self._closed:
+                return
+            self._pool.submit(self._recheck, token, entry, cost)
+
+    # Worker: check an order that was still open after the fill wait
+    def _recheck(self, token, entry, cost):
+        _, instrument, _, base_value, _ = entry
+        outcome = ('pending', self.pending.get(token))
+        try:
+            key = self.order_key((instrument, base_value)) if self.journal is not None else None
+            outcome = self._track(key, self.pending[token], instrument, timeout=0)
+        except Exception as e:
+            logging.error(f"Error checking the open order of {instrument}: {str(e)}")
+        finally:
+            self._finish(token, entry, cost, outcome)
+
+    # Function to wait for in-flight orders and stop the workers
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+        self._pool.shutdown(wait=True)
+        for token, order_id in self.pending.items():
+            logging.warning(f"Order {order_id} (token {token}) is still open; the journal resolves it on the next run.")
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            logging.info(f"Fired {len(ordered)} orders from {self.ticks_seen} ticks; "
+                         f"tick-to-submit p50 {ordered[len(ordered) // 2] * 1000:.2f} ms, max {ordered[-1] * 1000:.2f} ms.")
+
+
+class ReplayFeed:
+    """Local stand-in for the live feed that replays ticks from memory or a CSV file (token,price)."""
+
+    def __init__(self, ticks, batch_size=100, interval=0.0):
+        self.ticks = ticks
+        self.batch_size = batch_size
+        self.interval = interval
+        self.subscribed = set()
+        self.on_connect = None
+        self.on_price_update = None
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        with open(path) as tick_file:
+            ticks = [{'token': int(row['token']), 'last_trade_price': float(row['price'])}
+                     for row in csv.DictReader(tick_file)]
+        return cls(ticks, **kwargs)
+
+    def subscribe(self, exchange, token, mode):
+        self.subscribed.add(int(token))
+        return True
+
+    def connect(self, threaded=False):
+        if self.on_connect:
+            self.on_connect(self, None)
+        batch = []
+        for tick in self.ticks:
+            if tick['token'] not in self.subscribed:
+                continue
+            batch.append(tick)
+            if len(batch) >= self.batch_size:
+                self.on_price_update(self, batch)
+                batch = []
+                if self.interval:
+                    time.sleep(self.interval)
+        if batch:
+            self.on_price_update(self, batch)
+
+    def close(self):
+        pass
+
+
+# Function to connect a stream to a feed and subscribe every armed token
+def run_stream(stream, feed, exchange='NSE_EQ', mode='ltp'):
+    """Subscribe the stream's tokens on connect and route ticks into it. Blocks until the feed stops."""
+    def on_connect(ws, response):
+        for token in stream.tokens():
+            ws.subscribe(exchange, token, mode)
+        logging.info(f"Subscribed to {len(stream.tokens())} tokens.")
+
+    feed.on_connect = on_connect
+    feed.on_price_update = stream.on_price_update
+    try:
+        feed.connect()
+    finally:
+        stream.close()
@@ -0,0 +1,6 @@
+# The scripts in rupeezy/ import each other by bare module name, as they do when run directly
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rupeezy'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
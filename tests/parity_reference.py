@@ -0,0 +1,69 @@
+# Scalar reference implementation of the eligibility condition used by the parity tests.
+# It follows the screener's definitions bar by bar in plain Python, independently of the vectorized
+# engine in rupeezy/indicators.py:
+#   latest rsi(65) < latest ema(rsi(65),35) or weekly rsi(65) < weekly ema(rsi(65),35)
+# Wilder's RSI and the EMA are both seeded with the simple average of their first `period` values;
+# weekly bars end on Friday and the running week uses its latest close.
+
+from datetime import timedelta
+
+RSI_PERIOD = 65
+EMA_PERIOD = 35
+
+
+# Function to run a seeded recursive filter over a list of values (None until the seed is complete)
+def seeded_filter(values, period, alpha):
+    output, window, state = [], [], None
+    for value in values:
+        if value is None:
+            output.append(None)
+            continue
+        if state is None:
+            window.append(value)
+            if len(window) == period:
+                state = sum(window) / period
+        else:
+            state += alpha * (value - state)
+        output.append(state)
+    return output
+
+
+# Function to compute Wilder's RSI of a list of closes
+def rsi(closes, period=RSI_PERIOD):
+    gains, losses = [None], [None]
+    for previous, close in zip(closes, closes[1:]):
+        gains.append(max(close - previous, 0.0))
+        losses.append(max(previous - close, 0.0))
+    values = []
+    for gain, loss in zip(seeded_filter(gains, period, 1.0 / period), seeded_filter(losses, period, 1.0 / period)):
+        if gain is None:
+            values.append(None)
+        elif loss == 0:
+            values.append(100.0 if gain > 0 else None)
+        else:
+            values.append(100.0 - 100.0 / (1.0 + gain / loss))
+    return values
+
+
+# Function to evaluate "latest rsi < latest ema(rsi)" on a list of closes
+def rsi_below_ema(closes):
+    rsi_values = rsi(closes)
+    ema_values = seeded_filter(rsi_values, EMA_PERIOD, 2.0 / (EMA_PERIOD + 1))
+    if not rsi_values or rsi_values[-1] is None or ema_values[-1] is None:
+        return False
+    return rsi_values[-1] < ema_values[-1]
+
+
+# Function to resample (date, close) bars to week-ending-Friday closes
+def weekly(bars):
+    weeks = {}
+    for day, close in bars:
+        weeks[day + timedelta(days=(4 - day.weekday()) % 7)] = close  # Later days overwrite earlier ones
+    return [weeks[friday] for friday in sorted(weeks)]
+
+
+# Function to decide whether one instrument meets the condition
+def is_eligible(bars):
+    """bars: (date, close) pairs sorted by date."""
+    closes = [close for _, close in bars]
+    return rsi_below_ema(closes) or rsi_below_ema(weekly(bars))
@@ -0,0 +1,57 @@
+# CandleStore ingestion: SDK enums, only completed bars, and IST dates on the way in and out.
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import candle_store
+from candle_store import CandleStore, IST, ingest_from_broker, ingest_from_csv
+from fakes import FakeBroker
+
+
+class RecordingBroker(FakeBroker):
+    """FakeBroker that records the arguments of historical_candles."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.history_calls = []
+
+    def historical_candles(self, exchange, token, to, start, resolution):
+        self.history_calls.append((exchange, token, to, start, resolution))
+        return super().historical_candles(exchange, token, to, start, resolution)
+
+
+def test_broker_ingest_passes_sdk_enums_and_skips_todays_bar(tmp_path):
+    from vortex_api import Constants as Vc
+    broker = RecordingBroker(prices={7: 100.0})
+    store = CandleStore(str(tmp_path), readonly=False)
+    ingest_from_broker(store, broker, {'SBIN': 7}, days=30)
+
+    exchange, token, to, start, resolution = broker.history_calls[0]
+    assert exchange is Vc.ExchangeTypes.NSE_EQUITY and resolution is Vc.Resolutions.DAY
+    today = datetime.now(IST).date()
+    dates = store.frame('close').index
+    assert len(dates) and dates[-1].date() < today
+
+    # The next ingest starts after the last stored bar, so the skipped bar arrives once it is complete
+    ingest_from_broker(store, broker, {'SBIN': 7}, days=30)
+    assert broker.history_calls[1][3] > broker.history_calls[0][3]
+    assert list(store.frame('close').index) == list(dates)
+    store.close()
+
+
+def test_csv_dates_read_back_unchanged(tmp_path):
+    candle_dir = tmp_path / 'csv'
+    candle_dir.mkdir()
+    dates = pd.bdate_range('2024-01-01', periods=5)
+    pd.DataFrame({'date': dates, 'close': np.arange(5.0)}).to_csv(candle_dir / 'INFY.csv', index=False)
+
+    store = CandleStore(str(tmp_path / 'store'), readonly=False)
+    ingest_from_csv(store, str(candle_dir))
+    assert list(store.frame('close').index) == list(dates)
+    # Naive bounds are IST dates too
+    times, _ = store.load('close', start=datetime(2024, 1, 2), end=datetime(2024, 1, 3))
+    assert [candle_store.to_ist(t).date().isoformat() for t in times] == ['2024-01-02', '2024-01-03']
+    assert store.series('INFY', start=dates[-1].to_pydatetime() + timedelta(days=1))[0].size == 0
+    store.close()
@@ -0,0 +1,26 @@
+# Default-buy orders are only built for a token that DynamoDB and the instrument master agree on.
+
+import main
+
+
+class Master:
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def token_for(self, symbol):
+        return self.tokens.get(symbol)
+
+
+def stock(name, token=None):
+    item = {'InstrumentName': {'S': name}, 'DefaultQuantity': {'N': '5'}}
+    if token is not None:
+        item['Token'] = {'N': str(token)}
+    return item
+
+
+def test_stocks_without_an_agreed_token_are_skipped(monkeypatch):
+    monkeypatch.setattr(main, 'get_master', lambda: Master({'SBIN': 3045, 'INFY': 1594, 'TCS': 11536}))
+    eligible = [stock('SBIN', 3045), stock('INFY', 9999), stock('TCS'), stock('NEWCO', 777), stock('GONE')]
+    orders = main.build_default_orders(eligible)
+    assert [(item['InstrumentName']['S'], details['token']) for item, details in orders] == \
+        [('SBIN', 3045), ('TCS', 11536), ('NEWCO', 777)]
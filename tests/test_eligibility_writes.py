@@ -0,0 +1,60 @@
+# Diff-based eligibility writes: the conditional guard accepts NULL attributes, and a failed table read
+# writes nothing.
+
+import pytest
+
+from clients import install_clients, reset_clients
+from fakes import FakeStockTable
+from state_mirror import StockMirror
+
+
+@pytest.fixture
+def eligibility(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The run summary is written to the working directory
+    table = FakeStockTable()
+    reset_clients('mirror', 'dynamodb')
+    install_clients(dynamodb=table)
+    import beest_eligibility_and_price_check
+    yield beest_eligibility_and_price_check, table
+    reset_clients('mirror', 'dynamodb')
+
+
+def stock(name, status, first_day):
+    return {'InstrumentName': {'S': name}, 'Eligibility': {'S': 'Eligible'}, 'EligibilityStatus': {'S': status},
+            'FirstDayProcessed': first_day, 'BaseValue': {'NULL': True}, 'Token': {'N': '1'}}
+
+
+@pytest.mark.parametrize('through_mirror', [False, True])
+def test_null_first_day_processed_is_still_written(eligibility, through_mirror):
+    module, table = eligibility
+    table.put(stock('SBIN', 'Ineligible', {'NULL': True}))
+    changes = module.compute_eligibility_changes(table.items(), {'SBIN'})
+    assert len(changes) == 1
+
+    if through_mirror:
+        mirror = StockMirror(':memory:', table)
+        mirror.sync()
+        assert module.write_changes_through_mirror(mirror, changes, {}, '2026-01-01T09:04:00') == 1
+        mirror.close()
+    else:
+        assert module.write_eligibility_change(changes[0], '2026-01-01T09:04:00')
+    assert table.get('SBIN')['EligibilityStatus'] == {'S': 'Eligible'}
+    assert table.get('SBIN')['FirstDayProcessed'] == {'BOOL': True}
+
+
+def test_failed_scan_writes_nothing(eligibility, monkeypatch):
+    module, table = eligibility
+    for name in ('SBIN', 'INFY'):
+        table.put(stock(name, 'Eligible', {'BOOL': True}))
+
+    def partial_scan(*args, **kwargs):
+        yield table.get('SBIN')
+        raise RuntimeError('ProvisionedThroughputExceededException')
+
+    monkeypatch.setattr(module, 'scan_items', partial_scan)
+    monkeypatch.setattr(module, 'ELIGIBILITY_SOURCE', 'chartink')
+    monkeypatch.setattr(module, 'fetch_chartink_eligible_instruments', lambda: set())
+    table.reset_calls()
+    module.update_stock_eligibility()
+    assert table.calls['update_item'] == 0 and table.calls['transact_write_items'] == 0
+    assert table.get('SBIN')['EligibilityStatus'] == {'S': 'Eligible'}
@@ -0,0 +1,39 @@
+# Incremental indicator state: runs during a session must not fold the forming bar into the state.
+
+import os
+
+import indicators
+from indicator_state import rebuild_state, advance_state, completed_closes, check_consistency
+
+CANDLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'parity', 'synthetic', 'candles')
+
+
+def test_state_advanced_during_sessions_matches_batch():
+    closes = indicators.load_daily_series_from_csv(CANDLES, 'ALPHA')
+    state = rebuild_state(completed_closes(closes.iloc[:-20], today=closes.index[-20].date()))
+
+    # One run per day before the close: the day's bar is already there, with a provisional close
+    for position in range(len(closes) - 20, len(closes)):
+        today = closes.index[position].date()
+        seen = closes.iloc[:position + 1].copy()
+        seen.iloc[-1] *= 1.05
+        for timestamp, close in completed_closes(seen[seen.index > state['date']], today=today).items():
+            advance_state(state, timestamp.date(), close)
+        assert state['date'] < today.isoformat()
+
+    assert check_consistency(state, closes.iloc[:-1]) == []
+
+
+def test_only_advanced_states_are_written(monkeypatch):
+    import beest_eligibility_and_price_check as module
+    from indicator_state import dump_state
+    monkeypatch.setattr(module, 'CANDLE_STORE_DIR', None)
+    monkeypatch.setattr(module, 'CANDLE_DIR', CANDLES)
+    stock = {'InstrumentName': {'S': 'ALPHA'}, 'Eligibility': {'S': 'Eligible'}, 'Token': {'N': '1'}}
+    _, states, failed = module.fetch_incremental_eligible_instruments([stock])
+    assert set(states) == {'ALPHA'} and not failed
+
+    # No new completed bar since the stored state: nothing to write
+    stock['IndicatorState'] = {'S': dump_state(states['ALPHA'][1])}
+    _, states, failed = module.fetch_incremental_eligible_instruments([stock])
+    assert states == {} and not failed
@@ -0,0 +1,94 @@
+# Parity of the local indicator engine with the Chartink screener.
+# Every directory under fixtures/parity is one case: candles/<SYMBOL>.csv (date, close) and the
+# screener's response for the same day in chartink.json. The 'synthetic' case is generated data whose
+# chartink.json was produced by the scalar reference in parity_reference.py; captured Chartink
+# responses can be added as further cases next to it.
+
+import os
+import sys
+import json
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicators
+import parity_reference
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'parity')
+CASES = sorted(name for name in os.listdir(FIXTURE_DIR) if os.path.isdir(os.path.join(FIXTURE_DIR, name)))
+
+
+def _case(name):
+    case_dir = os.path.join(FIXTURE_DIR, name)
+    with open(os.path.join(case_dir, 'chartink.json')) as chartink_file:
+        chartink_eligible = {item['nsecode'] for item in json.load(chartink_file)['data']}
+    return os.path.join(case_dir, 'candles'), chartink_eligible
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_local_engine_matches_chartink(case):
+    candle_dir, chartink_eligible = _case(case)
+    closes = indicators.load_daily_closes_from_csv(candle_dir)
+    diff = indicators.compare_with_chartink(indicators.evaluate_eligibility(closes), chartink_eligible,
+                                            universe=closes.columns)
+    assert diff == {'only_local': [], 'only_chartink': []}
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_parity_cli_exits_cleanly(case):
+    candle_dir, _ = _case(case)
+    script = os.path.join(os.path.dirname(indicators.__file__), 'indicators.py')
+    result = subprocess.run([sys.executable, script, candle_dir, os.path.join(os.path.dirname(candle_dir), 'chartink.json')],
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert json.loads(result.stdout) == {'only_local': [], 'only_chartink': []}
+
+
+def test_vectorized_rsi_and_ema_match_reference():
+    candle_dir, _ = _case('synthetic')
+    closes = indicators.load_daily_closes_from_csv(candle_dir)['ALPHA'].to_list()
+    rsi = indicators.wilder_rsi(np.array(closes)[:, None])[:, 0]
+    reference_rsi = [np.nan if value is None else value for value in parity_reference.rsi(closes)]
+    np.testing.assert_allclose(rsi, reference_rsi, rtol=1e-9, equal_nan=True)
+
+    rsi_ema = indicators.ema(rsi[:, None])[:, 0]
+    reference_ema = parity_reference.seeded_filter(parity_reference.rsi(closes), parity_reference.EMA_PERIOD,
+                                                   2.0 / (parity_reference.EMA_PERIOD + 1))
+    np.testing.assert_allclose(rsi_ema, [np.nan if value is None else value for value in reference_ema],
+                               rtol=1e-9, equal_nan=True)
+
+
+def test_short_history_is_never_eligible():
+    days = pd.bdate_range('2024-01-01', periods=40)
+    closes = pd.DataFrame({'NEW': np.linspace(100, 80, len(days))}, index=days)
+    assert indicators.evaluate_eligibility(closes) == set()
+
+
+def test_loaded_symbols_skips_instruments_without_candles():
+    days = pd.bdate_range('2024-01-01', periods=3)
+    closes = pd.DataFrame({'HAS': [1.0, 2.0, np.nan], 'NONE': [np.nan] * 3}, index=days)
+    assert indicators.loaded_symbols(closes) == {'HAS'}
+
+
+class _HistoryClient:
+    """Records the arguments of historical_candles and returns two daily bars."""
+
+    def __init__(self):
+        self.calls = []
+
+    def historical_candles(self, exchange, token, to, start, resolution):
+        self.calls.append((exchange, token, to, start, resolution))
+        return {'s': 'ok', 't': [1704067200, 1704153600], 'c': [10.0, 11.0]}
+
+
+def test_broker_loader_passes_sdk_enums():
+    from vortex_api import Constants as Vc
+    client = _HistoryClient()
+    closes = indicators.load_daily_series_from_broker(client, '22')
+    exchange, token, to, start, resolution = client.calls[0]
+    assert exchange is Vc.ExchangeTypes.NSE_EQUITY and resolution is Vc.Resolutions.DAY
+    assert token == 22 and isinstance(to, datetime) and isinstance(start, datetime)
+    assert closes.to_list() == [10.0, 11.0]
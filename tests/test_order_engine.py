@@ -0,0 +1,50 @@
+# execute_orders holding its orders for a release time: the held workers are always woken, and nothing
+# is placed when the wait fails.
+
+import threading
+from datetime import datetime, timedelta
+
+import pytz
+
+import order_engine
+from fakes import FakeBroker
+from order_journal import OrderJournal, FAILED
+
+
+def place(client, order_details):
+    return client.place_order(**order_details)
+
+
+def market_order(token, quantity):
+    return {'exchange': 'NSE_EQ', 'token': token, 'transaction_type': 'BUY', 'product': 'MTF', 'variety': 'RL-MKT',
+            'quantity': quantity, 'price': 0.0, 'trigger_price': 0.0, 'disclosed_quantity': 0, 'validity': 'DAY'}
+
+
+def test_failed_release_wait_drops_held_orders(tmp_path, monkeypatch):
+    broker = FakeBroker(prices={1: 100.0, 2: 200.0})
+    journal = OrderJournal(str(tmp_path / 'journal.jsonl'))
+
+    def interrupted(moment):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(order_engine, 'wait_until', interrupted)
+    orders = [(('A', token), market_order(token, 1)) for token in (1, 2)]
+    release_at = datetime.now(pytz.timezone('Asia/Kolkata')) + timedelta(minutes=5)
+    result = {}
+
+    def run():
+        try:
+            order_engine.execute_orders(broker, orders, place, lambda fills: [], journal=journal,
+                                        order_key=lambda context: f"default:{context[1]}", release_at=release_at)
+        except KeyboardInterrupt:
+            result['raised'] = True
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    worker.join(timeout=5)
+
+    assert not worker.is_alive(), 'execute_orders deadlocked on the held orders'
+    assert result == {'raised': True}
+    assert broker.placed_orders() == []
+    assert {entry['state'] for entry in journal.entries.values()} == {FAILED}
+    journal.close()
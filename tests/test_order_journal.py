@@ -0,0 +1,100 @@
+# Order journal: compaction, durable group commit and reconciliation of earlier runs' orders.
+
+import json
+import os
+from datetime import date, timedelta
+
+import pytest
+
+import order_journal
+from fakes import FakeBroker
+from order_engine import execute_orders, settle_earlier_orders
+from order_journal import OrderJournal, APPLIED, FILLED
+
+
+def market_order(token, quantity):
+    return {'exchange': 'NSE_EQ', 'token': token, 'transaction_type': 'BUY', 'product': 'MTF', 'variety': 'RL-MKT',
+            'quantity': quantity, 'price': 0.0, 'trigger_price': 0.0, 'disclosed_quantity': 0, 'validity': 'DAY'}
+
+
+def place(client, order_details):
+    return client.place_order(**order_details)
+
+
+def write_records(path, *records):
+    with open(path, 'w') as journal_file:
+        for record in records:
+            journal_file.write(json.dumps(record) + "\n")
+
+
+def days_ago(days):
+    return (date.today() - timedelta(days=days)).isoformat()
+
+
+def test_replay_compacts_finished_and_expired_entries(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    write_records(path,
+                  {'k': 'applied', 's': 'intent', 'd': days_ago(1), 'tok': 1, 'q': 1}, {'k': 'applied', 's': 'applied'},
+                  {'k': 'failed', 's': 'intent', 'd': days_ago(1), 'tok': 2, 'q': 1}, {'k': 'failed', 's': 'failed'},
+                  {'k': 'filled', 's': 'intent', 'd': days_ago(2), 'tok': 3, 'q': 1},
+                  {'k': 'filled', 's': 'placed', 'id': 'X1'}, {'k': 'filled', 's': 'filled', 'p': '10.5'},
+                  {'k': 'expired', 's': 'intent', 'd': days_ago(order_journal.JOURNAL_RETENTION_DAYS + 1), 'tok': 4, 'q': 1},
+                  {'k': 'today', 's': 'intent', 'd': days_ago(0), 'tok': 5, 'q': 1}, {'k': 'today', 's': 'failed'})
+    with OrderJournal(path) as journal:
+        assert set(journal.entries) == {'filled', 'today'}
+    with open(path) as journal_file:
+        assert {json.loads(line)['k'] for line in journal_file} == {'filled', 'today'}
+
+
+def test_failed_fsync_does_not_count_as_synced(tmp_path, monkeypatch):
+    journal = OrderJournal(str(tmp_path / 'journal.jsonl'))
+    real_fsync = os.fsync
+    monkeypatch.setattr(order_journal.os, 'fsync', lambda fd: (_ for _ in ()).throw(OSError('disk full')))
+    with pytest.raises(OSError):
+        journal.record_intent('a', market_order(1, 1))
+    assert journal._synced == 0
+
+    monkeypatch.setattr(order_journal.os, 'fsync', real_fsync)
+    journal.record_placed('a', 'X1')
+    assert journal._synced == 2
+    journal.close()
+    with OrderJournal(journal.path) as reopened:
+        assert reopened.get('a')['order_id'] == 'X1'
+
+
+def test_fill_not_applied_on_an_earlier_day_is_applied_later(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    old_key = f"default_buy:{days_ago(1)}:SBIN"
+    write_records(path, {'k': old_key, 's': 'intent', 'd': days_ago(1), 'tok': 1, 'q': 5},
+                  {'k': old_key, 's': 'placed', 'id': 'OLD1'}, {'k': old_key, 's': 'filled', 'p': '101.25'})
+    broker = FakeBroker(prices={1: 99.0})
+    applied = []
+
+    def on_fills(fills):
+        applied.extend((context, str(order['average_price'])) for context, _, order in fills)
+
+    with OrderJournal(path) as journal:
+        assert settle_earlier_orders(broker, journal, 'default_buy:', lambda key: 'SBIN', on_fills) == ['OLD1']
+        placed = execute_orders(broker, [('SBIN', market_order(1, 5))], place, on_fills, journal=journal,
+                                order_key=lambda context: f"default_buy:{days_ago(0)}:{context}")
+        assert journal.get(old_key)['state'] == APPLIED
+        assert journal.get(f"default_buy:{days_ago(0)}:SBIN")['state'] == APPLIED
+    # The old fill is applied and today's buy is still placed
+    assert applied == [('SBIN', '101.25'), ('SBIN', '99.0')]
+    assert [order['order_id'] for order in broker.placed_orders()] == placed
+
+
+def test_unconfirmed_intent_never_claims_an_unjournaled_order(tmp_path):
+    broker = FakeBroker(prices={1: 99.0, 2: 50.0})
+    manual = broker.place_order(**market_order(1, 5))['data']['orderId']
+    path = str(tmp_path / 'journal.jsonl')
+    write_records(path, {'k': 'default_buy:SBIN', 's': 'intent', 'd': days_ago(0), 'tok': 1, 'q': 5},
+                  {'k': 'default_buy:INFY', 's': 'intent', 'd': days_ago(0), 'tok': 2, 'q': 5})
+    with OrderJournal(path) as journal:
+        placed = execute_orders(broker, [('SBIN', market_order(1, 5)), ('INFY', market_order(2, 5))], place,
+                                lambda fills: [], journal=journal, order_key=lambda context: f"default_buy:{context}")
+        assert manual not in placed and manual not in journal.order_ids()
+        assert journal.get('default_buy:SBIN')['state'] != FILLED
+        # Nothing in the book could be the INFY order, so it is sent
+        assert journal.get('default_buy:INFY')['state'] == APPLIED
+    assert len(broker.placed_orders()) == 2
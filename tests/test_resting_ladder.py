@@ -0,0 +1,112 @@
+# RestingLadder against the in-memory FakeBroker: only journaled orders are touched, and every traded
+# quantity reaches BaseValue exactly once.
+
+import pytest
+
+from fakes import FakeBroker
+from order_journal import OrderJournal
+from resting_ladder import RestingLadder
+
+
+def limit_order(token, quantity, price):
+    return {'exchange': 'NSE_EQ', 'token': token, 'transaction_type': 'BUY', 'product': 'MTF', 'variety': 'RL',
+            'quantity': quantity, 'price': float(price), 'trigger_price': 0.0, 'disclosed_quantity': 0,
+            'validity': 'DAY'}
+
+
+def ladders(*entries):
+    """(name, token, additional quantity, base value) -> RestingLadder.sync input."""
+    return [((name, base_value), token, quantity, base_value) for name, token, quantity, base_value in entries]
+
+
+class Applied:
+    """on_fills that records (instrument, order ID, average price) and can be told to fail."""
+
+    def __init__(self):
+        self.fills = []
+        self.fail = False
+
+    def __call__(self, fills):
+        self.fills.extend((context[0], order_id, order['average_price']) for context, order_id, order in fills)
+        return [order_id for _, order_id, _ in fills] if self.fail else []
+
+
+@pytest.fixture
+def setup(tmp_path):
+    broker = FakeBroker(prices={1: 105.0, 2: 210.0})
+    applied = Applied()
+    journal = OrderJournal(str(tmp_path / 'journal.jsonl'))
+    yield broker, applied, journal, RestingLadder(broker, limit_order, applied, journal)
+    journal.close()
+
+
+def open_orders(broker):
+    return {order['order_id']: order for order in broker.orders(limit=500)['orders'] if order['status'] == 'OPEN'}
+
+
+def test_places_ladder_and_is_idle_when_nothing_changed(setup):
+    broker, _, _, ladder = setup
+    assert ladder.sync(ladders(('A', 1, 2, 100.0)))['placed'] == 3
+    assert sorted(order['price'] for order in open_orders(broker).values()) == [97.0, 98.0, 99.0]
+    broker.reset_calls()
+    assert ladder.sync(ladders(('A', 1, 2, 100.0))) == {'unfunded': 0, 'unchanged': 3}
+    assert dict(broker.calls) == {'orders': 1}
+
+
+def test_manual_orders_are_never_touched(setup):
+    broker, _, _, ladder = setup
+    manual = [broker.place_order(**limit_order(token, 5, price))['data']['orderId']
+              for token, price in ((1, 90.0), (2, 180.0))]
+    ladder.sync(ladders(('A', 1, 2, 100.0), ('B', 2, 1, 200.0)))
+    ladder.sync(ladders(('A', 1, 2, 102.0)))  # B drops out and A's ladder moves
+    orders = open_orders(broker)
+    assert all(orders[order_id]['quantity'] == 5 for order_id in manual)
+    assert orders[manual[0]]['price'] == 90.0 and orders[manual[1]]['price'] == 180.0
+    assert sorted(order['price'] for order in orders.values() if order['token'] == 2) == [180.0]
+
+
+def test_fill_moves_base_value_once(setup, tmp_path):
+    broker, applied, _, ladder = setup
+    ladder.sync(ladders(('A', 1, 2, 100.0)))
+    broker.prices[1] = 97.5  # Through the 99 and 98 levels
+    stats = ladder.sync(ladders(('A', 1, 2, 100.0)))
+    assert stats['filled'] == 2 and [(name, price) for name, _, price in applied.fills] == [('A', 97.5)]
+    # The ladder hangs from the new BaseValue; a second ladder on the same journal applies nothing again
+    assert sorted(order['price'] for order in open_orders(broker).values()) == [94.55, 95.55, 96.5]
+    again = RestingLadder(broker, limit_order, applied, OrderJournal(str(tmp_path / 'journal.jsonl')))
+    again.sync(ladders(('A', 1, 2, 97.5)))
+    assert len(applied.fills) == 1
+
+
+def test_unapplied_fill_holds_the_ladder(setup):
+    broker, applied, _, ladder = setup
+    ladder.sync(ladders(('A', 1, 1, 100.0)))
+    broker.prices[1] = 98.5
+    applied.fail = True
+    assert ladder.sync(ladders(('A', 1, 1, 100.0))).get('placed', 0) == 0
+    applied.fail = False
+    assert ladder.sync(ladders(('A', 1, 1, 100.0)))['filled'] == 1
+    assert len(applied.fills) == 2
+
+
+def test_part_fill_is_applied_when_the_order_ends(setup):
+    broker, applied, _, ladder = setup
+    ladder.sync(ladders(('A', 1, 4, 100.0)))
+    top = max(open_orders(broker).values(), key=lambda order: order['price'])
+    broker.fill(top['order_id'], 1, 99.0)
+    ladder.sync(ladders(('A', 1, 4, 100.0)))
+    assert applied.fills == []  # Still open: more of it may trade
+    broker.cancel_order(top['order_id'])  # E.g. expired at the close
+    ladder.sync(ladders(('A', 1, 4, 100.0)))
+    assert applied.fills == [('A', top['order_id'], 99.0)]
+
+
+def test_settle_applies_part_fills_of_open_orders(setup):
+    broker, applied, _, ladder = setup
+    ladder.sync(ladders(('A', 1, 4, 100.0)))
+    top = max(open_orders(broker).values(), key=lambda order: order['price'])
+    broker.fill(top['order_id'], 2, 98.95)
+    broker.reset_calls()
+    ladder.sync(ladders(('A', 1, 4, 100.0)), settle_only=True)
+    assert applied.fills == [('A', top['order_id'], 98.95)]
+    assert set(broker.calls) == {'orders'}
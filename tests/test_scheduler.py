@@ -0,0 +1,36 @@
+# The scheduler runs a job whose time passed while another job was running late, within the catch-up window.
+
+import time
+import threading
+from datetime import datetime, timedelta
+
+import scheduler
+
+
+def _jobs(t0, ran, stop, specs):
+    """specs: (name, seconds after t0, seconds the job runs, stops the scheduler)."""
+    def runner(name, duration, stops):
+        def run():
+            ran.append(name)
+            time.sleep(duration)
+            if stops:
+                stop.set()
+        return run
+    return [{'name': name, 'times': [(t0 + timedelta(seconds=offset)).time()], 'run': runner(name, duration, stops)}
+            for name, offset, duration, stops in specs]
+
+
+def test_overdue_job_runs_late(monkeypatch):
+    monkeypatch.setattr(scheduler, 'is_trading_day', lambda day, holidays: True)
+    t0, ran, stop = datetime.now(scheduler.IST), [], threading.Event()
+    jobs = _jobs(t0, ran, stop, [('eligibility', 1, 2, False), ('default_buy', 2, 0, True)])
+    scheduler.run_forever(jobs, stop, holidays=set(), since=t0)
+    assert ran == ['eligibility', 'default_buy']
+
+
+def test_job_beyond_catch_up_window_is_skipped(monkeypatch):
+    monkeypatch.setattr(scheduler, 'is_trading_day', lambda day, holidays: True)
+    t0, ran, stop = datetime.now(scheduler.IST), [], threading.Event()
+    jobs = _jobs(t0, ran, stop, [('eligibility', 1, 2, False), ('default_buy', 1.5, 0, False), ('price_drop', 4, 0, True)])
+    scheduler.run_forever(jobs, stop, holidays=set(), since=t0, catch_up=timedelta(seconds=0.5))
+    assert ran == ['eligibility', 'price_drop']
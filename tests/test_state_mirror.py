@@ -0,0 +1,43 @@
+# StockMirror sync: incremental syncs read only the changed items through the ModifiedAt index.
+
+import stock_index
+from fakes import FakeStockTable
+from state_mirror import StockMirror, modified_at
+
+
+def row(name, status, stamp):
+    return {'InstrumentName': {'S': name}, 'Eligibility': {'S': 'Eligible'}, 'EligibilityStatus': {'S': status},
+            'AdditionalQuantity': {'N': '1'}, 'ModifiedAt': {'N': str(stamp)}}
+
+
+def seeded_table(size=50):
+    table = FakeStockTable()
+    old = modified_at() - 24 * 60 * 60 * 1000
+    for number in range(size):
+        table.put(row(f"STOCK{number:03d}", 'Eligible' if number % 2 else 'Ineligible', old))
+    return table
+
+
+def test_incremental_sync_queries_the_changed_items_only():
+    table = seeded_table()
+    stock_index.migrate(table)
+    mirror = StockMirror(':memory:', table)
+    assert mirror.sync() == 50
+
+    table.reset_calls()
+    table.put(row('STOCK000', 'Eligible', modified_at()))  # Flipped from Ineligible
+    assert mirror.sync(max_age=0) == 1
+    assert table.calls['scan'] == 0
+    assert mirror.get('STOCK000')['EligibilityStatus'] == {'S': 'Eligible'}
+    mirror.close()
+
+
+def test_sync_without_the_index_reads_the_whole_table():
+    table = seeded_table()
+    mirror = StockMirror(':memory:', table)
+    mirror.sync()
+
+    table.put(row('STOCK001', 'Ineligible', modified_at()))
+    assert mirror.sync(max_age=0) == 50
+    assert mirror.get('STOCK001')['EligibilityStatus'] == {'S': 'Ineligible'}
+    mirror.close()
@@ -0,0 +1,29 @@
+# Index-backed candidate lookup: rows are found from their AdditionalQuantity alone, however it was written.
+
+import pytest
+
+import stock_index
+from fakes import FakeStockTable
+
+
+def row(name, status, additional_quantity):
+    return {'InstrumentName': {'S': name}, 'Eligibility': {'S': 'Eligible'}, 'EligibilityStatus': {'S': status},
+            'Token': {'N': '1'}, 'BaseValue': {'N': '100'}, 'AdditionalQuantity': {'N': str(additional_quantity)}}
+
+
+@pytest.mark.parametrize('indexed', [True, False])
+def test_candidates_follow_hand_edited_additional_quantity(indexed):
+    table = FakeStockTable()
+    for item in (row('SBIN', 'Eligible', 0), row('INFY', 'Eligible', 3), row('TCS', 'Ineligible', 5)):
+        table.put(item)
+    stock_index._missing_indexes.clear()
+    if indexed:
+        stock_index.migrate(table)
+
+    assert [item['InstrumentName']['S'] for item in stock_index.fetch_additional_candidates(table)] == ['INFY']
+
+    # A console edit only touches AdditionalQuantity
+    table.put(row('SBIN', 'Eligible', 2))
+    assert sorted(item['InstrumentName']['S'] for item in stock_index.fetch_additional_candidates(table)) == ['INFY', 'SBIN']
+    if indexed:
+        assert table.calls['scan'] == 0
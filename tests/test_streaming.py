@@ -0,0 +1,116 @@
+# PriceDropStream workers: every fired instrument is re-armed or released, and late fills still move
+# BaseValue through the journal.
+
+import time
+
+import pytest
+
+from fakes import FakeBroker
+from order_journal import OrderJournal, APPLIED
+from streaming import PriceDropStream
+
+
+def market_order(token, quantity):
+    return {'exchange': 'NSE_EQ', 'token': token, 'transaction_type': 'BUY', 'product': 'MTF', 'variety': 'RL-MKT',
+            'quantity': quantity, 'price': 0.0, 'trigger_price': 0.0, 'disclosed_quantity': 0, 'validity': 'DAY'}
+
+
+def place(client, order_details):
+    return client.place_order(**order_details)
+
+
+def tick(token, price):
+    return [{'token': token, 'last_trade_price': price}]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = OrderJournal(str(tmp_path / 'journal.jsonl'))
+    yield journal
+    journal.close()
+
+
+def stream_for(broker, journal, on_fill, **kwargs):
+    stream = PriceDropStream(broker, market_order, place, on_fill, available_funds=10000.0, journal=journal,
+                             order_key=lambda context: f"price_drop:{context[0]}:{context[1]:.2f}", **kwargs)
+    stream.arm('SBIN', 1, 10, 100.0)
+    return stream
+
+
+def test_late_fill_moves_base_value(journal):
+    broker = FakeBroker(prices={1: 97.0}, fill_delay=0.4)
+    applied = []
+    stream = stream_for(broker, journal, lambda instrument, price: applied.append((instrument, price)) or True,
+                        fill_timeout=0.1, recheck_seconds=0.2)
+    stream.on_price_update(None, tick(1, 97.0))
+
+    assert wait_for(lambda: 1 in stream.triggers)
+    assert applied == [('SBIN', 97.0)]
+    assert stream.triggers[1][3] == 97.0 and not stream.pending and not stream.in_flight
+    assert stream.available_funds == pytest.approx(10000.0 - broker.placed_orders()[0]['quantity'] * 97.0)
+    assert [entry['state'] for entry in journal.entries.values()] == [APPLIED]
+    stream.close()
+
+
+def test_failed_worker_releases_instrument_and_funds(journal):
+    broker = FakeBroker(prices={1: 97.0})
+
+    def broken_place(client, order_details):
+        raise RuntimeError('connection reset')
+
+    stream = PriceDropStream(broker, market_order, broken_place, lambda instrument, price: True,
+                             available_funds=10000.0, journal=journal,
+                             order_key=lambda context: f"price_drop:{context[0]}:{context[1]:.2f}")
+    stream.arm('SBIN', 1, 10, 100.0)
+    stream.on_price_update(None, tick(1, 97.0))
+
+    assert wait_for(lambda: 1 in stream.triggers)
+    assert stream.triggers[1][3] == 100.0 and not stream.in_flight
+    assert stream.available_funds == 10000.0
+    stream.close()
+
+
+def test_journaled_order_of_earlier_run_is_resolved(journal):
+    broker = FakeBroker(prices={1: 97.0})
+    order_id = broker.place_order(**market_order(1, 10))['data']['orderId']
+    key = 'price_drop:SBIN:100.00'
+    journal.record_intent(key, market_order(1, 10))
+    journal.record_placed(key, order_id)
+
+    applied = []
+    stream = stream_for(broker, journal, lambda instrument, price: applied.append((instrument, price)) or True)
+    stream.on_price_update(None, tick(1, 97.0))
+
+    assert wait_for(lambda: 1 in stream.triggers)
+    assert applied == [('SBIN', 97.0)] and len(broker.placed_orders()) == 1
+    assert stream.triggers[1][3] == 97.0
+    assert journal.get(key)['state'] == APPLIED
+    stream.close()
+
+
+def test_part_fill_of_a_cancelled_order_moves_base_value(journal):
+    broker = FakeBroker(prices={1: 97.0})
+    resting = dict(market_order(1, 10), variety='RL', price=90.0)
+    order_id = broker.place_order(**resting)['data']['orderId']
+    broker.fill(order_id, 4, 96.5)
+    broker.cancel_order(order_id)
+    key = 'price_drop:SBIN:100.00'
+    journal.record_intent(key, resting)
+    journal.record_placed(key, order_id)
+
+    applied = []
+    stream = stream_for(broker, journal, lambda instrument, price: applied.append((instrument, price)) or True)
+    stream.on_price_update(None, tick(1, 97.0))
+
+    assert wait_for(lambda: 1 in stream.triggers)
+    assert [(instrument, float(price)) for instrument, price in applied] == [('SBIN', 96.5)]
+    assert stream.triggers[1][3] == 96.5
+    assert journal.get(key)['state'] == APPLIED
+    stream.close()